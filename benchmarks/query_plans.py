@@ -0,0 +1,146 @@
+"""
+query_plans.py: Query plans of the hot content queries
+
+Builds the content schema from the migrations in a throwaway PostgreSQL
+schema, fills it with generated content, and prints the plans and timings of
+the queries issued by the embedded backend before and after the index
+migrations are applied. Queries of tables and columns added by the index
+migrations are not available before them.
+
+Requires psycopg2. Usage::
+
+    python benchmarks/query_plans.py "dbname=librarian user=postgres" [ROWS]
+"""
+
+import glob
+import imp
+import os
+import sys
+
+import psycopg2
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MIGRATIONS_DIR = os.path.join(os.path.dirname(HERE), 'librarian_content',
+                              'migrations', 'content')
+# migrations adding indexes, and the tables and columns they index, which are
+# applied in order after the content table is filled, so none of their
+# indexes exist while the plans before them are captured
+INDEX_MIGRATIONS = (
+    '00_13_add_content_indexes',
+    '00_14_add_content_types_table',
+    '00_16_add_covering_listing_indexes',
+    '00_17_add_content_popularity',
+)
+SCHEMA = 'query_plans_benchmark'
+SEED = """
+insert into content (path, title, timestamp, updated, views, language,
+                     disabled, content_type, keywords)
+select md5(i::text),
+       'Title ' || i,
+       now() - (i %% 730) * interval '1 day',
+       now() - (i %% 730) * interval '1 day' - (i %% 97) * interval '1 minute',
+       (i * 7919) %% 1000,
+       (array['en', 'fr', 'es', 'ar', 'zh', 'ru'])[1 + i %% 6],
+       i %% 20 = 0,
+       (array[1, 2, 4, 8, 16, 32, 3])[1 + i %% 7],
+       ''
+from generate_series(1, %(rows)s) as i;
+"""
+ORDER = "date(timezone('UTC', updated)) DESC, views DESC"
+# app exclusion of mixed content listings, by the content type bitmask as
+# before ``content_types`` is added by 00_14, and by that table afterwards
+EXCLUDE_APPS = {
+    False: "(content_type & 16) = 0",
+    True: ("NOT EXISTS (SELECT 1 FROM content_types "
+           "WHERE content_types.path = content.path "
+           "AND (type & 16) != 0)"),
+}
+QUERIES = (
+    ('listing',
+     "SELECT * FROM content WHERE disabled = false "
+     "AND {exclude_apps} ORDER BY " + ORDER + " LIMIT 20"),
+    ('listing, second page',
+     "SELECT * FROM content WHERE disabled = false "
+     "AND {exclude_apps} ORDER BY " + ORDER + " LIMIT 20 OFFSET 20"),
+    ('language listing',
+     "SELECT * FROM content WHERE disabled = false AND language = 'fr' "
+     "AND {exclude_apps} ORDER BY " + ORDER + " LIMIT 20"),
+    ('content type count, bitmask',
+     "SELECT COUNT(*) AS count FROM content WHERE disabled = false "
+     "AND (content_type & 4) = 4"),
+    ('content type count, content_types',
+     "SELECT COUNT(*) AS count FROM content WHERE disabled = false "
+     "AND path IN (SELECT path FROM content_types WHERE type = 4)"),
+    ('content type listing',
+     "SELECT * FROM content WHERE disabled = false "
+     "AND path IN (SELECT path FROM content_types WHERE type = 4) "
+     "ORDER BY " + ORDER + " LIMIT 20"),
+    ('language count',
+     "SELECT COUNT(*) AS count FROM content WHERE disabled = false "
+     "AND language = 'fr'"),
+    ('popular listing',
+     "SELECT * FROM content WHERE disabled = false "
+     "AND {exclude_apps} ORDER BY popularity DESC LIMIT 20"),
+    ('last update',
+     "SELECT updated FROM content ORDER BY updated DESC LIMIT 1"),
+)
+
+
+def load_migrations():
+    migrations = []
+    for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, '*.py'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if name == '__init__':
+            continue
+        module = imp.load_source('migration_' + name, path)
+        migrations.append((name, getattr(module, 'SQL', None)))
+    return migrations
+
+
+def explain(cursor, migrated):
+    for (title, query) in QUERIES:
+        print('-- {0}'.format(title))
+        query = query.format(exclude_apps=EXCLUDE_APPS[migrated])
+        try:
+            cursor.execute('EXPLAIN ANALYZE ' + query)
+        except psycopg2.Error as exc:
+            # tables and columns added by the index migrations are missing
+            # before they are applied
+            print('   not available: {0}'.format(str(exc).strip()))
+            continue
+        for (line,) in cursor.fetchall():
+            print('   ' + line)
+
+
+def main():
+    dsn = sys.argv[1]
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute('DROP SCHEMA IF EXISTS {0} CASCADE'.format(SCHEMA))
+    cursor.execute('CREATE SCHEMA {0}'.format(SCHEMA))
+    cursor.execute('SET search_path TO {0}'.format(SCHEMA))
+    try:
+        migrations = load_migrations()
+        for (name, sql) in migrations:
+            if sql and name not in INDEX_MIGRATIONS:
+                cursor.execute(sql)
+        cursor.execute(SEED, dict(rows=rows))
+        cursor.execute('ANALYZE')
+        print('=== {0} rows, before index migrations ==='.format(rows))
+        explain(cursor, False)
+        for (name, sql) in migrations:
+            if name in INDEX_MIGRATIONS:
+                cursor.execute(sql)
+        cursor.execute('ANALYZE')
+        print('=== {0} rows, after index migrations ==='.format(rows))
+        explain(cursor, True)
+    finally:
+        cursor.execute('DROP SCHEMA {0} CASCADE'.format(SCHEMA))
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
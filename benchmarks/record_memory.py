@@ -0,0 +1,114 @@
+"""
+record_memory.py: Memory footprint of cached content rows
+
+Compares the number of bytes allocated per row by the former ``AttrDict``
+representation (a dict carrying its own attribute dict reference, plus the
+copy made by ``Meta``) against slot based records.
+
+Allocations are traced with ``tracemalloc`` where it is available. Python 2
+does not have it, so there the sizes of the objects making up a sample of
+the items are added up with ``sys.getsizeof`` instead, which leaves out
+allocator overhead.
+
+Usage::
+
+    python benchmarks/record_memory.py [ROWS]
+"""
+
+import datetime
+import gc
+import os
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    # python 2
+    tracemalloc = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from librarian_content.library.records import Record, to_record  # NOQA
+
+
+COLUMNS = ('path', 'title', 'timestamp', 'updated', 'favorite', 'views',
+           'is_partner', 'is_sponsored', 'publisher', 'license', 'language',
+           'size', 'broadcast', 'keywords', 'disabled', 'content_type',
+           'cover', 'thumbnail')
+# number of items measured with ``sys.getsizeof`` if tracemalloc is missing
+SAMPLE = 1000
+
+
+class AttrDict(dict):
+
+    def __init__(self, *args, **kwargs):
+        super(AttrDict, self).__init__(*args, **kwargs)
+        self.__dict__ = self
+
+
+def make_row(idx):
+    # key names are built at runtime, as a database driver would do for every
+    # fetched row
+    now = datetime.datetime(2015, 1, 1)
+    values = ('{0:032x}'.format(idx), 'Title {0}'.format(idx), now, now,
+              False, idx, False, False, 'Publisher', 'GPL', 'en', 1024, None,
+              'some keywords', False, 1, None, None)
+    return dict((''.join(list(key)), value)
+                for (key, value) in zip(COLUMNS, values))
+
+
+def attrdict_row(row):
+    # AttrDict built by the backend, then copied once more by ``Meta``
+    data = AttrDict((key, row[key]) for key in row.keys())
+    return (data, dict((key, data[key]) for key in data.keys()))
+
+
+def record_row(row):
+    return to_record(row, 'content')
+
+
+def object_size(obj):
+    # the values and key strings are shared with the source row, so only the
+    # containers allocated for the item are counted
+    size = sys.getsizeof(obj)
+    if isinstance(obj, tuple):
+        size += sum(object_size(item) for item in obj)
+    elif isinstance(obj, Record):
+        extra = getattr(obj, '_extra', None)
+        if extra is not None:
+            size += sys.getsizeof(extra)
+    return size
+
+
+def measure(factory, rows):
+    source = [make_row(idx) for idx in range(rows)]
+    if tracemalloc is None:
+        items = [factory(row) for row in source[:SAMPLE]]
+        return sum(object_size(item) for item in items) / float(len(items))
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    items = [factory(row) for row in source]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del items
+    return (after - before) / float(rows)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    attrdict_bytes = measure(attrdict_row, rows)
+    record_bytes = measure(record_row, rows)
+    print('rows: {0}'.format(rows))
+    if tracemalloc is None:
+        print('tracemalloc is not available, sizes of {0} items are added up '
+              'with sys.getsizeof'.format(min(rows, SAMPLE)))
+    print('AttrDict + Meta copy: {0:8.1f} bytes/item'.format(attrdict_bytes))
+    print('slot record:          {0:8.1f} bytes/item'.format(record_bytes))
+    print('saved:                {0:8.1%}'.format(
+        1 - record_bytes / attrdict_bytes))
+
+
+if __name__ == '__main__':
+    main()
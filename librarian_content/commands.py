@@ -1,27 +1,159 @@
-from .library.archive import Archive
+import datetime
+import time
+
+from .library.checkpoint import Checkpoint, get_rate
+from .library.progress import Progress
+from .utils import get_archive
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return 'unknown'
+    return str(datetime.timedelta(seconds=int(seconds)))
+
+
+def print_progress(progress):
+    print('Processed {0} ({1} added, {2} failed, {3} skipped), '
+          '{4:.1f} items/s, ETA {5}'.format(progress.processed,
+                                            progress.added,
+                                            progress.failed,
+                                            progress.skipped,
+                                            progress.rate,
+                                            format_duration(progress.eta)))
+
+
+def print_summary(progress):
+    print_progress(progress)
+    print('Total time: {0}'.format(format_duration(progress.elapsed)))
+    for (stage, seconds) in progress.stages.items():
+        print('    {0:<12} {1:.1f}s'.format(stage + ':', seconds))
+
+
+def get_progress(archive, estimate=True):
+    # the current size of the library is the best guess of the amount of
+    # content a reload will process that is available without scanning
+    total = archive.get_count() if estimate else None
+    return Progress(total=total, callback=print_progress)
 
 
 def refill_db(arg, supervisor):
-    print('Begin content refill.')
-    config = supervisor.config
-    archive = Archive.setup(config['library.backend'],
-                            supervisor.exts.fsal,
-                            supervisor.exts.databases.content,
-                            contentdir=config['library.contentdir'],
-                            meta_filenames=config['library.metadata'])
-    archive.clear_and_reload()
+    archive = get_archive(supervisor)
+    if archive.is_resumable('refill'):
+        print('Resume interrupted content refill.')
+    else:
+        print('Begin content refill.')
+    progress = get_progress(archive)
+    archive.clear_and_reload(progress=progress)
     print('Content refill finished.')
+    print_summary(progress)
     raise supervisor.EarlyExit()
 
 
 def reload_db(arg, supervisor):
-    print('Begin content reload.')
-    config = supervisor.config
-    archive = Archive.setup(config['library.backend'],
-                            supervisor.exts.fsal,
-                            supervisor.exts.databases.content,
-                            contentdir=config['library.contentdir'],
-                            meta_filenames=config['library.metadata'])
-    archive.reload_content()
+    archive = get_archive(supervisor)
+    if archive.is_resumable('reload'):
+        print('Resume interrupted content reload.')
+    else:
+        print('Begin content reload.')
+    progress = get_progress(archive)
+    archive.reload_content(progress=progress)
     print('Content reload finished.')
+    print_summary(progress)
+    raise supervisor.EarlyExit()
+
+
+def attach_root(arg, supervisor):
+    print('Begin adding content of {0}.'.format(arg))
+    archive = get_archive(supervisor)
+    progress = get_progress(archive, estimate=False)
+    rows = archive.attach_root(arg, progress=progress)
+    print('Added {0} pieces of content.'.format(rows))
+    print_summary(progress)
+    raise supervisor.EarlyExit()
+
+
+def export_db(arg, supervisor):
+    print('Begin content export to {0}.'.format(arg))
+    archive = get_archive(supervisor)
+    start = time.time()
+    counts = archive.export_library(arg)
+    print('Exported {0} pieces of content in {1}.'.format(
+        counts.get('content', 0), format_duration(time.time() - start)))
+    raise supervisor.EarlyExit()
+
+
+def import_db(arg, supervisor):
+    print('Begin content import from {0}.'.format(arg))
+    archive = get_archive(supervisor)
+    start = time.time()
+    counts = archive.import_library(arg)
+    print('Imported {0} pieces of content in {1}.'.format(
+        counts.get('content', 0), format_duration(time.time() - start)))
+    print('Content is verified against the content directories in the '
+          'background after start.')
+    raise supervisor.EarlyExit()
+
+
+def detach_root(arg, supervisor):
+    print('Begin removing content of {0}.'.format(arg))
+    archive = get_archive(supervisor)
+    rows = archive.detach_root(arg)
+    print('Removed {0} pieces of content.'.format(rows))
+    raise supervisor.EarlyExit()
+
+
+def show_status(arg, supervisor):
+    path = supervisor.config.get('library.checkpoint')
+    state = Checkpoint(path).load() if path else None
+    if not state:
+        print('No content reload has been recorded.')
+        raise supervisor.EarlyExit()
+
+    if state['finished']:
+        status = 'finished'
+    else:
+        # the journal is not updated after an interruption, so a stale one
+        # may belong to a reload that is no longer running
+        status = 'in progress or interrupted'
+    started = datetime.datetime.fromtimestamp(state['started'])
+    updated = time.time() - state['tick']
+    print('Content {0} {1}.'.format(state['operation'], status))
+    print('Started:    {0:%Y-%m-%d %H:%M:%S}'.format(started))
+    print('Saved:      {0:.0f}s ago'.format(updated))
+    print('Processed:  {0} ({1} added)'.format(state['processed'],
+                                               state['added']))
+    print('Rate:       {0:.1f} items/s'.format(get_rate(state)))
+    print('Resumed:    {0} times'.format(state['resumed']))
+    for root in state['roots']:
+        position = state['positions'].get(root, '-')
+        print(u'Position:   {0}: {1}'.format(root, position))
+    raise supervisor.EarlyExit()
+
+
+# statistics kept in memory by the running server, which this process cannot
+# read, while ``utils.get_library_stats()`` returns them within the server
+IN_PROCESS_STATS = ('Cache hit ratios', 'Slowest queries', 'Ingest lag')
+
+
+def show_stats(arg, supervisor):
+    stats = get_archive(supervisor).get_library_stats()
+    print('Rows:')
+    for (table, count) in sorted(stats['tables'].items()):
+        orphans = stats['orphans'].get(table)
+        note = ' ({0} orphaned)'.format(orphans) if orphans else ''
+        print('    {0:<18} {1}{2}'.format(table + ':', count, note))
+    print('Unverified: {0}'.format(stats['unverified']))
+    reload_stats = stats['reload']
+    if reload_stats:
+        status = 'finished' if reload_stats['finished'] else 'unfinished'
+        print('Last {0}: {1}, {2} processed in {3}, {4:.1f} items/s'.format(
+            reload_stats['operation'],
+            status,
+            reload_stats['processed'],
+            format_duration(reload_stats['duration']),
+            reload_stats['rate']))
+    else:
+        print('Last reload: unknown')
+    for name in IN_PROCESS_STATS:
+        print('{0}: unavailable (in-process only)'.format(name))
     raise supervisor.EarlyExit()
@@ -1,13 +1,17 @@
 from fsal.client import FSAL
 
-from .commands import refill_db, reload_db
-from .tasks import check_new_content
-from .utils import ensure_dir
+from .commands import (attach_root, detach_root, export_db, import_db,
+                       refill_db, reload_db, show_stats, show_status)
+from .tasks import (DECAY_INTERVAL, VERIFY_DELAY, check_new_content,
+                    decay_popularity, verify_content)
+from .utils import ensure_dir, get_content_roots, get_scheduler
 
 
 def initialize(supervisor):
-    ensure_dir(supervisor.config['library.contentdir'])
+    # only the primary root is created, others may be on removable devices
+    ensure_dir(get_content_roots(supervisor.config)[0])
     supervisor.exts.fsal = FSAL(supervisor.config['fsal.socket'])
+    supervisor.exts.content_check = get_scheduler(supervisor.config)
     supervisor.exts.commands.register(
         'refill',
         refill_db,
@@ -22,6 +26,48 @@ def initialize(supervisor):
         action='store_true',
         help="Reload zipballs into database without clearing it previously."
     )
+    supervisor.exts.commands.register(
+        'attach',
+        attach_root,
+        '--attach',
+        metavar='PATH',
+        help="Add content found in the specified content root to database."
+    )
+    supervisor.exts.commands.register(
+        'detach',
+        detach_root,
+        '--detach',
+        metavar='PATH',
+        help="Remove content of the specified content root from database."
+    )
+    supervisor.exts.commands.register(
+        'export',
+        export_db,
+        '--export',
+        metavar='PATH',
+        help="Export the library into a file it can be imported from."
+    )
+    supervisor.exts.commands.register(
+        'import',
+        import_db,
+        '--import',
+        metavar='PATH',
+        help="Replace the library with the contents of an export file."
+    )
+    supervisor.exts.commands.register(
+        'status',
+        show_status,
+        '--status',
+        action='store_true',
+        help="Show progress of the last content reload or refill."
+    )
+    supervisor.exts.commands.register(
+        'stats',
+        show_stats,
+        '--stats',
+        action='store_true',
+        help="Show row counts, cache and query statistics of the library."
+    )
 
 
 def post_start(supervisor):
@@ -29,3 +75,9 @@ def post_start(supervisor):
     supervisor.exts.tasks.schedule(check_new_content,
                                    args=(supervisor, refresh_rate),
                                    delay=refresh_rate)
+    supervisor.exts.tasks.schedule(verify_content,
+                                   args=(supervisor,),
+                                   delay=VERIFY_DELAY)
+    supervisor.exts.tasks.schedule(decay_popularity,
+                                   args=(supervisor,),
+                                   delay=DECAY_INTERVAL)
@@ -1,4 +1,4 @@
-import gen0
+from . import gen0
 
 
 IDENTIFIERS = (
@@ -8,15 +8,90 @@ This software is free software licensed under the terms of GPLv3. See COPYING
 file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
 """
 
+import collections
 import logging
 import os
+import threading
 
-from librarian_core.utils import utcnow
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from librarian_core.utils import is_string, utcnow
 
 from . import metadata
+from .checkpoint import Checkpoint, get_rate
+from .progress import Progress
+from .sidecar import SidecarCache
+from .suggest import SUGGEST_LIMIT
+from .throttle import get_throttle
 from .utils import to_list
 
 
+# marks the end of the results of a scanning worker
+SCAN_DONE = object()
+# default number of content items processed between checkpoint saves
+CHECKPOINT_INTERVAL = 100
+# number of days in which popularity scores of content are halved
+POPULARITY_HALF_LIFE = 7
+# maximum number of found content paths waiting to be added, so scanning
+# workers do not run ahead of adding on large libraries
+SCAN_BUFFER = 1000
+# seconds between checks of scanning workers waiting for room in the buffer
+# whether the results are still consumed
+SCAN_POLL_INTERVAL = 0.5
+
+
+def split_path(relpath):
+    # tuples of path components compare in the order ``os.walk`` visits
+    # directories when their names are sorted
+    return tuple(relpath.split(os.sep))
+
+
+def group_by_device(roots):
+    """Return ordered dict of device ids mapped to the list of content roots
+    found on them. Roots that do not exist (e.g. unmounted) are left out."""
+    devices = collections.OrderedDict()
+    for root in roots:
+        try:
+            device = os.stat(root).st_dev
+        except OSError:
+            logging.warning(u"Content root '{0}' is not accessible, "
+                            u"skipping it.".format(root))
+            continue
+        devices.setdefault(device, []).append(root)
+    return devices
+
+
+def get_dir_size(path):
+    """Return total size in bytes of the files found within ``path``."""
+    size = 0
+    for (dirpath, dirnames, filenames) in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return size
+
+
+def count_facets(records):
+    """Return number of content items per language and content type name,
+    as ``{'language': {...}, 'content_type': {...}}``."""
+    languages = {}
+    types = {}
+    for record in records:
+        language = record.get('language')
+        if language:
+            languages[language] = languages.get(language, 0) + 1
+        mask = record.get('content_type') or 0
+        for (name, type_id) in metadata.CONTENT_TYPES.items():
+            if mask & type_id == type_id:
+                types[name] = types.get(name, 0) + 1
+    return dict(language=languages, content_type=types)
+
+
 class Archive(object):
 
     def __init__(self, backend):
@@ -78,6 +153,16 @@ class BaseArchive(object):
     prefetchable_types = (
         'app',
     )
+    # whether interrupted reloads may be resumed, which requires the content
+    # added before the interruption to be stored durably
+    resumable_reloads = True
+    # named sets of fields that can be passed as ``fields`` to
+    # ``get_content``, ``list`` holds the fields rendered by content lists,
+    # which are covered by the listing indexes
+    projections = {
+        'list': ('path', 'title', 'thumbnail', 'language', 'content_type',
+                 'updated', 'views'),
+    }
 
     def __init__(self, fsal, **config):
         self.fsal = fsal
@@ -89,19 +174,41 @@ class BaseArchive(object):
 
         self.__initialized = True
 
+    @classmethod
+    def get_read_pool(cls, db, size=None):
+        """Return pool of ``size`` connections reading from the database of
+        ``db``, to be passed to the backend as its ``read_pool`` option, or
+        ``None`` if the backend does not read through one. Backends reading
+        from a database provide their own default size."""
+        return None
+
+    def get_fields(self, fields):
+        """Return tuple of field names specified by ``fields``, which is
+        either the name of a projection or an iterable of field names, or
+        ``None`` if all fields are to be fetched. ``path`` is always
+        included."""
+        if fields is None:
+            return None
+        if is_string(fields):
+            fields = self.projections[fields]
+        fields = tuple(fields)
+        if 'path' not in fields:
+            fields = ('path',) + fields
+        return fields
+
     def get_count(self, terms=None, tag=None, lang=None, content_type=None):
         """Return the number of matching content metadata filtered by the given
         options.
         Implementation is backend specific.
 
         :param terms:         string: search query
-        :param tag:           list of string tags
+        :param tag:           int: tag id
         :param lang:          string: language code
         :param content_type:  int: content type id"""
         raise NotImplementedError()
 
     def get_content(self, terms=None, offset=0, limit=0, tag=None, lang=None,
-                    content_type=None):
+                    content_type=None, fields=None, order=None):
         """Return iterable of matching content metadata filtered by the given
         options.
         Implementation is backend specific.
@@ -109,9 +216,72 @@ class BaseArchive(object):
         :param terms:         string: search query
         :param offset:        int: start index
         :param limit:         int: max number of items to be returned
-        :param tag:           list of string tags
+        :param tag:           int: tag id
         :param lang:          string: language code
-        :param content_type:  int: content type id"""
+        :param content_type:  int: content type id
+        :param fields:        name of a projection (e.g. ``'list'``) or list
+                              of fields to be fetched (defaults to all)
+        :param order:         ``'latest'`` (default) or ``'popular'``, which
+                              orders by views decayed over time"""
+        raise NotImplementedError()
+
+    def get_content_page(self, terms=None, offset=0, limit=0, tag=None,
+                         lang=None, content_type=None, facets=False,
+                         fields=None, order=None):
+        """Return a page of matching content metadata together with the
+        total number of matches, and optionally the facet counts, so listings
+        need a single call. Backends may override it to get all of it from a
+        single query.
+
+        :param terms:         string: search query
+        :param offset:        int: start index
+        :param limit:         int: max number of items to be returned
+        :param tag:           int: tag id
+        :param lang:          string: language code
+        :param content_type:  int: content type id
+        :param facets:        bool: whether to count matches per language and
+                              content type
+        :param fields:        name of a projection or list of fields to be
+                              fetched (defaults to all)
+        :param order:         ``'latest'`` (default) or ``'popular'``
+        :returns:             dict with ``rows``, ``total`` and ``facets``
+                              (``None`` unless requested) keys"""
+        rows = self.get_content(terms=terms, offset=offset, limit=limit,
+                                tag=tag, lang=lang, content_type=content_type,
+                                fields=fields, order=order)
+        total = self.get_count(terms=terms, tag=tag, lang=lang,
+                               content_type=content_type)
+        counts = None
+        if facets:
+            counts = count_facets(self.iter_content(terms=terms,
+                                                    lang=lang,
+                                                    content_type=content_type,
+                                                    tag=tag))
+        return dict(rows=rows or [], total=total, facets=counts)
+
+    def iter_content(self, terms=None, lang=None, content_type=None,
+                     tag=None, fetch_size=None):
+        """Return a generator yielding matching content metadata filtered by
+        the given options, fetched lazily in batches so the whole library is
+        never held in memory at once.
+        Implementation is backend specific.
+
+        :param terms:         string: search query
+        :param lang:          string: language code
+        :param content_type:  int: content type id
+        :param tag:           int: tag id
+        :param fetch_size:    int: number of rows fetched per batch"""
+        raise NotImplementedError()
+
+    def suggest(self, prefix, limit=SUGGEST_LIMIT, lang=None):
+        """Return list of up to ``limit`` titles and publishers of enabled
+        content with a word starting with ``prefix``, for suggesting search
+        terms while they are typed.
+        Implementation is backend specific.
+
+        :param prefix:  string: typed in part of the search terms
+        :param limit:   int: max number of suggestions
+        :param lang:    string: language code"""
         raise NotImplementedError()
 
     def get_single(self, relpath):
@@ -197,6 +367,7 @@ class BaseArchive(object):
 
         :param relpath:  Relative path of content which is about to be deleted
         :returns:        bool: indicating success of deletion"""
+        self._throttle_io()
         try:
             self.fsal.remove(relpath)
         except Exception as exc:
@@ -206,35 +377,142 @@ class BaseArchive(object):
         else:
             return True
 
-    def __add_auto_fields(self, meta, relpath):
-        # add auto-generated values to metadata before writing into db
+    @property
+    def sidecars(self):
+        """Cache of processed metadata, used if the ``sidecars`` option is
+        set. Sidecars are stored under ``sidecar_dir``, and are not used
+        unless it is specified."""
+        directory = self.config.get('sidecar_dir')
+        if not self.config.get('sidecars') or not directory:
+            return None
+        return SidecarCache(directory)
+
+    @property
+    def throttle(self):
+        """Limiter of the pace of content ingest, set up if either of the
+        ``ingest_rate`` (items per second) or ``ingest_io_rate`` (filesystem
+        and FSAL operations per second) options is positive. A rate of 0
+        means no limit, and ingest is not throttled at all, nor yields to
+        reads in progress, unless the other rate is set."""
+        rates = (self.config.get('ingest_rate'),
+                 self.config.get('ingest_io_rate'))
+        if not any(float(rate or 0) > 0 for rate in rates):
+            return None
+        return get_throttle(self.config.get('ingest_rate'),
+                            self.config.get('ingest_io_rate'))
+
+    def _throttle_item(self):
+        throttle = self.throttle
+        if throttle:
+            throttle.item()
+
+    def _throttle_io(self, count=1):
+        throttle = self.throttle
+        if throttle:
+            throttle.io_op(count)
+
+    def get_throttle_stats(self):
+        """Return dict of ingest throttling metrics, or ``None`` if ingest is
+        not throttled."""
+        throttle = self.throttle
+        return throttle and throttle.stats()
+
+    def get_table_counts(self):
+        """Return dict of table names mapped to their number of rows, which
+        may be estimated where counting them would require a full scan.
+        Implementation is backend specific."""
+        raise NotImplementedError()
+
+    def get_orphan_counts(self):
+        """Return dict of names of tables with content type and relation
+        data mapped to their number of rows that belong to no content.
+        Implementation is backend specific."""
+        raise NotImplementedError()
+
+    def get_unverified_count(self):
+        """Return number of content items whose content root is not known
+        yet, e.g. imported ones (see :py:meth:`verify_content`)."""
+        return 0
+
+    def get_reload_stats(self):
+        """Return dict describing the last content reload or refill recorded
+        in the checkpoint journal, or ``None`` if there is none."""
+        checkpoint = self.checkpoint
+        state = checkpoint and checkpoint.load()
+        if not state:
+            return None
+        return dict(operation=state['operation'],
+                    finished=state['finished'],
+                    started=state['started'],
+                    saved=state['tick'],
+                    duration=state['elapsed'],
+                    processed=state['processed'],
+                    added=state['added'],
+                    resumed=state['resumed'],
+                    rate=get_rate(state))
+
+    def get_library_stats(self):
+        """Return dict of health and performance statistics of the library.
+        Backends add the statistics of their caches and connections."""
+        return dict(tables=self.get_table_counts(),
+                    orphans=self.get_orphan_counts(),
+                    unverified=self.get_unverified_count(),
+                    reload=self.get_reload_stats(),
+                    throttle=self.get_throttle_stats())
+
+    def __add_auto_fields(self, meta, relpath, root):
+        # add auto-generated values to metadata before writing into db. the
+        # files are looked up in the root the content was found in, as FSAL
+        # resolves paths against its own base directory only
+        content_path = os.path.join(root, relpath)
         meta['path'] = relpath
         meta['updated'] = utcnow()
-        (success, dir_fso) = self.fsal.get_fso(relpath)
-        # TODO: should we raise in this case?
-        meta['size'] = dir_fso.size if success else 0
+        self._throttle_io()
+        meta['size'] = get_dir_size(content_path)
         meta['content_type'] = metadata.determine_content_type(meta)
         # if cover or thumb images do not exist, avoid later filesystem lookups
         # by not writing the default paths into the storage
         for key in ('cover', 'thumb'):
             filename = meta.get(key)
             if filename:
-                file_path = os.path.join(relpath, filename)
-                if not self.fsal.exists(file_path):
+                file_path = os.path.join(content_path, filename)
+                self._throttle_io()
+                if not os.path.exists(file_path):
                     meta.pop(key, None)
 
-    def __add_to_archive(self, relpath):
+    def __is_shadowed(self, relpath, root):
+        # content paths are unique across roots, and files of content are
+        # looked up in the first root it is found in, so the same path in a
+        # later root cannot be served and must not replace the stored one
+        if len(self.content_roots) < 2:
+            return False
+        self._throttle_io()
+        owner = self.locate_content(relpath)
+        if owner is None or owner == root:
+            return False
+        logging.warning(u"Content '{0}' in '{1}' is skipped, as it is found "
+                        u"in '{2}' too.".format(relpath, root, owner))
+        return True
+
+    def __add_to_archive(self, relpath, root=None):
         logging.debug(u"Adding content '{0}' to archive.".format(relpath))
         meta_filenames = self.config['meta_filenames']
-        contentdir = self.config['contentdir']
+        root = root or self.get_content_root(relpath)
+        self._throttle_item()
+        if self.__is_shadowed(relpath, root):
+            return False
+        # reading of the metadata file
+        self._throttle_io()
         try:
-            meta = metadata.get_meta(contentdir, relpath, meta_filenames)
+            meta = metadata.get_meta(root, relpath, meta_filenames,
+                                     sidecars=self.sidecars)
         except metadata.ValidationError as exc:
             msg = u"Metadata of '{0}' is invalid: '{1}'".format(relpath, exc)
             logging.debug(msg)
             return False
         else:
-            self.__add_auto_fields(meta, relpath)
+            self.__add_auto_fields(meta, relpath, root)
+            meta['root'] = root
             return self.add_meta_to_db(meta)
 
     @to_list
@@ -246,11 +524,12 @@ class BaseArchive(object):
                           iterable: an iterable of content paths to be added
         :returns:         int: successfully added content count
         """
-        return sum([self.__add_to_archive(path) for path in relpaths])
+        return sum(self.__add_to_archive(path) for path in relpaths)
 
     def __remove_from_archive(self, relpath):
         msg = u"Removing content '{0}' from archive.".format(relpath)
         logging.debug(msg)
+        self._throttle_item()
         self.delete_content_files(relpath)
         return self.remove_meta_from_db(relpath)
 
@@ -263,14 +542,14 @@ class BaseArchive(object):
         :param relpaths:  string: a single content path to be removed
                           iterable: an iterable of content paths to be removed
         :returns:         int: successfully removed content count"""
-        return sum([self.__remove_from_archive(path) for path in relpaths])
+        return sum(self.__remove_from_archive(path) for path in relpaths)
 
     def find_content_dirs(self, relative=True):
         """Find all content directories within basedir"""
         meta_filenames = self.config['meta_filenames']
         query = ' '.join(meta_filenames)
         (dirs, files, is_match) = self.fsal.search(query, whole_words=True)
-        for fs_obj in files:
+        for fs_obj in sorted(files, key=lambda fs_obj: fs_obj.rel_path):
             # since search result paths all point to exact meta files,
             # ``dirname`` is used to return the parent folder
             if relative:
@@ -278,30 +557,301 @@ class BaseArchive(object):
             else:
                 yield os.path.dirname(fs_obj.path)
 
-    def reload_content(self):
-        """Reload all existing content from `contentdir` into database."""
-        return sum([self.__add_to_archive(path)
-                    for path in self.find_content_dirs()])
+    @property
+    def content_roots(self):
+        """List of content root directories. The ``contentdir`` option may
+        specify either a single directory or a list of them."""
+        contentdir = self.config['contentdir']
+        if is_string(contentdir):
+            return [contentdir]
+        return list(contentdir)
+
+    def get_content_root(self, relpath):
+        """Return the content root in which the specified content path is
+        found, defaulting to the first root."""
+        roots = self.content_roots
+        if len(roots) > 1:
+            return self.locate_content(relpath) or roots[0]
+        return roots[0]
+
+    def locate_content(self, relpath):
+        """Return the content root in which the specified content path is
+        found, or ``None`` if it is not found in any of them."""
+        for root in self.content_roots:
+            if os.path.exists(os.path.join(root, relpath)):
+                return root
+        return None
+
+    def scan_content_root(self, root, after=None):
+        """Find all content directories within a single content root, in a
+        deterministic order.
+
+        :param root:   path of the content root
+        :param after:  content path after which scanning is resumed
+        :returns:      generator of content paths relative to the root"""
+        meta_filenames = set(self.config['meta_filenames'])
+        after = split_path(after) if after else ()
+        for (dirpath, dirnames, filenames) in os.walk(root):
+            parts = () if dirpath == root else split_path(
+                os.path.relpath(dirpath, root))
+            # skip subtrees that were completely processed already
+            dirnames[:] = sorted(
+                name for name in dirnames
+                if parts + (name,) >= after[:len(parts) + 1])
+            if parts > after and meta_filenames.intersection(filenames):
+                yield os.path.join(*parts)
+
+    def scan_content_roots(self, roots=None, positions=None):
+        """Find all content directories within the specified content roots,
+        or all of them if not specified. Each device is scanned by its own
+        worker thread, scanning the roots found on it one after the other, so
+        a slow device does not hold back the scanning of the others.
+
+        :param roots:      iterable of content root paths
+        :param positions:  dict of roots mapped to content paths after which
+                           scanning of the root is resumed
+        :returns:          generator of ``(root, relpath)`` tuples, in the
+                           order they were found"""
+        positions = positions or {}
+        devices = list(group_by_device(roots or self.content_roots).values())
+        if len(devices) < 2:
+            for device_roots in devices:
+                for root in device_roots:
+                    for relpath in self.scan_content_root(root,
+                                                          positions.get(root)):
+                        yield (root, relpath)
+            return
+
+        results = queue.Queue(maxsize=SCAN_BUFFER)
+        # set when the results are no longer consumed, so workers waiting for
+        # room in the buffer give up instead of blocking forever
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=SCAN_POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def worker(device_roots):
+            try:
+                for root in device_roots:
+                    for relpath in self.scan_content_root(root,
+                                                          positions.get(root)):
+                        if not put((root, relpath)):
+                            return
+            except Exception:
+                logging.exception(u"Scanning of '{0}' failed.".format(
+                    u', '.join(device_roots)))
+            finally:
+                put(SCAN_DONE)
+
+        for device_roots in devices:
+            thread = threading.Thread(target=worker, args=(device_roots,))
+            thread.daemon = True
+            thread.start()
+
+        remaining = len(devices)
+        try:
+            while remaining:
+                item = results.get()
+                if item is SCAN_DONE:
+                    remaining -= 1
+                else:
+                    yield item
+        finally:
+            # the consumer stopped early, or failed, so workers are stopped
+            # and the buffer drained to release any of them waiting on it
+            stop.set()
+            while True:
+                try:
+                    results.get_nowait()
+                except queue.Empty:
+                    break
+
+    @property
+    def checkpoint(self):
+        """Journal of reload progress, if the ``checkpoint`` option specifies
+        the path of its file."""
+        path = self.config.get('checkpoint')
+        return Checkpoint(path) if path else None
+
+    def is_resumable(self, operation):
+        """Whether an interrupted ``operation`` over all content roots can be
+        resumed from its checkpoint."""
+        checkpoint = self.checkpoint
+        return bool(self.resumable_reloads and checkpoint and
+                    checkpoint.is_pending(operation, self.content_roots))
+
+    def _reload_content(self, operation, roots=None, progress=None):
+        """Add all content found in the roots, saving the progress to the
+        checkpoint journal in regular intervals if it is configured. An
+        interrupted run of the same ``operation`` over the same roots is
+        resumed where it stopped.
+
+        Content is added as it is found, so memory use does not depend on
+        the size of the library. Counts and stage timings are recorded in
+        ``progress``, if passed in."""
+        progress = progress or Progress()
+        checkpoint = self.checkpoint
+        if checkpoint is None:
+            state = None
+            found = self.scan_content_roots(roots)
+        else:
+            interval = int(self.config.get('checkpoint_interval',
+                                           CHECKPOINT_INTERVAL))
+            state = checkpoint.start(operation,
+                                     roots or self.content_roots,
+                                     resume=self.resumable_reloads)
+            if state['resumed']:
+                logging.info(u"Resuming %s after %s pieces of content",
+                             operation, state['processed'])
+                progress.skipped = state['processed']
+            found = self.scan_content_roots(state['roots'],
+                                            state['positions'])
+
+        added_count = 0
+        for (root, path) in progress.timed(found, 'scan'):
+            with progress.stage('add'):
+                added = self.__add_to_archive(path, root)
+            added_count += int(bool(added))
+            progress.update(added)
+            if state is not None:
+                checkpoint.advance(state, root, path, added)
+                if state['processed'] % interval == 0:
+                    with progress.stage('checkpoint'):
+                        checkpoint.save(state)
+        if state is None:
+            return added_count
+        with progress.stage('checkpoint'):
+            checkpoint.finish(state)
+        return state['added']
+
+    def reload_content(self, roots=None, progress=None):
+        """Reload all existing content from the content roots into database.
+
+        :param roots:     iterable of content roots to reload (defaults to all)
+        :param progress:  :py:class:`~.progress.Progress` to record counts
+                          and timings in
+        :returns:         int: successfully added content count"""
+        return self._reload_content('reload', roots, progress)
+
+    def attach_root(self, root, progress=None):
+        """Add all content found in the specified content root, e.g. after
+        the device it is on was plugged in. Its progress is journaled apart
+        from full reloads, so a pending one can still be resumed.
+
+        :param root:      path of the content root
+        :param progress:  :py:class:`~.progress.Progress` to record counts
+                          and timings in
+        :returns:         int: successfully added content count"""
+        return self._reload_content('attach', [root], progress)
+
+    def detach_root(self, root):
+        """Remove the metadata of all content found in the specified content
+        root from the database, without touching the files, e.g. after the
+        device it is on was unplugged.
+        Implementation is backend specific.
+
+        :param root:  path of the content root
+        :returns:     int: removed content count"""
+        raise NotImplementedError()
+
+    def export_library(self, path):
+        """Write all content metadata and taggings into an export file, from
+        which the library can be restored without processing the metadata
+        files again, e.g. on another device with a copy of the content.
+        Implementation is backend specific.
 
-    def clear_and_reload(self):
+        :param path:  path of the export file
+        :returns:     dict of table names mapped to exported row counts"""
+        raise NotImplementedError()
+
+    def import_library(self, path):
+        """Replace the library with the contents of an export file, in a
+        single transaction. Imported content is not checked against the
+        filesystem, that is done afterwards by :py:meth:`verify_content`.
+        Implementation is backend specific.
+
+        :param path:  path of the export file
+        :returns:     dict of table names mapped to imported row counts"""
+        raise NotImplementedError()
+
+    def verify_content(self, limit=None):
+        """Find the content roots of up to ``limit`` content items whose root
+        is not known, e.g. imported ones, removing those that are not found.
+
+        :returns:  int: number of checked content items, less than ``limit``
+                   once all content is verified"""
+        return 0
+
+    def clear_and_reload(self, progress=None):
+        """Remove all content from the database and add all content found
+        in the content roots.
+        Implementation is backend specific.
+
+        :param progress:  :py:class:`~.progress.Progress` to record counts
+                          and timings in"""
         raise NotImplementedError()
 
     def last_update(self):
         raise NotImplementedError()
 
+    def decay_popularity(self, elapsed, decayed=None):
+        """Decay the popularity scores of all content by the specified time,
+        halving them every ``popularity_half_life`` days.
+        Implementation is backend specific.
+
+        :param elapsed:  number of seconds since the previous decay
+        :param decayed:  time of the decay as a UNIX timestamp, recorded as
+                         the time of the last decay if specified
+        :returns:        int: number of decayed scores"""
+        raise NotImplementedError()
+
+    def get_last_decay(self):
+        """Return the time of the last decay of popularity scores as a UNIX
+        timestamp, or ``None`` if it was never recorded.
+        Implementation is backend specific."""
+        raise NotImplementedError()
+
+    def get_decay_factor(self, elapsed):
+        """Return factor by which popularity scores decay in ``elapsed``
+        seconds."""
+        half_life = float(self.config.get('popularity_half_life',
+                                          POPULARITY_HALF_LIFE))
+        return 0.5 ** (elapsed / (half_life * 24 * 3600))
+
     def add_view(self, relpath):
         raise NotImplementedError()
 
     def add_tags(self, meta, tags):
+        """Tag the specified content with the passed in tag names.
+        Implementation is backend specific.
+
+        :param meta:  ``Meta`` object of the content
+        :param tags:  iterable of tag names
+        :returns:     dict of all tags of the content (name: tag id)"""
         raise NotImplementedError()
 
     def remove_tags(self, meta, tags):
+        """Remove the passed in tag names from the specified content.
+        Implementation is backend specific.
+
+        :param meta:  ``Meta`` object of the content
+        :param tags:  iterable of tag names
+        :returns:     dict of remaining tags of the content (name: tag id)"""
         raise NotImplementedError()
 
     def get_tag_name(self, tag_id):
         raise NotImplementedError()
 
     def get_tag_cloud(self):
+        """Return iterable of tags in use with their ``tag_id``, ``name`` and
+        ``count`` of tagged content, most used tags first.
+        Implementation is backend specific."""
         raise NotImplementedError()
 
     def needs_formatting(self, relpath):
@@ -309,3 +859,9 @@ class BaseArchive(object):
 
     def get_content_languages(self):
         raise NotImplementedError()
+
+    def get_language_counts(self):
+        """Return dict of language codes mapped to the number of listed
+        content items in that language.
+        Implementation is backend specific."""
+        raise NotImplementedError()
@@ -0,0 +1,163 @@
+"""
+async_archive.py: Non-blocking facade for the archive API
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+
+import functools
+import itertools
+
+try:
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # asyncio is available on python 3 only
+    asyncio = None
+
+from .archive import BaseArchive
+
+
+# default number of worker threads running the archive calls
+MAX_WORKERS = 4
+# default number of streamed items fetched by a single worker call
+BATCH_SIZE = 50
+# calls with no side effects, which may be shared by concurrent callers
+COALESCED_METHODS = (
+    'get_count',
+    'get_content',
+    'get_content_page',
+    'get_single',
+    'get_multiple',
+    'get_tag_name',
+    'get_tag_cloud',
+    'get_content_languages',
+    'get_language_counts',
+    'last_update',
+    'needs_formatting',
+    'suggest',
+)
+
+
+class AsyncIterator(object):
+    """Asynchronous iterator over a generator returned by an archive method,
+    pulling ``batch_size`` items at a time in the executor."""
+
+    def __init__(self, facade, name, args, kwargs, batch_size=BATCH_SIZE):
+        self.facade = facade
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+        self.batch_size = batch_size
+        self.iterator = None
+        self.buffer = []
+        self.exhausted = False
+
+    def _fetch(self):
+        if self.iterator is None:
+            method = getattr(self.facade.factory(), self.name)
+            self.iterator = iter(method(*self.args, **self.kwargs))
+        return list(itertools.islice(self.iterator, self.batch_size))
+
+    def _next(self, future):
+        if self.buffer:
+            future.set_result(self.buffer.pop(0))
+        elif self.exhausted:
+            future.set_exception(StopAsyncIteration())
+        else:
+            batch = self.facade.loop.run_in_executor(self.facade.executor,
+                                                     self._fetch)
+            batch.add_done_callback(functools.partial(self._fill, future))
+
+    def _fill(self, future, batch):
+        exc = batch.exception()
+        if exc is None:
+            items = batch.result()
+            self.exhausted = len(items) < self.batch_size
+            self.buffer.extend(items)
+        if future.cancelled():
+            # fetched items stay buffered for the next caller
+            return
+        if exc is not None:
+            future.set_exception(exc)
+        else:
+            self._next(future)
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        future = self.facade.loop.create_future()
+        self._next(future)
+        return future
+
+
+class AsyncArchive(object):
+    """Wrapper around the archive API for use within an asyncio event loop.
+    Calls return awaitable futures, and are run in a bounded pool of worker
+    threads, so database and filesystem access does not block the loop.
+
+    Backends are created per call by ``factory``, as backends are not meant
+    to be shared between threads, e.g. ``lambda: get_archive(supervisor)``.
+
+    Concurrent calls of the read-only methods listed in
+    ``COALESCED_METHODS`` with the same arguments are coalesced into a single
+    backend call, and all callers receive the same result object, which
+    must therefore be treated as read-only. Methods returning generators,
+    such as ``iter_content``, are exposed as asynchronous iterators."""
+    coalesced_methods = COALESCED_METHODS
+    iterator_methods = ('iter_content',)
+
+    def __init__(self, factory, max_workers=MAX_WORKERS, loop=None):
+        if asyncio is None:
+            raise RuntimeError('AsyncArchive requires asyncio')
+        self.factory = factory
+        self.loop = loop or asyncio.get_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # futures of coalesced calls that are in progress, only accessed from
+        # within the event loop
+        self.pending = {}
+
+    def _call(self, name, *args, **kwargs):
+        return getattr(self.factory(), name)(*args, **kwargs)
+
+    def _run(self, name, args, kwargs):
+        func = functools.partial(self._call, name, *args, **kwargs)
+        return self.loop.run_in_executor(self.executor, func)
+
+    def _coalesced(self, name, args, kwargs):
+        key = (name, args, tuple(sorted(kwargs.items())))
+        try:
+            future = self.pending.get(key)
+        except TypeError:
+            # unhashable arguments, such as lists of paths
+            return self._run(name, args, kwargs)
+        if future is None:
+            future = self.pending[key] = self._run(name, args, kwargs)
+            future.add_done_callback(lambda _: self.pending.pop(key, None))
+        # cancellation by one of the callers must not affect the others
+        return asyncio.shield(future)
+
+    def __getattr__(self, name):
+        method = getattr(BaseArchive, name, None)
+        if name.startswith('_') or not callable(method):
+            raise AttributeError(name)
+
+        if name in self.iterator_methods:
+            def wrapper(*args, **kwargs):
+                batch_size = kwargs.pop('batch_size', BATCH_SIZE)
+                return AsyncIterator(self, name, args, kwargs, batch_size)
+        elif name in self.coalesced_methods:
+            def wrapper(*args, **kwargs):
+                return self._coalesced(name, args, kwargs)
+        else:
+            def wrapper(*args, **kwargs):
+                return self._run(name, args, kwargs)
+        return functools.wraps(method)(wrapper)
+
+    def close(self, wait=True):
+        """Shut down the worker threads once the pending calls finish."""
+        self.executor.shutdown(wait=wait)
@@ -8,48 +8,126 @@ This software is free software licensed under the terms of GPLv3. See COPYING
 file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
 """
 
+import contextlib
 import functools
+import itertools
 import logging
+import os
+import threading
+import weakref
+
+from librarian_core.utils import is_string
 
 from ...archive import BaseArchive, metadata
+from ...cache import LRUCache, ResultCache, MISSING
+from ...export import read_export, write_export
+from ...pool import ConnectionPool
+from ...progress import Progress
+from ...records import Record, copy_record, to_record
+from ...stats import QueryLog, timed_query
+from ...suggest import SUGGEST_FIELDS, SUGGEST_LIMIT, PrefixIndex
+from ...throttle import FOREGROUND
 
 
-CONTENT_ORDER = ['-date(updated)', '-views']
+# must match the expressions of the listing indexes (see migrations 00_13 and
+# 00_16)
+CONTENT_ORDER = ["-date(timezone('UTC', updated))", '-views']
+# ordering by popularity, served by the popularity index (see migration 00_17)
+POPULAR_ORDER = ['-popularity']
+# scores below this value are decayed to 0, so they are not rewritten forever
+MIN_POPULARITY = 0.01
+# default number of rows fetched per batch when streaming content
+FETCH_SIZE = 500
+# defaults of the cache of single content items, ttl is in seconds
+CACHE_SIZE = 256
+CACHE_TTL = 300
+# number of listing pages and counts kept by the in-process result cache
+RESULT_CACHE_SIZE = 128
+# ``diff`` updates only the changed columns and rows of existing content,
+# ``replace`` rewrites all of its rows
+WRITE_MODE = 'diff'
+# columns of content pages used for ordering and facets
+PAGE_FIELDS = ('path', 'language', 'updated', 'views', 'popularity')
+# counts of the rows of the ``filtered`` common table expression, per
+# language and content type
+FACETS_SQL = """
+SELECT 'total' AS facet, NULL AS value, COUNT(*) AS count FROM filtered
+UNION ALL
+SELECT 'language', language, COUNT(*) FROM filtered
+WHERE language IS NOT NULL GROUP BY language
+UNION ALL
+SELECT 'content_type', CAST(content_types.type AS varchar), COUNT(*)
+FROM filtered JOIN content_types ON content_types.path = filtered.path
+GROUP BY content_types.type
+"""
+# number of imported content items verified at a time
+VERIFY_BATCH = 100
+# tables holding data of content besides those in ``EmbeddedArchive.schema``
+CONTENT_TABLES = ('content_types', 'content_tags')
+# tables not holding data of a single content item
+SHARED_TABLES = ('tags', 'content_languages')
+# makes a read transaction see a single snapshot of the database
+SNAPSHOT_SQL = 'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY'
+# default number of read connections per database
+READ_CONNECTIONS = 2
 
+CACHES_LOCK = threading.Lock()
 
-def multiarg(query, n):
-    """ Returns version of query where '??' is replaced by n placeholders """
-    return query.replace('??', ', '.join(['%s'] * n))
 
+class Registry(object):
+    """ Objects shared by all archives using the same database, keyed by
+    :py:attr:`EmbeddedArchive.database_key`. Keys that are database handles
+    are held weakly, so the objects of discarded handles are dropped. """
 
-class AttrDict(dict):
+    def __init__(self):
+        self.named = {}
+        self.handles = weakref.WeakKeyDictionary()
 
-    def __init__(self, *args, **kwargs):
-        super(AttrDict, self).__init__(*args, **kwargs)
-        self.__dict__ = self
+    def get(self, key, factory):
+        """ Return object stored under ``key``, storing the one returned by
+        ``factory`` first if there is none. """
+        registry = self.named if is_string(key) else self.handles
+        with CACHES_LOCK:
+            try:
+                return registry[key]
+            except KeyError:
+                value = registry[key] = factory()
+                return value
 
 
-def row_to_dict(row):
-    return AttrDict((key, row[key]) for key in row.keys())
+# caches of single content items and of results, prefix indexes and query
+# logs, shared by archives using the same database
+CACHES = Registry()
+RESULT_CACHES = Registry()
+SUGGESTIONS = Registry()
+QUERY_LOGS = Registry()
+READ_POOLS = Registry()
 
 
-def to_dict(func):
+def multiarg(query, n):
+    """ Returns version of query where '??' is replaced by n placeholders """
+    return query.replace('??', ', '.join(['%s'] * n))
+
+
+def as_record(func):
     @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        row = func(*args, **kwargs)
+    def wrapper(self, *args, **kwargs):
+        table = kwargs.pop('table', None)
+        row = func(self, *args, **kwargs)
         if not row:
             return row
-        return row_to_dict(row)
+        return self.to_record(row, table)
     return wrapper
 
 
-def to_dict_list(func):
+def as_record_list(func):
     @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        rows = func(*args, **kwargs)
+    def wrapper(self, *args, **kwargs):
+        table = kwargs.pop('table', None)
+        rows = func(self, *args, **kwargs)
         if not rows:
             return rows
-        return map(row_to_dict, rows)
+        return [self.to_record(row, table) for row in rows]
     return wrapper
 
 
@@ -73,6 +151,42 @@ class Rename(Transformation):
         self.name = name
 
 
+def serialize(metadata, transformations):
+    """Apply the transformations to the metadata dict in-place, bringing it
+    into the shape of the database tables."""
+    for transformer in transformations:
+        ((key, action),) = transformer.items()
+        if isinstance(action, list) and key in metadata:
+            serialize(metadata[key], action)
+        elif action is Merge:
+            value = metadata.pop(key, None)
+            if value is not None:
+                metadata.update(value)
+        elif action is Ignore:
+            metadata.pop(key, None)
+        elif isinstance(action, Rename):
+            value = metadata.pop(key, None)
+            if value is not None:
+                metadata[action.name] = value
+
+
+def values_equal(old, new):
+    try:
+        return old == new
+    except TypeError:
+        # e.g. naive and timezone aware datetimes
+        return False
+
+
+def related_fields(schema, table):
+    """Return names of the keys under which data of other tables is attached
+    to rows of the specified table."""
+    if table == 'content':
+        return tuple(metadata.CONTENT_TYPES) + ('tags',)
+    relations = schema.get(table, {}).get('relations', {})
+    return tuple(name for names in relations.values() for name in names)
+
+
 class EmbeddedArchive(BaseArchive):
     transformations = [
         {'content': Merge},
@@ -118,125 +232,528 @@ class EmbeddedArchive(BaseArchive):
         }
     }
 
-    @to_dict
+    # ordering of content listings
+    content_order = CONTENT_ORDER
+    popular_order = POPULAR_ORDER
+    # condition matching content against the ``terms`` query parameter
+    search_clause = ('title ILIKE %(terms)s OR '
+                     'publisher ILIKE %(terms)s OR '
+                     'keywords ILIKE %(terms)s')
+
+    @as_record
     def one(self, *args, **kwargs):
-        return self.db.fetchone(*args, **kwargs)
+        db = kwargs.pop('db', None) or self.db
+        return db.fetchone(*args, **kwargs)
 
-    @to_dict_list
+    @as_record_list
     def many(self, *args, **kwargs):
-        return self.db.fetchall(*args, **kwargs)
+        db = kwargs.pop('db', None) or self.db
+        return db.fetchall(*args, **kwargs)
+
+    def to_record(self, row, table=None):
+        """Convert a row of the specified table into a compact record, with
+        slots reserved for the related data that may be attached to it."""
+        related = related_fields(self.schema, table)
+        return to_record(row, table, extra_fields=related)
 
     def __init__(self, fsal, db, **config):
         self.db = db
         super(EmbeddedArchive, self).__init__(fsal, **config)
 
+    @classmethod
+    def get_read_pool(cls, db, size=None):
+        """ Return pool of up to ``size`` connections to the same database as
+        ``db``, shared by all archives using it. Each pooled handle holds a
+        single connection, opened with the connection parameters of ``db``.
+        Returns ``None`` if ``size`` is 0, or ``db`` does not provide its
+        connection parameters. """
+        size = READ_CONNECTIONS if size is None else size
+        params = getattr(db, 'connection_params', None)
+        if not size or not params:
+            return None
+
+        def connect():
+            return db.connect(host=params['host'],
+                              port=params['port'],
+                              database=params['dbname'],
+                              user=params['user'],
+                              password=params['password'],
+                              maxsize=1)
+        return READ_POOLS.get(db, lambda: ConnectionPool(connect, size=size))
+
+    @property
+    def read_pool(self):
+        """ Pool of connections used for reading, specified by the
+        ``read_pool`` option, see :py:meth:`get_read_pool`. If not set,
+        ``db`` is used for reading too. """
+        return self.config.get('read_pool')
+
+    def _snapshot(self, db):
+        """ Return context manager running a read only transaction on the
+        passed in database, which sees a single snapshot of the data. """
+        @contextlib.contextmanager
+        def snapshot():
+            with db.transaction():
+                db.execute(SNAPSHOT_SQL)
+                yield db
+        return snapshot()
+
+    @contextlib.contextmanager
+    def reading(self):
+        """ Context manager providing the database to read from. With a read
+        pool set up, it is a pooled connection reading from a snapshot, so
+        reads neither wait for, nor see the changes of a write transaction
+        that is in progress on the writer connection. Reads in progress are
+        counted, so content ingest can yield to them. """
+        with FOREGROUND.reading():
+            pool = self.read_pool
+            if pool is None:
+                yield self.db
+                return
+            with pool.connection() as db:
+                with self._snapshot(db):
+                    yield db
+
+    def get_pool_stats(self):
+        """ Return dict of size, usage and wait time metrics of the read
+        pool, or ``None`` if reads use the writer connection. """
+        pool = self.read_pool
+        return pool and pool.stats()
+
     def _serialize(self, metadata, transformations):
-        for transformer in transformations:
-            ((key, action),) = transformer.items()
-            if isinstance(action, list) and key in metadata:
-                self._serialize(metadata[key], action)
-            elif action is Merge:
-                value = metadata.pop(key, None)
-                if value is not None:
-                    metadata.update(value)
-            elif action is Ignore:
-                metadata.pop(key, None)
-            elif isinstance(action, Rename):
-                value = metadata.pop(key, None)
-                if value is not None:
-                    metadata[action.name] = value
-
-    def _add_filters(self, q, terms, lang, content_type):
+        serialize(metadata, transformations)
+
+    def _add_filters(self, q, terms, lang, content_type, tag=None):
+        if tag:
+            # semi-join served by the (tag_id, path) index of content_tags
+            q.where += ('path IN (SELECT path FROM content_tags '
+                        'WHERE tag_id = %(tag)s)')
+
         if lang:
             q.where += 'language = %(lang)s'
 
         if terms:
-            q.where += ('title ILIKE %(terms)s OR '
-                        'publisher ILIKE %(terms)s OR '
-                        'keywords ILIKE %(terms)s')
+            q.where += self.search_clause
 
+        # content type membership is looked up in ``content_types``, as no
+        # index could serve bitmask arithmetic on ``content.content_type``
         if content_type:
             # get integer representation of content type
             content_type_id = metadata.CONTENT_TYPES[content_type]
-            q.where += '("content_type" & %(content_type)s) = %(content_type)s'
+            q.where += ('path IN (SELECT path FROM content_types '
+                        'WHERE type = %(content_type)s)')
         else:
             # exclude content types that cannot be displayed on the mixed type
             # content list
             content_type_id = sum([metadata.CONTENT_TYPES[name]
                                    for name in self.exclude_from_content_list])
-            qs = '("content_type" & %(content_type)s) != %(content_type)s'
-            q.where += qs
+            q.where += ('NOT EXISTS (SELECT 1 FROM content_types '
+                        'WHERE content_types.path = content.path '
+                        'AND (type & %(content_type)s) != 0)')
 
         return (q, content_type_id)
 
-    def get_count(self, terms=None, lang=None, content_type=None):
+    def _search_param(self, terms):
+        """Return value of the ``terms`` query parameter used by
+        ``search_clause``."""
+        return '%' + (terms or '').lower() + '%'
+
+    def get_count(self, terms=None, lang=None, content_type=None, tag=None):
+        params = ('count', terms or None, lang or None, content_type, tag)
+        loader = functools.partial(self._get_count, terms, lang,
+                                   content_type, tag)
+        results = self.results
+        if results is None:
+            return loader()
+        return results.get(params, loader)
+
+    @timed_query
+    def _get_count(self, terms=None, lang=None, content_type=None, tag=None):
         q = self.db.Select('COUNT(*) as count',
                            sets='content',
                            where='disabled = false')
         (q, content_type_id) = self._add_filters(q,
                                                  terms,
                                                  lang,
-                                                 content_type)
-        terms = '%' + terms.lower() + '%'
-        result = self.db.fetchone(q, dict(terms=terms,
-                                          lang=lang,
-                                          content_type=content_type_id))
+                                                 content_type,
+                                                 tag)
+        with self.reading() as db:
+            result = db.fetchone(q, dict(terms=self._search_param(terms),
+                                         lang=lang,
+                                         content_type=content_type_id,
+                                         tag=tag))
         return result['count']
 
+    def get_order(self, order=None):
+        """ Return list of ordering expressions of the named order, either
+        ``latest`` (the default) or ``popular``. """
+        if order in (None, 'latest'):
+            return self.content_order
+        if order == 'popular':
+            return self.popular_order
+        raise ValueError("Unknown content order '{0}'".format(order))
+
     def get_content(self, terms=None, offset=0, limit=0, lang=None,
-                    content_type=None):
+                    content_type=None, tag=None, fields=None, order=None):
+        fields = self.get_fields(fields)
+        params = ('content', terms or None, int(offset or 0),
+                  int(limit or 0), lang or None, content_type, tag, fields,
+                  order or None)
+        loader = functools.partial(self._get_content, terms, offset, limit,
+                                   lang, content_type, tag, fields, order)
+        results = self.results
+        if results is None:
+            return loader()
+        rows = results.get(params, loader)
+        # callers are free to modify the returned data
+        return rows and [copy_record(row) for row in rows]
+
+    @timed_query
+    def _get_content(self, terms=None, offset=0, limit=0, lang=None,
+                     content_type=None, tag=None, fields=None, order=None):
         # TODO: tests
-        q = self.db.Select(sets='content',
+        q = self.db.Select(what=fields or '*',
+                           sets='content',
                            where='disabled = false',
-                           order=CONTENT_ORDER,
+                           order=self.get_order(order),
                            limit=limit,
                            offset=offset)
         (q, content_type_id) = self._add_filters(q,
                                                  terms,
                                                  lang,
-                                                 content_type)
-        terms = '%' + terms.lower() + '%'
-        results = self.many(q, dict(terms=terms,
-                                    lang=lang,
-                                    content_type=content_type_id))
-        if results and content_type in self.prefetchable_types:
-            for meta in results:
-                self._fetch(content_type, meta['path'], meta)
+                                                 content_type,
+                                                 tag)
+        with self.reading() as db:
+            results = self.many(q, dict(terms=self._search_param(terms),
+                                        lang=lang,
+                                        content_type=content_type_id,
+                                        tag=tag),
+                                table='content',
+                                db=db)
+            if results and content_type in self.prefetchable_types:
+                for meta in results:
+                    self._fetch(content_type, meta['path'], meta, db=db)
 
         return results
 
-    def _fetch(self, table, relpath, dest, many=False):
+    def get_content_page(self, terms=None, offset=0, limit=0, lang=None,
+                         content_type=None, tag=None, facets=False,
+                         fields=None, order=None):
+        fields = self.get_fields(fields)
+        params = ('page', terms or None, int(offset or 0), int(limit or 0),
+                  lang or None, content_type, tag, bool(facets), fields,
+                  order or None)
+        loader = functools.partial(self._get_content_page, terms, offset,
+                                   limit, lang, content_type, tag, facets,
+                                   fields, order)
+        results = self.results
+        if results is None:
+            return loader()
+        page = results.get(params, loader)
+        # callers are free to modify the returned data
+        return dict(page, rows=[copy_record(row) for row in page['rows']])
+
+    @timed_query
+    def _get_content_page(self, terms=None, offset=0, limit=0, lang=None,
+                          content_type=None, tag=None, facets=False,
+                          fields=None, order=None):
+        # the filters are evaluated once, in a common table expression that
+        # both the page and the total (and facets) are computed from
+        what = '*'
+        if fields is not None:
+            # columns the ordering and the facets depend on are needed too
+            what = list(fields) + [name for name in PAGE_FIELDS
+                                   if name not in fields]
+        filtered = self.db.Select(what=what,
+                                  sets='content',
+                                  where='disabled = false')
+        (filtered, content_type_id) = self._add_filters(filtered,
+                                                        terms,
+                                                        lang,
+                                                        content_type,
+                                                        tag)
+        cte = 'WITH filtered AS ({0}) '.format(filtered)
+        params = dict(terms=self._search_param(terms),
+                      lang=lang,
+                      content_type=content_type_id,
+                      tag=tag)
+        q = self.db.Select((list(fields) if fields else ['*']) +
+                           ['(SELECT COUNT(*) FROM filtered) AS total'],
+                           sets='filtered',
+                           order=self.get_order(order),
+                           limit=limit,
+                           offset=offset)
+        with self.reading() as db:
+            rows = self.many(cte + str(q), params, table='content',
+                             db=db) or []
+            counts = None
+            if facets:
+                counts = self._get_facets(cte, params, db)
+                total = counts.pop('total')
+            elif rows:
+                total = rows[0]['total']
+            elif offset:
+                # the total is not known when paging past the last match
+                q = 'SELECT COUNT(*) AS total FROM filtered'
+                total = db.fetchone(cte + q, params)['total']
+            else:
+                total = 0
+            for row in rows:
+                del row['total']
+            if rows and content_type in self.prefetchable_types:
+                for meta in rows:
+                    self._fetch(content_type, meta['path'], meta, db=db)
+        return dict(rows=rows, total=total, facets=counts)
+
+    def _get_facets(self, cte, params, db):
+        type_names = dict((type_id, name) for (name, type_id)
+                          in metadata.CONTENT_TYPES.items())
+        q = cte + FACETS_SQL
+        counts = dict(language={}, content_type={}, total=0)
+        for row in db.fetchiter(q, params):
+            if row['facet'] == 'total':
+                counts['total'] = row['count']
+            elif row['facet'] == 'language':
+                counts['language'][row['value']] = row['count']
+            else:
+                counts['content_type'][type_names[int(row['value'])]] = (
+                    row['count'])
+        return counts
+
+    def iter_content(self, terms=None, lang=None, content_type=None,
+                     tag=None, fetch_size=None):
+        """Stream matching content in batches of ``fetch_size`` rows. Batches
+        are paged by primary key (keyset pagination), so each batch is an
+        index range scan and memory usage stays flat regardless of library
+        size. Rows are yielded in ``path`` order, not in ``content_order``.
+        """
+        fetch_size = fetch_size or self.config.get('fetch_size', FETCH_SIZE)
+        pattern = self._search_param(terms)
+        last_path = None
+        while True:
+            q = self.db.Select(sets='content',
+                               where='disabled = false',
+                               order='path',
+                               limit=fetch_size)
+            (q, content_type_id) = self._add_filters(q,
+                                                     terms,
+                                                     lang,
+                                                     content_type,
+                                                     tag)
+            if last_path is not None:
+                q.where += 'path > %(last_path)s'
+            # the connection is not held while the batch is consumed
+            with self.reading() as db:
+                rows = db.fetchall(q, dict(terms=pattern,
+                                           lang=lang,
+                                           content_type=content_type_id,
+                                           tag=tag,
+                                           last_path=last_path))
+                metas = [self.to_record(row, 'content') for row in rows]
+                if content_type in self.prefetchable_types:
+                    for meta in metas:
+                        self._fetch(content_type, meta['path'], meta, db=db)
+            for meta in metas:
+                yield meta
+
+            if len(rows) < fetch_size:
+                return
+            last_path = rows[-1]['path']
+
+    @property
+    def database_key(self):
+        """ Identity of the database, under which the caches and indexes
+        shared by all archives using it are registered. """
+        return self.db
+
+    @property
+    def cache(self):
+        """ Cache of :py:meth:`get_single` results. Archive instances are
+        created per request, so the cache is shared by all archives using the
+        same database."""
+        size = int(self.config.get('cache_size', CACHE_SIZE))
+        ttl = int(self.config.get('cache_ttl', CACHE_TTL))
+        return CACHES.get(self.database_key,
+                          functools.partial(LRUCache, size, ttl))
+
+    @property
+    def results(self):
+        """ Cache of :py:meth:`get_content` and :py:meth:`get_count` results,
+        or ``None`` if disabled. The ``result_cache`` option may specify the
+        cache backend to use, such as the cache extension, otherwise results
+        are cached in process, shared by all archives using the same
+        database."""
+        backend = self.config.get('result_cache', MISSING)
+        if backend is None:
+            return None
+        if backend is MISSING:
+            backend = RESULT_CACHES.get(self.database_key,
+                                        functools.partial(LRUCache,
+                                                          RESULT_CACHE_SIZE))
+        return ResultCache(backend)
+
+    @property
+    def suggestions(self):
+        """ Prefix index of :py:meth:`suggest`, shared by all archives using
+        the same database. """
+        return SUGGESTIONS.get(self.database_key, PrefixIndex)
+
+    def _load_suggestions(self):
+        fetch_size = self.config.get('fetch_size', FETCH_SIZE)
+        last_path = None
+        while True:
+            q = self.db.Select(['path', 'language'] + list(SUGGEST_FIELDS),
+                               sets='content',
+                               where='disabled = false',
+                               order='path',
+                               limit=fetch_size)
+            if last_path is not None:
+                q.where += 'path > %(last_path)s'
+            with self.reading() as db:
+                rows = db.fetchall(q, dict(last_path=last_path))
+            for row in rows:
+                yield (row['path'],
+                       row['language'],
+                       [row[name] for name in SUGGEST_FIELDS])
+            if len(rows) < fetch_size:
+                return
+            last_path = rows[-1]['path']
+
+    def suggest(self, prefix, limit=SUGGEST_LIMIT, lang=None):
+        return self.suggestions.suggest(prefix, self._load_suggestions,
+                                        limit=limit, lang=lang)
+
+    def _update_suggestions(self, metadata):
+        if metadata.get('disabled'):
+            self.suggestions.remove(metadata['path'])
+        else:
+            self.suggestions.add(metadata['path'],
+                                 metadata.get('language'),
+                                 [metadata.get(name)
+                                  for name in SUGGEST_FIELDS])
+
+    def _invalidate(self, *relpaths):
+        # must be called after the changes have been committed, otherwise
+        # concurrent readers could cache the old data again
+        self.cache.invalidate(*relpaths)
+        results = self.results
+        if results is not None:
+            results.bump()
+
+    def get_cache_stats(self):
+        """ Return dict of hit, miss and eviction counts of the content
+        cache, as well as its hit ratio and current size. """
+        return self.cache.stats()
+
+    @property
+    def query_log(self):
+        """ Log of the slowest recent reads, shared by all archives using the
+        same database. """
+        return QUERY_LOGS.get(self.database_key, QueryLog)
+
+    def _count_rows(self, table, db):
+        # the row count estimated by the planner is used, as counting rows
+        # scans the whole table in PostgreSQL, unless the table was never
+        # analyzed, in which case there is no estimate
+        q = self.db.Select('reltuples', sets='pg_class', where='relname = %s')
+        row = db.fetchone(q, (table,))
+        if row and row['reltuples'] > 0:
+            return int(row['reltuples'])
+        q = self.db.Select('COUNT(*) as count', sets=table)
+        return db.fetchone(q)['count']
+
+    def get_table_counts(self):
+        tables = (list(self.schema.keys()) + list(CONTENT_TABLES) +
+                  list(SHARED_TABLES))
+        with self.reading() as db:
+            return dict((table, self._count_rows(table, db))
+                        for table in tables)
+
+    def get_orphan_counts(self):
+        # each row of the table is looked up in the primary key index of
+        # ``content``, which is never scanned
+        tables = [table for table in self.schema.keys() if table != 'content']
+        counts = {}
+        with self.reading() as db:
+            for table in tables + list(CONTENT_TABLES):
+                q = self.db.Select('COUNT(*) as count', sets=table)
+                q.where += ('NOT EXISTS (SELECT 1 FROM content WHERE '
+                            'content.path = {0}.path)'.format(table))
+                counts[table] = db.fetchone(q)['count']
+        return counts
+
+    def get_unverified_count(self):
+        # served by the index on ``root``
+        q = self.db.Select('COUNT(*) as count', sets='content',
+                           where='root IS NULL')
+        with self.reading() as db:
+            return db.fetchone(q)['count']
+
+    def get_library_stats(self):
+        stats = super(EmbeddedArchive, self).get_library_stats()
+        results = self.results
+        if results is not None and isinstance(results.backend, LRUCache):
+            stats['results'] = results.backend.stats()
+        else:
+            stats['results'] = None
+        stats.update(cache=self.get_cache_stats(),
+                     pool=self.get_pool_stats(),
+                     queries=self.query_log.slowest(),
+                     suggestions=self.suggestions.stats())
+        return stats
+
+    def _fetch(self, table, relpath, dest, many=False, db=None):
         q = self.db.Select(sets=table, where='path = %s')
         fetcher = self.one if not many else self.many
-        dest[table] = fetcher(q, (relpath,))
+        dest[table] = fetcher(q, (relpath,), table=table, db=db)
         relations = self.schema[table].get('relations', {})
         for relation, related_tables in relations.items():
             for rel_table in related_tables:
                 self._fetch(rel_table,
                             relpath,
                             dest[table],
-                            many=relation == 'many')
+                            many=relation == 'many',
+                            db=db)
 
     def get_single(self, relpath):
+        cache = self.cache
+        data = cache.get(relpath)
+        if data is MISSING:
+            # invalidations during the fetch prevent storing a stale result
+            generation = cache.generation
+            data = self._get_single(relpath)
+            cache.set(relpath, data, generation)
+        # callers are free to modify the returned data
+        return data and copy_record(data)
+
+    @timed_query
+    def _get_single(self, relpath):
         q = self.db.Select(sets='content', where='path = %s')
-        data = self.one(q, (relpath,))
-        if data:
-            for content_type, mask in metadata.CONTENT_TYPES.items():
-                if data['content_type'] & mask == mask:
-                    self._fetch(content_type, relpath, data)
+        with self.reading() as db:
+            data = self.one(q, (relpath,), table='content', db=db)
+            if data:
+                for content_type, mask in metadata.CONTENT_TYPES.items():
+                    if data['content_type'] & mask == mask:
+                        self._fetch(content_type, relpath, data, db=db)
+                data['tags'] = self._get_tags(relpath, db=db)
         return data
 
+    @timed_query
     def get_multiple(self, relpaths, fields=None):
         q = self.db.Select(what=['*'] if fields is None else fields,
                            sets='content',
                            where=self.db.sqlin('path', relpaths))
-        return self.many(q, relpaths)
+        with self.reading() as db:
+            return self.many(q, relpaths, table='content', db=db)
 
     def _write(self, table_name, data, shared_data=None):
+        if self.config.get('write_mode', WRITE_MODE) == 'diff':
+            return self._write_diff(table_name, data, shared_data)
+
         data.update(shared_data)
         primitives = {}
         for key, value in data.items():
-            if isinstance(value, dict):
+            if isinstance(value, (dict, Record)):
                 self._write(key, value, shared_data=shared_data)
             elif isinstance(value, list):
                 for row in value:
@@ -250,35 +767,280 @@ class EmbeddedArchive(BaseArchive):
                             cols=primitives.keys())
         self.db.execute(q, primitives)
 
+    def _match_constraints(self, table_name):
+        constraints = self.schema[table_name]['constraints']
+        return ' AND '.join('{0} = %({0})s'.format(name)
+                            for name in constraints)
+
+    def _apply_diff(self, table_name, existing, row):
+        """Insert the row if it does not exist yet, otherwise update only the
+        columns whose values differ. Columns missing from the row, such as
+        ``views`` of content, are left untouched."""
+        if existing is None:
+            cols = sorted(row.keys())
+            q = 'INSERT INTO {0} ({1}) VALUES ({2})'.format(
+                table_name,
+                ', '.join(cols),
+                ', '.join('%({0})s'.format(col) for col in cols))
+            self.db.execute(q, row)
+            return
+
+        constraints = self.schema[table_name]['constraints']
+        changed = [key for (key, value) in row.items()
+                   if key not in constraints and
+                   not values_equal(existing[key], value)]
+        if changed:
+            q = self.db.Update(table_name,
+                               where=self._match_constraints(table_name),
+                               **dict((key, '%({0})s'.format(key))
+                                      for key in changed))
+            self.db.execute(q, row)
+
+    def _write_diff(self, table_name, data, shared_data):
+        data.update(shared_data)
+        primitives = {}
+        for key, value in data.items():
+            if isinstance(value, (dict, Record)):
+                self._write_diff(key, value, shared_data)
+            elif isinstance(value, list):
+                self._write_diff_many(key, value, shared_data)
+            else:
+                primitives[key] = value
+
+        q = self.db.Select(sets=table_name,
+                           where=self._match_constraints(table_name))
+        existing = self.db.fetchone(q, primitives)
+        self._apply_diff(table_name, existing, primitives)
+
+    def _write_diff_many(self, table_name, rows, shared_data):
+        # rows of the content that are not present anymore are deleted, and
+        # rows that did not change are not touched at all
+        constraints = self.schema[table_name]['constraints']
+        q = self.db.Select(sets=table_name, where='path = %(path)s')
+        existing = dict((tuple(row[name] for name in constraints), row)
+                        for row in self.db.fetchall(q, shared_data))
+        for row in rows:
+            row.update(shared_data)
+            key = tuple(row.get(name) for name in constraints)
+            self._apply_diff(table_name, existing.pop(key, None), row)
+        for key in existing:
+            q = self.db.Delete(table_name,
+                               where=self._match_constraints(table_name))
+            self.db.execute(q, dict(zip(constraints, key)))
+
+    def _write_content_types(self, relpath, mask):
+        """Store each content type found in the bitmask as a separate row of
+        ``content_types``, the indexable form of ``content.content_type``.
+        In diff mode, only the rows of added and removed types are
+        written."""
+        if mask is None:
+            mask = metadata.CONTENT_TYPES['generic']
+        types = set(type_id for type_id in metadata.CONTENT_TYPES.values()
+                    if mask & type_id == type_id)
+        if self.config.get('write_mode', WRITE_MODE) == 'diff':
+            q = self.db.Select('type', sets='content_types',
+                               where='path = %s')
+            existing = set(row['type']
+                           for row in self.db.fetchall(q, (relpath,)))
+            q = self.db.Delete('content_types',
+                               where='path = %s AND type = %s')
+            for type_id in sorted(existing - types):
+                self.db.execute(q, (relpath, type_id))
+            types -= existing
+        else:
+            q = self.db.Delete('content_types', where='path = %s')
+            self.db.execute(q, (relpath,))
+        q = 'INSERT INTO content_types (path, type) VALUES (%s, %s)'
+        for type_id in sorted(types):
+            self.db.execute(q, (relpath, type_id))
+
     def add_meta_to_db(self, metadata):
         with self.db.transaction():
             replaces = metadata.get('replaces')
+            previous_language = self._get_listed_language(metadata['path'])
             self._serialize(metadata, self.transformations)
             self._write('content',
                         metadata,
                         shared_data={'path': metadata['path']})
+            self._write_content_types(metadata['path'],
+                                      metadata.get('content_type'))
+            language = (None if metadata.get('disabled')
+                        else metadata.get('language'))
+            # counts are left alone if the content stays listed under the
+            # same language, as with most reloads
+            if language != previous_language:
+                self._update_language_count(previous_language, -1)
+                self._update_language_count(language, 1)
             if replaces:
                 msg = "Removing replaced content from archive database."
                 logging.debug(msg)
+                self._update_language_count(
+                    self._get_listed_language(replaces), -1)
                 q = self.db.Delete('content', where='path = %s')
                 self.db.execute(q, (replaces,))
+                q = self.db.Delete('content_types', where='path = %s')
+                self.db.execute(q, (replaces,))
+                self._remove_content_tags(replaces)
 
+        self._invalidate(metadata['path'], replaces)
+        self._update_suggestions(metadata)
+        if replaces:
+            self.suggestions.remove(replaces)
         return True
 
     def remove_meta_from_db(self, relpath):
         with self.db.transaction():
+            self._update_language_count(self._get_listed_language(relpath),
+                                        -1)
             q = self.db.Delete('content', where='path = %s')
             rowcount = self.db.execute(q, (relpath,))
             for table in self.schema.keys():
                 q = self.db.Delete(table, where='path = %s')
                 self.db.execute(q, (relpath,))
-            return rowcount
+            q = self.db.Delete('content_types', where='path = %s')
+            self.db.execute(q, (relpath,))
+            self._remove_content_tags(relpath)
+        self._invalidate(relpath)
+        self.suggestions.remove(relpath)
+        return rowcount
+
+    def detach_root(self, root):
+        with self.db.transaction():
+            in_root = 'path IN (SELECT path FROM content WHERE root = %s)'
+            for table in ['content_types'] + list(self.schema.keys()):
+                if table != 'content':
+                    q = self.db.Delete(table, where=in_root)
+                    self.db.execute(q, (root,))
+            q = self.db.Delete('content', where='root = %s')
+            rowcount = self.db.execute(q, (root,))
+        self._rebuild_tag_counts()
+        self._rebuild_language_counts()
+        self.cache.clear()
+        self._invalidate()
+        self.suggestions.reset()
+        logging.info(u"Detached %s pieces of content of '%s'", rowcount, root)
+        return rowcount
+
+    def _insert_many(self, table_name, columns, rows):
+        # multi-row inserts, each within the limit of query parameters
+        per_query = max(1, self.db.MAX_VARIABLE_NUMBER // len(columns))
+        values = '({0})'.format(', '.join(['%s'] * len(columns)))
+        for start in range(0, len(rows), per_query):
+            batch = rows[start:start + per_query]
+            q = 'INSERT INTO {0} ({1}) VALUES {2}'.format(
+                table_name,
+                ', '.join(columns),
+                ', '.join([values] * len(batch)))
+            self.db.execute(q, [value for row in batch for value in row])
 
-    def clear_and_reload(self):
-        logging.debug('Content refill started.')
-        q = self.db.Delete('content')
-        self.db.execute(q)
-        rows = self.reload_content()
+    def _export_tables(self, db):
+        tables = ['content'] + sorted(name for name in self.schema
+                                      if name != 'content')
+        for table in tables:
+            q = self.db.Select(sets=table, order='path')
+            rows = db.fetchiter(q)
+            first = next(rows, None)
+            if first is None:
+                continue
+            columns = tuple(first.keys())
+            yield (table,
+                   columns,
+                   (tuple(row[name] for name in columns)
+                    for row in itertools.chain([first], rows)))
+        # tag ids are not portable, so taggings are exported by tag name
+        q = ('SELECT content_tags.path, tags.name FROM content_tags '
+             'JOIN tags ON tags.tag_id = content_tags.tag_id '
+             'ORDER BY content_tags.path')
+        yield ('content_tags',
+               ('path', 'name'),
+               ((row['path'], row['name']) for row in db.fetchiter(q)))
+
+    def export_library(self, path):
+        with self.reading() as db:
+            counts = write_export(path, self._export_tables(db))
+        logging.info(u"Exported %s pieces of content to '%s'",
+                     counts.get('content', 0), path)
+        return counts
+
+    def import_library(self, path):
+        counts = {}
+        tag_ids = {}
+        with self.db.transaction():
+            for table in (['content_tags', 'content_types'] +
+                          list(self.schema.keys())):
+                self.db.execute(self.db.Delete(table))
+            for (table, columns, rows) in read_export(path):
+                if table == 'content_tags':
+                    for (relpath, name) in rows:
+                        if name not in tag_ids:
+                            tag_ids[name] = self._get_or_create_tag(name)
+                    rows = [(relpath, tag_ids[name])
+                            for (relpath, name) in rows]
+                    columns = ('path', 'tag_id')
+                elif table == 'content' and 'root' in columns:
+                    # roots of the exporting device do not apply here, so the
+                    # content is located when it is verified
+                    index = columns.index('root')
+                    rows = [row[:index] + (None,) + row[index + 1:]
+                            for row in rows]
+                self._insert_many(table, columns, rows)
+                counts[table] = counts.get(table, 0) + len(rows)
+            q = ('INSERT INTO content_types (path, type) '
+                 'SELECT path, %s FROM content WHERE content_type & %s = %s')
+            for type_id in sorted(metadata.CONTENT_TYPES.values()):
+                self.db.execute(q, (type_id, type_id, type_id))
+        self._rebuild_tag_counts()
+        self._rebuild_language_counts()
+        self.cache.clear()
+        self._invalidate()
+        self.suggestions.reset()
+        logging.info(u"Imported %s pieces of content from '%s'",
+                     counts.get('content', 0), path)
+        return counts
+
+    def verify_content(self, limit=VERIFY_BATCH):
+        if not all(os.path.isdir(root) for root in self.content_roots):
+            # content on a device that is not mounted would be removed
+            logging.debug('Content verification postponed, not all content '
+                          'roots are accessible.')
+            return 0
+        q = self.db.Select('path', sets='content', where='root IS NULL',
+                           limit=limit)
+        relpaths = [row['path'] for row in self.db.fetchall(q)]
+        for relpath in relpaths:
+            self._throttle_io()
+            root = self.locate_content(relpath)
+            if root is None:
+                logging.info(u"Content '%s' is not found, removing it from "
+                             u"the library.", relpath)
+                self.remove_meta_from_db(relpath)
+            else:
+                q = self.db.Update('content', root='%s', where='path = %s')
+                self.db.execute(q, (root, relpath))
+                self._invalidate(relpath)
+        return len(relpaths)
+
+    def clear_and_reload(self, progress=None):
+        progress = progress or Progress()
+        if self.is_resumable('refill'):
+            # content added before the interruption is kept
+            logging.info('Interrupted content refill is resumed.')
+        else:
+            logging.debug('Content refill started.')
+            with progress.stage('clear'):
+                for table in ('content', 'content_types'):
+                    q = self.db.Delete(table)
+                    self.db.execute(q)
+        # content is not indexed one by one while reloading, the index is
+        # rebuilt when it is used next
+        self.suggestions.reset()
+        rows = self._reload_content('refill', progress=progress)
+        with progress.stage('counts'):
+            self._rebuild_tag_counts()
+            self._rebuild_language_counts()
+        self.cache.clear()
+        self._invalidate()
+        self.suggestions.reset()
         logging.info('Content refill finished for %s pieces of content', rows)
 
     def last_update(self):
@@ -290,7 +1052,8 @@ class EmbeddedArchive(BaseArchive):
                            sets='content',
                            order='-updated',
                            limit=1)
-        res = self.db.fetchone(q)
+        with self.reading() as db:
+            res = db.fetchone(q)
         return res and res['updated']
 
     def add_view(self, relpath):
@@ -299,20 +1062,195 @@ class EmbeddedArchive(BaseArchive):
         :param relpath:  Relative path of content item
         :returns:        ``True`` if successful, ``False`` otherwise
         """
-        q = self.db.Update('content', views='views + 1', where='path = %s')
+        q = self.db.Update('content',
+                           views='views + 1',
+                           popularity='popularity + 1',
+                           where='path = %s')
         rowcount = self.db.execute(q, (relpath,))
         assert rowcount == 1, 'Updated more than one row'
+        # only the item itself is invalidated, as views are too frequent to
+        # discard all cached listings for, which may show stale view counts
+        # and popularity order until the next write
+        self.cache.invalidate(relpath)
+        return rowcount
+
+    def decay_popularity(self, elapsed, decayed=None):
+        factor = self.get_decay_factor(elapsed)
+        q = self.db.Update('content',
+                           popularity=('CASE WHEN popularity * %(factor)s < '
+                                       '%(minimum)s THEN 0 '
+                                       'ELSE popularity * %(factor)s END'),
+                           where='popularity > 0')
+        with self.db.transaction():
+            rowcount = self.db.execute(q, dict(factor=factor,
+                                               minimum=MIN_POPULARITY))
+            if decayed is not None:
+                self.db.execute(self.db.Delete('popularity_decay'))
+                self.db.execute('INSERT INTO popularity_decay (decayed) '
+                                'VALUES (%s)', (decayed,))
+        # cached items and listings hold the previous scores and order
+        self.cache.clear()
+        self._invalidate()
         return rowcount
 
+    def get_last_decay(self):
+        q = self.db.Select('decayed', sets='popularity_decay')
+        with self.reading() as db:
+            row = db.fetchone(q)
+        return row and row['decayed']
+
     def needs_formatting(self, relpath):
         """ Whether content needs formatting patch """
         q = self.db.Select('keep_formatting',
                            sets='content',
                            where='path = %s')
-        result = self.db.fetchone(q, (relpath,))
+        with self.reading() as db:
+            result = db.fetchone(q, (relpath,))
         return not result['keep_formatting']
 
+    def _get_tags(self, relpath, db=None):
+        q = ('SELECT tags.tag_id, tags.name FROM content_tags '
+             'JOIN tags ON tags.tag_id = content_tags.tag_id '
+             'WHERE content_tags.path = %s')
+        db = db or self.db
+        return dict((row['name'], row['tag_id'])
+                    for row in db.fetchiter(q, (relpath,)))
+
+    def _get_or_create_tag(self, name):
+        q = self.db.Select('tag_id', sets='tags', where='name = %s')
+        row = self.db.fetchone(q, (name,))
+        if row:
+            return row['tag_id']
+        q = 'INSERT INTO tags (name) VALUES (%s) RETURNING tag_id'
+        return self.db.fetchone(q, (name,))['tag_id']
+
+    def _remove_content_tags(self, relpath):
+        q = self.db.Update('tags',
+                           count='count - 1',
+                           where=('tag_id IN (SELECT tag_id FROM content_tags'
+                                  ' WHERE path = %s)'))
+        self.db.execute(q, (relpath,))
+        q = self.db.Delete('content_tags', where='path = %s')
+        self.db.execute(q, (relpath,))
+
+    def _rebuild_tag_counts(self):
+        # drop taggings of content that did not survive the reload, and
+        # recount the remaining ones in a single pass
+        with self.db.transaction():
+            q = self.db.Delete('content_tags',
+                               where='path NOT IN (SELECT path FROM content)')
+            self.db.execute(q)
+            q = ('UPDATE tags SET count = (SELECT COUNT(*) FROM content_tags '
+                 'WHERE content_tags.tag_id = tags.tag_id)')
+            self.db.execute(q)
+
+    def add_tags(self, meta, tags):
+        """ Tag content with the specified tag names, creating the tags that
+        do not exist yet. The tag counts are updated in the same transaction.
+
+        :param meta:  ``Meta`` object of the content to be tagged
+        :param tags:  iterable of tag names
+        :returns:     dict of all tags of the content (name: tag id)
+        """
+        to_add = set(name for name in tags if name and name not in meta.tags)
+        with self.db.transaction():
+            for name in to_add:
+                tag_id = self._get_or_create_tag(name)
+                q = ('INSERT INTO content_tags (path, tag_id) '
+                     'SELECT %(path)s, %(tag_id)s WHERE NOT EXISTS ('
+                     'SELECT 1 FROM content_tags '
+                     'WHERE path = %(path)s AND tag_id = %(tag_id)s)')
+                if self.db.execute(q, dict(path=meta.path, tag_id=tag_id)):
+                    q = self.db.Update('tags',
+                                       count='count + 1',
+                                       where='tag_id = %s')
+                    self.db.execute(q, (tag_id,))
+                meta.tags[name] = tag_id
+        self._invalidate(meta.path)
+        return meta.tags
+
+    def remove_tags(self, meta, tags):
+        """ Remove the specified tag names from content. The tag counts are
+        updated in the same transaction.
+
+        :param meta:  ``Meta`` object of the content to be untagged
+        :param tags:  iterable of tag names
+        :returns:     dict of remaining tags of the content (name: tag id)
+        """
+        to_remove = set(name for name in tags if name in meta.tags)
+        with self.db.transaction():
+            for name in to_remove:
+                tag_id = meta.tags.pop(name)
+                q = self.db.Delete('content_tags',
+                                   where='path = %s AND tag_id = %s')
+                if self.db.execute(q, (meta.path, tag_id)):
+                    q = self.db.Update('tags',
+                                       count='count - 1',
+                                       where='tag_id = %s')
+                    self.db.execute(q, (tag_id,))
+        self._invalidate(meta.path)
+        return meta.tags
+
+    def get_tag_name(self, tag_id):
+        q = self.db.Select('name', sets='tags', where='tag_id = %s')
+        with self.reading() as db:
+            row = db.fetchone(q, (tag_id,))
+        return row and row['name']
+
+    def get_tag_cloud(self):
+        """ Return tags that are in use, with the number of tagged content
+        items, in descending order of their counts. Counts are maintained on
+        write, so this does not touch the tagged content at all.
+        """
+        q = self.db.Select(['tag_id', 'name', 'count'],
+                           sets='tags',
+                           where='count > 0',
+                           order=['-count', 'name'])
+        with self.reading() as db:
+            return self.many(q, table='tags', db=db) or []
+
+    def _get_listed_language(self, relpath):
+        # language under which the content is counted, if it is counted
+        q = self.db.Select('language',
+                           sets='content',
+                           where='path = %s AND disabled = false')
+        row = self.db.fetchone(q, (relpath,))
+        return row and row['language']
+
+    def _update_language_count(self, language, delta):
+        if not language:
+            return
+        q = self.db.Update('content_languages',
+                           count='count + %(delta)s',
+                           where='language = %(language)s')
+        params = dict(language=language, delta=delta)
+        if not self.db.execute(q, params) and delta > 0:
+            q = ('INSERT INTO content_languages (language, count) '
+                 'VALUES (%(language)s, %(delta)s)')
+            self.db.execute(q, params)
+
+    def _rebuild_language_counts(self):
+        with self.db.transaction():
+            q = self.db.Delete('content_languages')
+            self.db.execute(q)
+            q = ('INSERT INTO content_languages (language, count) '
+                 'SELECT language, COUNT(*) FROM content '
+                 'WHERE disabled = false AND language IS NOT NULL '
+                 'GROUP BY language')
+            self.db.execute(q)
+
+    def get_language_counts(self):
+        """ Return number of listed content items per language. Counts are
+        maintained on write, so ``content`` itself is not queried.
+
+        :returns:  dict of language codes and content counts
+        """
+        q = self.db.Select(['language', 'count'],
+                           sets='content_languages',
+                           where='count > 0')
+        with self.reading() as db:
+            return dict((row['language'], row['count'])
+                        for row in db.fetchiter(q))
+
     def get_content_languages(self):
-        q = 'SELECT DISTINCT language FROM content'
-        languages = self.db.fetchiter(q)
-        return [row['language'] for row in languages]
+        return sorted(self.get_language_counts().keys())
@@ -0,0 +1,609 @@
+"""
+archive.py: In-memory content archive
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+
+import bisect
+import contextlib
+import itertools
+import logging
+import os
+import pickle
+import re
+import threading
+
+from ...archive import BaseArchive, metadata
+from ...progress import Progress
+from ...records import Record, copy_record, record_class
+from ...suggest import SUGGEST_FIELDS, SUGGEST_LIMIT, PrefixIndex
+from ..embedded.archive import (MIN_POPULARITY, EmbeddedArchive,
+                                related_fields, serialize)
+
+
+SNAPSHOT_VERSION = 1
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+SEARCHABLE_FIELDS = ('title', 'publisher', 'keywords')
+# column defaults of the ``content`` table in the database backed backends
+CONTENT_DEFAULTS = {
+    'favorite': False,
+    'views': 0,
+    'popularity': 0.0,
+    'is_partner': False,
+    'is_sponsored': False,
+    'keywords': '',
+    'disabled': False,
+    'content_type': metadata.CONTENT_TYPES['generic'],
+}
+# stores are shared by all archive instances using the same snapshot path
+STORES = {}
+STORES_LOCK = threading.Lock()
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def make_record(table, data):
+    related = related_fields(EmbeddedArchive.schema, table)
+    fields = tuple(sorted(data)) + tuple(name for name in related
+                                         if name not in data)
+    return record_class(table, fields)(data)
+
+
+def listing_key(record):
+    """Sort key of content listings, matching ``CONTENT_ORDER``."""
+    updated = record.get('updated')
+    day = updated.date().toordinal() if updated else 0
+    return (-day, -record.get('views', 0), record['path'])
+
+
+def remove_from_index(index, key, path):
+    paths = index.get(key)
+    if paths is not None:
+        paths.discard(path)
+        if not paths:
+            del index[key]
+
+
+class MemoryStore(object):
+    """Content metadata and the indexes built over it. Only the content and
+    tag data are persisted in snapshots, the indexes are rebuilt on load."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        # serializes writes of snapshots, so an older one never replaces a
+        # newer one
+        self.snapshot_lock = threading.Lock()
+        self.deferred = 0       # number of bulk changes in progress
+        self.tags = {}          # tag name -> tag id
+        self.tag_names = {}     # tag id -> tag name
+        self.content_tags = {}  # path -> set of tag ids
+        self.last_tag_id = 0
+        self.clear()
+
+    def clear(self):
+        self.content = {}       # path -> content record
+        self.related = {}       # path -> dict of content type records
+        self.order = []         # sorted listing keys of enabled content
+        self.order_keys = {}    # path -> listing key of enabled content
+        self.languages = {}     # language -> set of enabled paths
+        self.types = {}         # content type id -> set of paths
+        self.tokens = {}        # search token -> set of paths
+        self.sorted_tokens = []
+        self.tagged = {}        # tag id -> set of paths
+        self.latest = None      # path of the most recently updated content
+        self.last_decay = None  # time of the last decay of popularity scores
+        self.suggestions = PrefixIndex()
+
+    def index(self, path):
+        record = self.content[path]
+        if not record['disabled']:
+            key = listing_key(record)
+            bisect.insort(self.order, key)
+            self.order_keys[path] = key
+            if record.get('language'):
+                self.languages.setdefault(record['language'], set()).add(path)
+            self.suggestions.add(path, record.get('language'),
+                                 [record.get(name) for name in SUGGEST_FIELDS])
+        for type_id in metadata.CONTENT_TYPES.values():
+            if record['content_type'] & type_id == type_id:
+                self.types.setdefault(type_id, set()).add(path)
+        for field in SEARCHABLE_FIELDS:
+            for token in tokenize(record.get(field)):
+                if token not in self.tokens:
+                    self.tokens[token] = set()
+                    bisect.insort(self.sorted_tokens, token)
+                self.tokens[token].add(path)
+        for tag_id in self.content_tags.get(path, ()):
+            self.tagged.setdefault(tag_id, set()).add(path)
+        updated = record.get('updated')
+        if self.latest is not None and updated is not None:
+            latest = self.content[self.latest].get('updated')
+            if latest is None or updated > latest:
+                self.latest = path
+
+    def unindex(self, path):
+        record = self.content[path]
+        key = self.order_keys.pop(path, None)
+        if key is not None:
+            del self.order[bisect.bisect_left(self.order, key)]
+        remove_from_index(self.languages, record.get('language'), path)
+        self.suggestions.remove(path)
+        for type_id in list(self.types):
+            remove_from_index(self.types, type_id, path)
+        for field in SEARCHABLE_FIELDS:
+            for token in tokenize(record.get(field)):
+                remove_from_index(self.tokens, token, path)
+                if token not in self.tokens:
+                    idx = bisect.bisect_left(self.sorted_tokens, token)
+                    if self.sorted_tokens[idx:idx + 1] == [token]:
+                        del self.sorted_tokens[idx]
+        for tag_id in self.content_tags.get(path, ()):
+            remove_from_index(self.tagged, tag_id, path)
+        if self.latest == path:
+            self.latest = None
+
+    def load_suggestions(self):
+        for (path, record) in self.content.items():
+            if not record['disabled']:
+                yield (path,
+                       record.get('language'),
+                       [record.get(name) for name in SUGGEST_FIELDS])
+
+    def get_latest(self):
+        if self.latest is None:
+            # content without a timestamp cannot be compared with the others
+            dated = [path for (path, record) in self.content.items()
+                     if record.get('updated') is not None]
+            if dated:
+                self.latest = max(dated,
+                                  key=lambda p: self.content[p]['updated'])
+        return self.latest
+
+    def snapshot(self):
+        return dict(content=self.content,
+                    related=self.related,
+                    tags=self.tags,
+                    content_tags=self.content_tags,
+                    last_tag_id=self.last_tag_id,
+                    last_decay=self.last_decay)
+
+    def restore(self, state):
+        self.clear()
+        self.tags = state['tags']
+        self.tag_names = dict((tag_id, name)
+                              for (name, tag_id) in self.tags.items())
+        self.content_tags = state['content_tags']
+        self.last_tag_id = state['last_tag_id']
+        self.content = state['content']
+        self.related = state['related']
+        self.last_decay = state.get('last_decay')
+        for path in self.content:
+            self.index(path)
+
+
+class MemoryArchive(BaseArchive):
+    """Archive keeping all metadata in memory, for small libraries and for
+    testing without a database. Lookups by path, language, content type and
+    tag are served by hash indexes, listings by an index kept sorted in
+    listing order, and searches by an inverted index of words, where each
+    word of the query is matched as a prefix of the indexed words.
+
+    The library can be persisted in a snapshot file, specified by the
+    ``snapshot`` configuration parameter, which is loaded on start. The
+    snapshot is written after each change of content and tags, and once at
+    the end of bulk changes such as reloads. Views are only saved along with
+    the next change, so those counted since are lost when interrupted."""
+    transformations = EmbeddedArchive.transformations
+    schema = EmbeddedArchive.schema
+    # content added since the last snapshot is lost when interrupted
+    resumable_reloads = False
+
+    def __init__(self, fsal, db=None, **config):
+        super(MemoryArchive, self).__init__(fsal, **config)
+        self.store = self.get_store(self.config.get('snapshot'))
+
+    @contextlib.contextmanager
+    def bulk_changes(self, progress=None):
+        """Defer writing the snapshot until the changes made within the
+        context are finished, instead of writing it after each of them."""
+        with self.store.lock:
+            self.store.deferred += 1
+        try:
+            yield
+        finally:
+            with self.store.lock:
+                self.store.deferred -= 1
+            self._save_changes(progress)
+
+    def _save_changes(self, progress=None):
+        if not self.config.get('snapshot'):
+            return
+        with self.store.lock:
+            if self.store.deferred:
+                return
+        with (progress or Progress()).stage('snapshot'):
+            self.save_snapshot()
+
+    @staticmethod
+    def get_store(snapshot=None):
+        with STORES_LOCK:
+            try:
+                return STORES[snapshot]
+            except KeyError:
+                store = MemoryStore()
+                if snapshot and os.path.exists(snapshot):
+                    load_snapshot(store, snapshot)
+                STORES[snapshot] = store
+                return store
+
+    def _select(self, terms, lang, content_type, tag):
+        """Return iterable of matching paths of enabled content in listing
+        order."""
+        store = self.store
+        sets = []
+        if lang:
+            sets.append(store.languages.get(lang, set()))
+        if content_type:
+            type_id = metadata.CONTENT_TYPES[content_type]
+            sets.append(store.types.get(type_id, set()))
+        if tag:
+            sets.append(store.tagged.get(tag, set()))
+        if terms:
+            sets.append(self._search(terms))
+
+        excluded = set()
+        if not content_type:
+            # exclude content types that cannot be displayed on the mixed type
+            # content list
+            for name in self.exclude_from_content_list:
+                type_id = metadata.CONTENT_TYPES[name]
+                excluded.update(store.types.get(type_id, ()))
+
+        if not sets:
+            return (key[-1] for key in store.order
+                    if key[-1] not in excluded)
+
+        sets.sort(key=len)
+        paths = sets[0].intersection(*sets[1:])
+        paths = [path for path in paths
+                 if path in store.order_keys and path not in excluded]
+        return sorted(paths, key=store.order_keys.__getitem__)
+
+    def _search(self, terms):
+        store = self.store
+        result = None
+        for token in tokenize(terms):
+            matches = set()
+            idx = bisect.bisect_left(store.sorted_tokens, token)
+            while (idx < len(store.sorted_tokens) and
+                   store.sorted_tokens[idx].startswith(token)):
+                matches.update(store.tokens[store.sorted_tokens[idx]])
+                idx += 1
+            result = matches if result is None else result & matches
+        return result or set()
+
+    def get_count(self, terms=None, lang=None, content_type=None, tag=None):
+        with self.store.lock:
+            paths = self._select(terms, lang, content_type, tag)
+            return sum(1 for _ in paths)
+
+    def _popular(self, paths):
+        content = self.store.content
+        return sorted(paths, key=lambda path: (
+            -content[path].get('popularity', 0), path))
+
+    def get_content(self, terms=None, offset=0, limit=0, lang=None,
+                    content_type=None, tag=None, fields=None, order=None):
+        fields = self.get_fields(fields)
+        if order not in (None, 'latest', 'popular'):
+            raise ValueError("Unknown content order '{0}'".format(order))
+        with self.store.lock:
+            paths = self._select(terms, lang, content_type, tag)
+            if order == 'popular':
+                # scores change too often to be worth keeping in an index
+                paths = self._popular(paths)
+            stop = offset + limit if limit else None
+            paths = itertools.islice(paths, offset, stop)
+            return [self._get(path, content_type, fields) for path in paths]
+
+    def iter_content(self, terms=None, lang=None, content_type=None,
+                     tag=None, fetch_size=None):
+        # everything is in memory already, so ``fetch_size`` has no effect.
+        # Records are copied before the first one is yielded, as the lock
+        # must not be held while the consumer is paused, and the generator
+        # may be resumed in another thread.
+        with self.store.lock:
+            paths = sorted(self._select(terms, lang, content_type, tag))
+            records = [self._get(path, content_type) for path in paths]
+        for record in records:
+            yield record
+
+    def suggest(self, prefix, limit=SUGGEST_LIMIT, lang=None):
+        store = self.store
+        # the store lock is taken first, as when content is indexed
+        with store.lock:
+            return store.suggestions.suggest(prefix, store.load_suggestions,
+                                             limit=limit, lang=lang)
+
+    def _get(self, relpath, content_type=None, fields=None):
+        record = self.store.content[relpath]
+        if fields is None:
+            data = copy_record(record)
+        else:
+            data = make_record('content', dict((key, record.get(key))
+                                               for key in fields))
+        if content_type in self.prefetchable_types:
+            related = self.store.related[relpath].get(content_type)
+            data[content_type] = related and copy_record(related)
+        return data
+
+    def get_single(self, relpath):
+        with self.store.lock:
+            if relpath not in self.store.content:
+                return None
+            data = self._get(relpath)
+            for (table, related) in self.store.related[relpath].items():
+                data[table] = copy_record(related)
+            data['tags'] = self._get_tags(relpath)
+            return data
+
+    def get_multiple(self, relpaths, fields=None):
+        with self.store.lock:
+            records = [self.store.content[path] for path in relpaths
+                       if path in self.store.content]
+            if fields is None:
+                return [copy_record(record) for record in records]
+            return [make_record('content', dict((key, record.get(key))
+                                                for key in fields))
+                    for record in records]
+
+    def _split(self, table, data, relpath):
+        """Turn the nested metadata into records, returning the content type
+        records separately from the content record."""
+        primitives = dict(path=relpath)
+        related = {}
+        for (key, value) in data.items():
+            if isinstance(value, (dict, Record)):
+                (record, _) = self._split(key, value, relpath)
+                related[key] = record
+            elif isinstance(value, list):
+                related[key] = [self._split(key, row, relpath)[0]
+                                for row in value]
+            else:
+                primitives[key] = value
+        if table != 'content':
+            primitives.update(related)
+            related = {}
+        return (make_record(table, primitives), related)
+
+    def _remove(self, relpath, keep_tags=False):
+        store = self.store
+        if relpath not in store.content:
+            return 0
+        store.unindex(relpath)
+        del store.content[relpath]
+        del store.related[relpath]
+        if not keep_tags:
+            store.content_tags.pop(relpath, None)
+        return 1
+
+    def add_meta_to_db(self, metadata):
+        replaces = metadata.get('replaces')
+        serialize(metadata, self.transformations)
+        for (key, value) in CONTENT_DEFAULTS.items():
+            if metadata.get(key) is None:
+                metadata[key] = value
+        relpath = metadata['path']
+        (record, related) = self._split('content', metadata, relpath)
+        with self.store.lock:
+            self._remove(relpath, keep_tags=True)
+            self.store.content[relpath] = record
+            self.store.related[relpath] = related
+            self.store.index(relpath)
+            if replaces and replaces != relpath:
+                msg = "Removing replaced content from archive database."
+                logging.debug(msg)
+                self._remove(replaces)
+        self._save_changes()
+        return True
+
+    def remove_meta_from_db(self, relpath):
+        with self.store.lock:
+            removed = self._remove(relpath)
+        if removed:
+            self._save_changes()
+        return removed
+
+    def detach_root(self, root):
+        with self.store.lock:
+            paths = [path for (path, record) in self.store.content.items()
+                     if record.get('root') == root]
+            removed = sum([self._remove(path) for path in paths])
+        if removed:
+            self._save_changes()
+        return removed
+
+    def _reload_content(self, operation, roots=None, progress=None):
+        with self.bulk_changes(progress):
+            return super(MemoryArchive, self)._reload_content(operation,
+                                                              roots,
+                                                              progress)
+
+    def clear_and_reload(self, progress=None):
+        progress = progress or Progress()
+        logging.debug('Content refill started.')
+        with self.bulk_changes(progress):
+            with self.store.lock:
+                self.store.clear()
+            rows = self._reload_content('refill', progress=progress)
+            with self.store.lock:
+                # drop taggings of content that did not survive the reload
+                for path in list(self.store.content_tags):
+                    if path not in self.store.content:
+                        del self.store.content_tags[path]
+        logging.info('Content refill finished for %s pieces of content', rows)
+
+    def last_update(self):
+        with self.store.lock:
+            latest = self.store.get_latest()
+            return latest and self.store.content[latest].get('updated')
+
+    def add_view(self, relpath):
+        store = self.store
+        with store.lock:
+            if relpath not in store.content:
+                return 0
+            store.unindex(relpath)
+            record = store.content[relpath]
+            record['views'] += 1
+            record['popularity'] = record.get('popularity', 0) + 1
+            store.index(relpath)
+            return 1
+
+    def decay_popularity(self, elapsed, decayed=None):
+        factor = self.get_decay_factor(elapsed)
+        count = 0
+        with self.store.lock:
+            for record in self.store.content.values():
+                popularity = record.get('popularity')
+                if popularity:
+                    popularity *= factor
+                    if popularity < MIN_POPULARITY:
+                        popularity = 0
+                    record['popularity'] = popularity
+                    count += 1
+            if decayed is not None:
+                self.store.last_decay = decayed
+        self._save_changes()
+        return count
+
+    def get_last_decay(self):
+        with self.store.lock:
+            return self.store.last_decay
+
+    def needs_formatting(self, relpath):
+        with self.store.lock:
+            html = self.store.related[relpath].get('html')
+            return not (html and html.get('keep_formatting'))
+
+    def _get_tags(self, relpath):
+        return dict((self.store.tag_names[tag_id], tag_id)
+                    for tag_id in self.store.content_tags.get(relpath, ()))
+
+    def add_tags(self, meta, tags):
+        store = self.store
+        with store.lock:
+            for name in tags:
+                if not name or name in meta.tags:
+                    continue
+                tag_id = store.tags.get(name)
+                if tag_id is None:
+                    store.last_tag_id += 1
+                    tag_id = store.tags[name] = store.last_tag_id
+                    store.tag_names[tag_id] = name
+                store.content_tags.setdefault(meta.path, set()).add(tag_id)
+                if meta.path in store.content:
+                    store.tagged.setdefault(tag_id, set()).add(meta.path)
+                meta.tags[name] = tag_id
+        self._save_changes()
+        return meta.tags
+
+    def remove_tags(self, meta, tags):
+        store = self.store
+        with store.lock:
+            for name in tags:
+                if name not in meta.tags:
+                    continue
+                tag_id = meta.tags.pop(name)
+                remove_from_index(store.content_tags, meta.path, tag_id)
+                remove_from_index(store.tagged, tag_id, meta.path)
+        self._save_changes()
+        return meta.tags
+
+    def get_tag_name(self, tag_id):
+        return self.store.tag_names.get(tag_id)
+
+    def get_tag_cloud(self):
+        with self.store.lock:
+            names = self.store.tag_names
+            cloud = [make_record('tags', dict(tag_id=tag_id,
+                                              name=names[tag_id],
+                                              count=len(paths)))
+                     for (tag_id, paths) in self.store.tagged.items()]
+        cloud.sort(key=lambda tag: (-tag.count, tag.name))
+        return cloud
+
+    def get_language_counts(self):
+        with self.store.lock:
+            return dict((language, len(paths))
+                        for (language, paths) in self.store.languages.items())
+
+    def get_content_languages(self):
+        return sorted(self.get_language_counts().keys())
+
+    def get_table_counts(self):
+        """Return number of records that would be stored in each of the
+        tables of the database backed backends."""
+        store = self.store
+        with store.lock:
+            counts = dict((table, 0) for table in self.schema)
+            counts['content'] = len(store.content)
+            for related in store.related.values():
+                for (table, record) in related.items():
+                    if table not in counts:
+                        continue
+                    counts[table] += 1
+                    for name in related_fields(self.schema, table):
+                        counts[name] += len(record.get(name) or ())
+            counts.update(
+                content_types=sum(len(paths)
+                                  for paths in store.types.values()),
+                content_tags=sum(len(tag_ids)
+                                 for tag_ids in store.content_tags.values()),
+                tags=len(store.tags),
+                content_languages=len(store.languages))
+            return counts
+
+    def get_orphan_counts(self):
+        # data of content is removed together with it
+        return {}
+
+    def get_library_stats(self):
+        stats = super(MemoryArchive, self).get_library_stats()
+        stats.update(suggestions=self.store.suggestions.stats())
+        return stats
+
+    def save_snapshot(self, path=None):
+        """Write the library into a snapshot file, by default the one
+        specified by the ``snapshot`` configuration parameter."""
+        path = path or self.config['snapshot']
+        with self.store.snapshot_lock:
+            with self.store.lock:
+                data = pickle.dumps((SNAPSHOT_VERSION, self.store.snapshot()),
+                                    pickle.HIGHEST_PROTOCOL)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            # replace the previous snapshot only once the new one is complete
+            os.rename(tmp_path, path)
+
+
+def load_snapshot(store, path):
+    try:
+        with open(path, 'rb') as f:
+            (version, state) = pickle.load(f)
+    except Exception as exc:
+        logging.error(u"Snapshot '{0}' cannot be read: {1}".format(path, exc))
+        return False
+    if version != SNAPSHOT_VERSION:
+        logging.info(u"Snapshot '{0}' is outdated, ignoring it.".format(path))
+        return False
+    with store.lock:
+        store.restore(state)
+    return True
@@ -0,0 +1,335 @@
+"""
+archive.py: SQLite backed content archive
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+
+import functools
+import logging
+import re
+import sqlite3
+import threading
+
+from ...pool import ConnectionPool
+from ..embedded.archive import EmbeddedArchive
+from .database import SQLiteDatabase
+
+
+# same tables as created by the content migrations of the embedded backend
+SCHEMA = """
+create table if not exists content
+(
+    path varchar primary key,
+    title varchar not null,
+    timestamp utcdatetime not null,
+    updated utcdatetime not null,
+    favorite boolean not null default 0,
+    views integer not null default 0,
+    is_partner boolean not null default 0,
+    is_sponsored boolean not null default 0,
+    publisher varchar,
+    license varchar,
+    language varchar,
+    size integer,
+    broadcast date,
+    keywords varchar not null default '',
+    disabled boolean not null default 0,
+    content_type int not null default 1,
+    cover varchar,
+    thumbnail varchar,
+    root varchar,
+    popularity real not null default 0
+);
+
+create table if not exists generic
+(
+    path varchar primary key,
+    description varchar
+);
+
+create table if not exists html
+(
+    path varchar primary key,
+    keep_formatting boolean not null default 0,
+    main varchar not null default 'index.html'
+);
+
+create table if not exists image
+(
+    path varchar primary key,
+    description varchar
+);
+
+create table if not exists album
+(
+    path varchar,
+    file varchar,
+    thumbnail varchar,
+    caption varchar,
+    title varchar,
+    resolution varchar,
+    primary key (path, file)
+);
+
+create table if not exists audio
+(
+    path varchar primary key,
+    description varchar
+);
+
+create table if not exists playlist
+(
+    path varchar,
+    file varchar,
+    title varchar,
+    duration integer,
+    primary key (path, file)
+);
+
+create table if not exists video
+(
+    path varchar primary key,
+    main varchar not null default 'video.mp4',
+    duration integer,
+    resolution varchar,
+    description varchar
+);
+
+create table if not exists app
+(
+    path varchar primary key,
+    version varchar,
+    description varchar
+);
+
+create table if not exists tags
+(
+    tag_id integer primary key,
+    name varchar not null unique,
+    count integer not null default 0
+);
+
+create table if not exists content_tags
+(
+    path varchar not null,
+    tag_id integer not null references tags(tag_id) on delete cascade,
+    primary key (path, tag_id)
+);
+
+create table if not exists content_languages
+(
+    language varchar primary key,
+    count integer not null default 0
+);
+
+create table if not exists content_types
+(
+    path varchar not null,
+    type integer not null,
+    primary key (path, type)
+);
+
+create table if not exists popularity_decay
+(
+    decayed real not null
+);
+
+create index if not exists content_tags_tag_id_idx
+    on content_tags (tag_id, path);
+create index if not exists tags_count_idx
+    on tags (count desc) where count > 0;
+drop index if exists content_listing_idx;
+drop index if exists content_language_listing_idx;
+create index if not exists content_list_covering_idx
+    on content (date(updated) desc, views desc,
+                path, title, language, content_type, thumbnail, updated)
+    where disabled = 0;
+create index if not exists content_language_list_covering_idx
+    on content (language, date(updated) desc, views desc,
+                path, title, content_type, thumbnail, updated)
+    where disabled = 0;
+create index if not exists content_popularity_idx
+    on content (popularity desc,
+                path, title, language, content_type, thumbnail, updated, views)
+    where disabled = 0;
+create index if not exists content_updated_idx on content (updated);
+create index if not exists content_root_idx on content (root);
+create index if not exists content_types_type_idx
+    on content_types (type, path);
+"""
+# columns of the content table that databases created before they were added
+# are upgraded with
+ADDED_COLUMNS = (
+    ('root', 'varchar'),
+    ('popularity', 'real not null default 0'),
+)
+# full text index over the searchable columns, kept in sync by triggers. It
+# is an external content index, keyed by the rowid of content, so rows are
+# updated and deleted by rowid instead of searching the index for them. The
+# index has to be rebuilt if rowids change, e.g. by a VACUUM.
+FTS_SCHEMA = """
+create virtual table if not exists content_fts using fts5
+(
+    title,
+    publisher,
+    keywords,
+    content='content',
+    content_rowid='rowid'
+);
+
+create trigger if not exists content_fts_insert after insert on content
+begin
+    insert into content_fts (rowid, title, publisher, keywords)
+    values (new.rowid, new.title, new.publisher, new.keywords);
+end;
+
+create trigger if not exists content_fts_delete after delete on content
+begin
+    insert into content_fts (content_fts, rowid, title, publisher, keywords)
+    values ('delete', old.rowid, old.title, old.publisher, old.keywords);
+end;
+
+create trigger if not exists content_fts_update
+after update of title, publisher, keywords on content
+begin
+    insert into content_fts (content_fts, rowid, title, publisher, keywords)
+    values ('delete', old.rowid, old.title, old.publisher, old.keywords);
+    insert into content_fts (rowid, title, publisher, keywords)
+    values (new.rowid, new.title, new.publisher, new.keywords);
+end;
+"""
+# drops the full text index of earlier versions, which stored the path of
+# content in the index, and could only find rows by scanning it
+DROP_FTS_SCHEMA = """
+drop trigger if exists content_fts_insert;
+drop trigger if exists content_fts_delete;
+drop trigger if exists content_fts_update;
+drop table if exists content_fts;
+"""
+FTS_SEARCH_CLAUSE = ('rowid IN (SELECT rowid FROM content_fts '
+                     'WHERE content_fts MATCH %(terms)s)')
+LIKE_SEARCH_CLAUSE = ('title LIKE %(terms)s OR '
+                      'publisher LIKE %(terms)s OR '
+                      'keywords LIKE %(terms)s')
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+# default number of read connections per database file
+READ_CONNECTIONS = 2
+# pools of read connections, shared by archives using the same database file
+READ_POOLS = {}
+READ_POOLS_LOCK = threading.Lock()
+
+
+def get_read_pool(path, size):
+    with READ_POOLS_LOCK:
+        try:
+            return READ_POOLS[path]
+        except KeyError:
+            factory = functools.partial(SQLiteDatabase.open,
+                                        path,
+                                        check_same_thread=False)
+            pool = READ_POOLS[path] = ConnectionPool(factory, size=size)
+            return pool
+
+
+class SQLiteArchive(EmbeddedArchive):
+    """Embedded archive stored in a SQLite database file, for devices where
+    running a database server is too expensive. The database is opened in WAL
+    mode, and FTS5 is used for searching when SQLite is built with it.
+
+    Instead of a database handle, the path to the database file is expected
+    in the ``database`` configuration parameter. Reads are served by a pool
+    of ``read_connections`` connections, so they are not blocked by writes in
+    progress."""
+    required_config_params = EmbeddedArchive.required_config_params + (
+        'database',
+    )
+    content_order = ['-date(updated)', '-views']
+    search_clause = FTS_SEARCH_CLAUSE
+
+    def __init__(self, fsal, db=None, **config):
+        super(SQLiteArchive, self).__init__(fsal, db, **config)
+        if not isinstance(db, SQLiteDatabase):
+            self.db = SQLiteDatabase.connect(self.config['database'])
+        if not self.db.initialized:
+            self.db.has_fts = self._create_schema()
+            self.db.initialized = True
+        if not self.db.has_fts:
+            self.search_clause = LIKE_SEARCH_CLAUSE
+        path = self.config['database']
+        size = int(self.config.get('read_connections', READ_CONNECTIONS))
+        # in-memory databases cannot be shared between connections
+        if 'read_pool' not in self.config and path != ':memory:' and size:
+            self.config['read_pool'] = get_read_pool(path, size)
+
+    @classmethod
+    def get_read_pool(cls, db, size=None):
+        # the pool is set up by the archive from the path of the database
+        # file, as ``db`` is not a SQLite database
+        return None
+
+    @property
+    def database_key(self):
+        # each thread has its own connection, so caches are registered under
+        # the database file, and writes of any thread invalidate them
+        path = self.config['database']
+        return self.db if path == ':memory:' else path
+
+    def _snapshot(self, db):
+        return db.snapshot()
+
+    def _count_rows(self, table, db):
+        # SQLite keeps no row count estimates, but counts rows using the
+        # smallest index of the table
+        q = self.db.Select('COUNT(*) as count', sets=table)
+        return db.fetchone(q)['count']
+
+    def _add_columns(self):
+        # columns added to the content table after its initial version
+        columns = [row['name'] for row in
+                   self.db.fetchall('PRAGMA table_info(content)')]
+        if not columns:
+            return
+        for (name, definition) in ADDED_COLUMNS:
+            if name not in columns:
+                self.db.execute('ALTER TABLE content ADD COLUMN {0} '
+                                '{1}'.format(name, definition))
+
+    def _create_schema(self):
+        self._add_columns()
+        self.db.executescript(SCHEMA)
+        columns = [row['name'] for row in
+                   self.db.fetchall('PRAGMA table_info(content_fts)')]
+        if 'path' in columns:
+            self.db.executescript(DROP_FTS_SCHEMA)
+            columns = []
+        try:
+            self.db.executescript(FTS_SCHEMA)
+        except sqlite3.OperationalError as exc:
+            logging.warning(u"Full text search is not available, falling "
+                            u"back to pattern matching: {0}".format(exc))
+            return False
+        if not columns:
+            # index content added before the index was created
+            self.db.execute("INSERT INTO content_fts (content_fts) "
+                            "VALUES ('rebuild')")
+        return True
+
+    def _search_param(self, terms):
+        if not self.db.has_fts:
+            return super(SQLiteArchive, self)._search_param(terms)
+        # every word is matched as a prefix of the indexed words
+        tokens = TOKEN_RE.findall(terms or '')
+        return ' '.join(u'"{0}"*'.format(token) for token in tokens) or '""'
+
+    def _get_or_create_tag(self, name):
+        q = self.db.Select('tag_id', sets='tags', where='name = %s')
+        row = self.db.fetchone(q, (name,))
+        if row:
+            return row['tag_id']
+        # ``RETURNING`` is not supported by older SQLite versions
+        q = 'INSERT INTO tags (name) VALUES (?)'
+        return self.db.conn.execute(q, (name,)).lastrowid
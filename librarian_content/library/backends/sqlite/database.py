@@ -0,0 +1,275 @@
+"""
+database.py: Minimal SQLite database layer
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+
+import contextlib
+import datetime
+import re
+import sqlite3
+import threading
+
+
+PLACEHOLDER_RE = re.compile(r'%\((\w+)\)s|%s|%%')
+DATETIME_FORMATS = ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S')
+# connections are not shareable between threads, so each thread gets its own
+# connection to every database file
+LOCAL = threading.local()
+
+
+def to_sqlite_params(query):
+    """Convert ``%s`` and ``%(name)s`` style placeholders used by the other
+    backends into ``?`` and ``:name`` style placeholders."""
+    def replace(match):
+        if match.group(1):
+            return ':' + match.group(1)
+        elif match.group(0) == '%s':
+            return '?'
+        return '%'
+    return PLACEHOLDER_RE.sub(replace, query)
+
+
+def adapt_datetime(value):
+    # timestamps are stored in UTC without offset, so they sort and compare
+    # correctly as text and can be used with SQLite's date functions
+    if value.tzinfo is not None:
+        value = (value - value.utcoffset()).replace(tzinfo=None)
+    return value.isoformat(' ')
+
+
+def convert_datetime(value):
+    value = value.decode('ascii') if isinstance(value, bytes) else value
+    value = value[:26]
+    for fmt in DATETIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    return datetime.datetime.strptime(value[:10], '%Y-%m-%d')
+
+
+def convert_boolean(value):
+    return bool(int(value))
+
+
+sqlite3.register_adapter(datetime.datetime, adapt_datetime)
+sqlite3.register_converter('utcdatetime', convert_datetime)
+sqlite3.register_converter('boolean', convert_boolean)
+
+
+class Where(object):
+    """Conditions of a query which are joined together with ``AND``."""
+
+    def __init__(self, condition=None):
+        self.conditions = []
+        if condition:
+            self.conditions.append(condition)
+
+    def __iadd__(self, condition):
+        self.conditions.append(condition)
+        return self
+
+    def __bool__(self):
+        return bool(self.conditions)
+
+    __nonzero__ = __bool__
+
+    def __str__(self):
+        return ' AND '.join('({0})'.format(condition)
+                            for condition in self.conditions)
+
+
+def as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+class Select(object):
+
+    def __init__(self, what='*', sets=None, where=None, order=None,
+                 limit=None, offset=None):
+        self.what = as_list(what)
+        self.sets = sets
+        self.where = Where(where)
+        self.order = as_list(order)
+        self.limit = limit
+        self.offset = offset
+
+    def order_by(self):
+        return ', '.join(('{0} DESC'.format(key[1:]) if key.startswith('-')
+                          else '{0} ASC'.format(key))
+                         for key in self.order)
+
+    def __str__(self):
+        sql = 'SELECT {0} FROM {1}'.format(', '.join(self.what), self.sets)
+        if self.where:
+            sql += ' WHERE {0}'.format(self.where)
+        if self.order:
+            sql += ' ORDER BY {0}'.format(self.order_by())
+        if self.limit or self.offset:
+            # negative limit stands for no limit at all
+            sql += ' LIMIT {0:d}'.format(self.limit or -1)
+        if self.offset:
+            sql += ' OFFSET {0:d}'.format(self.offset)
+        return sql
+
+
+class Update(object):
+
+    def __init__(self, table, where=None, **kwargs):
+        self.table = table
+        self.where = Where(where)
+        self.values = kwargs
+
+    def __str__(self):
+        values = ', '.join('{0} = {1}'.format(key, value)
+                           for (key, value) in sorted(self.values.items()))
+        sql = 'UPDATE {0} SET {1}'.format(self.table, values)
+        if self.where:
+            sql += ' WHERE {0}'.format(self.where)
+        return sql
+
+
+class Delete(object):
+
+    def __init__(self, table, where=None):
+        self.table = table
+        self.where = Where(where)
+
+    def __str__(self):
+        sql = 'DELETE FROM {0}'.format(self.table)
+        if self.where:
+            sql += ' WHERE {0}'.format(self.where)
+        return sql
+
+
+class Replace(object):
+
+    def __init__(self, table, constraints=None, cols=()):
+        self.table = table
+        self.constraints = constraints
+        self.cols = list(cols)
+
+    def __str__(self):
+        return 'INSERT OR REPLACE INTO {0} ({1}) VALUES ({2})'.format(
+            self.table,
+            ', '.join(self.cols),
+            ', '.join('%({0})s'.format(col) for col in self.cols))
+
+
+class SQLiteDatabase(object):
+    """Thin wrapper around a SQLite connection providing the query building
+    and execution interface the embedded backend expects."""
+    Select = Select
+    Update = Update
+    Delete = Delete
+    Replace = Replace
+
+    # default limit of host parameters in a single statement
+    MAX_VARIABLE_NUMBER = 999
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.depth = 0
+        self.initialized = False
+
+    @staticmethod
+    def sqlin(key, values):
+        return '{0} IN ({1})'.format(key, ', '.join(['%s'] * len(values)))
+
+    @classmethod
+    def connect(cls, path):
+        """Return the calling thread's database connected to ``path``,
+        opening it first if needed."""
+        databases = LOCAL.__dict__.setdefault('databases', {})
+        try:
+            return databases[path]
+        except KeyError:
+            databases[path] = db = cls.open(path)
+            return db
+
+    @classmethod
+    def open(cls, path, check_same_thread=True):
+        """Open a new connection to the database at ``path``. Connections
+        opened with ``check_same_thread`` disabled may be handed over to other
+        threads, as long as they are not used by two threads at once."""
+        conn = sqlite3.connect(path,
+                               detect_types=sqlite3.PARSE_DECLTYPES,
+                               isolation_level=None,
+                               check_same_thread=check_same_thread)
+        conn.row_factory = sqlite3.Row
+        if path != ':memory:':
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute('PRAGMA foreign_keys = ON')
+        # triggers must fire for rows deleted by ``INSERT OR REPLACE``
+        conn.execute('PRAGMA recursive_triggers = ON')
+        return cls(conn)
+
+    def _execute(self, query, params):
+        return self.conn.execute(to_sqlite_params(str(query)), params or ())
+
+    def execute(self, query, params=None):
+        return self._execute(query, params).rowcount
+
+    def executescript(self, sql):
+        self.conn.executescript(sql)
+
+    def fetchone(self, query, params=None):
+        return self._execute(query, params).fetchone()
+
+    def fetchall(self, query, params=None):
+        return self._execute(query, params).fetchall()
+
+    def fetchiter(self, query, params=None):
+        cursor = self._execute(query, params)
+        for row in cursor:
+            yield row
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Run the block in a transaction. Nested transactions are merged into
+        the outermost one."""
+        if self.depth:
+            self.depth += 1
+            try:
+                yield self.conn
+            finally:
+                self.depth -= 1
+            return
+
+        self.conn.execute('BEGIN IMMEDIATE')
+        self.depth = 1
+        try:
+            yield self.conn
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        else:
+            self.conn.execute('COMMIT')
+        finally:
+            self.depth = 0
+
+    @contextlib.contextmanager
+    def snapshot(self):
+        """Run the block in a read transaction, so all queries see the same
+        snapshot of the database. In WAL mode it does not block writers."""
+        if self.depth:
+            yield self.conn
+            return
+
+        self.conn.execute('BEGIN DEFERRED')
+        self.depth = 1
+        try:
+            yield self.conn
+        finally:
+            self.depth = 0
+            self.conn.execute('COMMIT')
@@ -3,6 +3,8 @@ from bottle_utils.common import to_bytes
 from librarian_core.contrib.cache.utils import generate_key
 from librarian_core.contrib.databases.utils import row_to_dict
 
+from .records import Record
+
 
 class CDFObject(object):
     """A generic factory object which gets the data for instantiation by
@@ -15,14 +17,23 @@ class CDFObject(object):
     ATTEMPT_READ_FROM_FILE = True
     ALLOW_EMPTY_INSTANCES = True
 
+    __slots__ = ('supervisor', 'path', '_data')
+
     row_to_dict = staticmethod(row_to_dict)
 
     def __init__(self, supervisor, path, data=None):
         self.supervisor = supervisor
         self.path = path
-        self._data = row_to_dict(data or dict())
+        if isinstance(data, Record):
+            # records are already compact, private copies of the row
+            self._data = data
+        else:
+            self._data = row_to_dict(data or dict())
 
     def get_data(self):
+        """Return the data as a plain dict, even if it is kept as a record."""
+        if isinstance(self._data, Record):
+            return self._data._asdict()
         return self._data
 
     def read_file(self):
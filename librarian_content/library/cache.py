@@ -0,0 +1,145 @@
+"""
+cache.py: In-process caching utilities
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+
+import collections
+import threading
+import time
+import uuid
+
+from librarian_core.contrib.cache.utils import generate_key
+
+
+MISSING = object()
+
+
+class LRUCache(object):
+    """Thread-safe cache holding at most ``size`` items, evicting the least
+    recently used ones first. Items older than ``ttl`` seconds are treated as
+    missing, a ``ttl`` of ``0`` lets them live until evicted.
+
+    Every invalidation bumps the cache ``generation``. Readers that capture it
+    before loading a value and pass it to :py:meth:`set` will not store
+    values that were loaded before a concurrent invalidation."""
+
+    def __init__(self, size, ttl=0, clock=time.time):
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.items = collections.OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=MISSING):
+        return self._get(key, default, counted=True)
+
+    def peek(self, key, default=MISSING):
+        """Return the item like :py:meth:`get`, without counting the lookup
+        in the hit and miss counts, e.g. for bookkeeping entries."""
+        return self._get(key, default, counted=False)
+
+    def _get(self, key, default, counted):
+        with self.lock:
+            try:
+                (value, expires) = self.items.pop(key)
+            except KeyError:
+                self.misses += counted
+                return default
+            if expires and expires < self.clock():
+                self.misses += counted
+                return default
+            # reinsert as the most recently used item
+            self.items[key] = (value, expires)
+            self.hits += counted
+            return value
+
+    def set(self, key, value, generation=None):
+        if self.size <= 0:
+            return
+        expires = self.clock() + self.ttl if self.ttl else 0
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.items.pop(key, None)
+            self.items[key] = (value, expires)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys):
+        with self.lock:
+            self.generation += 1
+            for key in keys:
+                self.items.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.items.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return dict(size=len(self.items),
+                        capacity=self.size,
+                        ttl=self.ttl,
+                        hits=self.hits,
+                        misses=self.misses,
+                        evictions=self.evictions,
+                        hit_ratio=float(self.hits) / lookups if lookups else 0)
+
+
+class ResultCache(object):
+    """Cache of query results, stored in any backend providing ``get(key)``
+    and ``set(key, value)`` methods, such as :py:class:`LRUCache` or the
+    cache extension. Keys include a generation token that is replaced by
+    :py:meth:`bump` on every write, so results stored before a write are
+    never found again, and are left to expire from the backend on their
+    own."""
+    GENERATION_KEY = 'content_generation'
+    KEY_TEMPLATE = 'content_results_{0}_{1}'
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _get(self, key):
+        value = self.backend.get(key)
+        return None if value is MISSING else value
+
+    @property
+    def generation(self):
+        # the generation is looked up on every access, so it is not counted
+        # in the hit ratio of backends able to leave it out
+        peek = getattr(self.backend, 'peek', self.backend.get)
+        generation = peek(self.GENERATION_KEY)
+        if generation is None or generation is MISSING:
+            generation = self.bump()
+        return generation
+
+    def bump(self):
+        # a random token is used instead of a counter, so concurrent bumps
+        # from multiple processes cannot end up with the same generation
+        generation = uuid.uuid4().hex
+        self.backend.set(self.GENERATION_KEY, generation)
+        return generation
+
+    def get(self, params, loader):
+        """Return result for the ``params`` tuple, calling ``loader`` and
+        storing the result it returns if it is not cached yet."""
+        key = self.KEY_TEMPLATE.format(self.generation, generate_key(*params))
+        cached = self._get(key)
+        if cached is not None:
+            return cached[0]
+        result = loader()
+        # wrapped, so empty results are distinguishable from missing keys
+        self.backend.set(key, (result,))
+        return result
@@ -0,0 +1,112 @@
+"""
+checkpoint.py: Durable progress of library reloads
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+
+import json
+import os
+import time
+
+
+class Checkpoint(object):
+    """Journal of a reload in progress, stored as a JSON file. The position
+    within each content root is recorded as the last processed content path,
+    as roots are scanned in a deterministic order. Interrupted reloads can
+    therefore be resumed by skipping content up to and including those
+    paths, which at most repeats the work done since the last save.
+
+    The journal keeps the state of each operation separately, so e.g.
+    attaching a root does not discard the progress of an interrupted full
+    reload."""
+
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock
+
+    def load_all(self):
+        """Return dict of operations mapped to their last saved state."""
+        try:
+            with open(self.path, 'r') as journal:
+                states = json.load(journal)
+        except (IOError, OSError, ValueError):
+            return {}
+        if 'operation' in states:
+            # journal written before states were kept per operation
+            return {states['operation']: states}
+        return states
+
+    def load(self, operation=None):
+        """Return the last saved state of ``operation``, or of the last saved
+        operation if not specified, or ``None`` if there is none."""
+        states = self.load_all()
+        if operation is not None:
+            return states.get(operation)
+        if not states:
+            return None
+        return max(states.values(), key=lambda state: state['tick'])
+
+    def start(self, operation, roots, resume=True):
+        """Return state of the unfinished ``operation`` over the same roots
+        if there is one and ``resume`` is set, otherwise the state of a new
+        one."""
+        now = self.clock()
+        if resume and self.is_pending(operation, roots):
+            state = self.load(operation)
+            state['resumed'] = state.get('resumed', 0) + 1
+            state['tick'] = now
+            return state
+        return dict(operation=operation,
+                    roots=list(roots),
+                    positions={},
+                    processed=0,
+                    added=0,
+                    resumed=0,
+                    started=now,
+                    tick=now,
+                    elapsed=0.0,
+                    finished=False)
+
+    def is_pending(self, operation, roots):
+        """Whether an unfinished ``operation`` over the roots can be
+        resumed."""
+        state = self.load(operation)
+        return bool(state and not state.get('finished') and
+                    state.get('operation') == operation and
+                    state.get('roots') == list(roots))
+
+    def advance(self, state, root, relpath, added):
+        state['positions'][root] = relpath
+        state['processed'] += 1
+        state['added'] += int(bool(added))
+
+    def save(self, state):
+        """Write the state to disk, atomically replacing the previous one of
+        the same operation, so an interruption never leaves a partially
+        written journal."""
+        now = self.clock()
+        # time spent while the process was not running is not counted
+        state['elapsed'] += now - state['tick']
+        state['tick'] = now
+        states = self.load_all()
+        states[state['operation']] = state
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as journal:
+            json.dump(states, journal)
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.rename(tmp_path, self.path)
+
+    def finish(self, state):
+        state['finished'] = True
+        self.save(state)
+
+
+def get_rate(state):
+    """Return number of processed content items per second."""
+    elapsed = state.get('elapsed') or 0
+    return state.get('processed', 0) / elapsed if elapsed else 0.0
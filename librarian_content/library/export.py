@@ -0,0 +1,104 @@
+"""
+export.py: Library export file format
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+
+import gzip
+import itertools
+import os
+import pickle
+import time
+
+
+EXPORT_FORMAT = 'librarian-content-export'
+EXPORT_VERSION = 1
+# number of rows stored in a single chunk of the file
+CHUNK_SIZE = 1000
+
+
+class ExportError(Exception):
+    """ Raised when an export file cannot be read """
+    pass
+
+
+def chunks(rows, size=CHUNK_SIZE):
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_export(path, tables):
+    """Write the tables into an export file at ``path``. The file is a gzip
+    compressed stream of pickled chunks: a header, and for each table its
+    name and column names followed by chunks of row tuples, and a trailer
+    with the row counts, which marks the file as complete. Only one chunk is
+    held in memory at a time, both when writing and reading.
+
+    Files are meant to be exchanged between trusted devices only, as
+    unpickling data from untrusted sources is not safe.
+
+    :param path:    path of the export file
+    :param tables:  iterable of ``(name, columns, rows)`` tuples, where rows
+                    is an iterable of tuples of column values
+    :returns:       dict of table names mapped to the number of rows"""
+    counts = {}
+    tmp_path = path + '.tmp'
+    with gzip.open(tmp_path, 'wb') as f:
+        def dump(obj):
+            pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+        dump((EXPORT_FORMAT, EXPORT_VERSION, time.time()))
+        for (name, columns, rows) in tables:
+            dump(('table', name, tuple(columns)))
+            counts[name] = 0
+            for chunk in chunks(rows):
+                dump(('rows', chunk))
+                counts[name] += len(chunk)
+        dump(('end', counts))
+    # an incomplete file never replaces a previous export
+    os.rename(tmp_path, path)
+    return counts
+
+
+def read_export(path):
+    """Read the export file at ``path``, yielding ``(name, columns, rows)``
+    tuples for each chunk of rows, where rows is a list of tuples. Raises
+    :py:exc:`ExportError` if the file is not a complete export of a
+    supported version, after yielding the chunks that precede the damage."""
+    try:
+        f = gzip.open(path, 'rb')
+    except (IOError, OSError) as exc:
+        raise ExportError(u"Export '{0}' cannot be read: {1}".format(path,
+                                                                     exc))
+    with f:
+        def load():
+            try:
+                return pickle.load(f)
+            except EOFError:
+                raise ExportError(u"Export '{0}' is incomplete".format(path))
+            except Exception as exc:
+                raise ExportError(u"Export '{0}' cannot be read: "
+                                  u"{1}".format(path, exc))
+
+        header = load()
+        if not isinstance(header, tuple) or header[0] != EXPORT_FORMAT:
+            raise ExportError(u"'{0}' is not a library export".format(path))
+        if header[1] != EXPORT_VERSION:
+            raise ExportError(u"Export '{0}' has unsupported version "
+                              u"{1}".format(path, header[1]))
+        (name, columns) = (None, None)
+        while True:
+            item = load()
+            if item[0] == 'table':
+                (_, name, columns) = item
+            elif item[0] == 'rows':
+                yield (name, columns, item[1])
+            elif item[0] == 'end':
+                return
@@ -183,9 +183,12 @@ def process_meta(meta):
     return meta
 
 
-def get_meta(basedir, relpath, meta_filenames, encoding='utf8'):
+def get_meta(basedir, relpath, meta_filenames, encoding='utf8',
+             sidecars=None):
     """Find a meta file at the specified path, read, parse, validate and
-    then return it."""
+    then return it. If ``sidecars`` (a :py:class:`~.sidecar.SidecarCache`)
+    is passed, metadata of unchanged meta files is loaded from it instead,
+    and freshly processed metadata is stored in it."""
     meta_paths = (os.path.abspath(os.path.join(basedir, relpath, filename))
                   for filename in meta_filenames)
     try:
@@ -194,15 +197,23 @@ def get_meta(basedir, relpath, meta_filenames, encoding='utf8'):
         raise ValidationError(relpath, 'missing metadata file')
     else:
         try:
+            if sidecars is not None:
+                key = sidecars.get_key(path)
+                meta = sidecars.load(basedir, relpath, key)
+                if meta is not None:
+                    return meta
             with open(path, 'rb') as f:
                 raw_meta = json.load(f, encoding)
-                return process_meta(raw_meta)
+                meta = process_meta(raw_meta)
         except MetadataError as exc:
             raise ValidationError(path, str(exc))
         except (KeyError, ValueError):
             raise ValidationError(path, 'malformed metadata file')
         except (OSError, IOError):
             raise ValidationError(path, 'metadata file cannot be opened')
+        if sidecars is not None:
+            sidecars.save(basedir, relpath, key, meta)
+        return meta
 
 
 def determine_content_type(meta):
@@ -225,16 +236,37 @@ class Meta(CDFObject):
     ATTEMPT_READ_FROM_FILE = False
     ALLOW_EMPTY_INSTANCES = False
 
+    __slots__ = ('_tags',)
+
     def __init__(self, *args, **kwargs):
         super(Meta, self).__init__(*args, **kwargs)
-        self.tags = json.loads(self._data.get('tags') or '{}')
+        self._tags = None
 
     def __getattr__(self, attr):
+        if attr in self.__slots__ or attr in CDFObject.__slots__:
+            # unset slot, avoid recursing into ``_data`` lookups
+            raise AttributeError(attr)
         try:
             return self._data[attr]
         except KeyError:
             raise AttributeError("Attribute or key '%s' not found" % attr)
 
+    @property
+    def tags(self):
+        """ Tags of the content, decoded on first access only """
+        if self._tags is None:
+            tags = self._data.get('tags')
+            if isinstance(tags, dict):
+                # backends with normalized tag storage provide a decoded dict
+                self._tags = tags
+            else:
+                self._tags = json.loads(tags or '{}')
+        return self._tags
+
+    @tags.setter
+    def tags(self, value):
+        self._tags = value
+
     def __getitem__(self, key):
         return self._data[key]
 
@@ -0,0 +1,105 @@
+"""
+pool.py: Pool of database connections
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+
+import contextlib
+import threading
+import time
+
+
+# default maximum number of connections in a pool
+POOL_SIZE = 2
+# default number of seconds to wait for a free connection
+POOL_TIMEOUT = 10
+
+
+class PoolTimeout(Exception):
+    """ Raised when no connection is released in time """
+    pass
+
+
+class ConnectionPool(object):
+    """Thread-safe pool of up to ``size`` database handles, created lazily by
+    the ``factory`` callable. Each handle is used by a single thread at a
+    time, so handles that must not be shared across threads concurrently,
+    such as SQLite connections, can be pooled as well."""
+
+    def __init__(self, factory, size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 clock=time.time):
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self.clock = clock
+        self.cond = threading.Condition()
+        self.idle = []
+        self.created = 0
+        self.acquired = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+    def acquire(self):
+        """Return an idle handle, or a new one if the pool is not full yet.
+        Otherwise wait for a handle to be released, raising
+        :py:exc:`PoolTimeout` if that does not happen within ``timeout``
+        seconds."""
+        start = self.clock()
+        blocked = False
+        with self.cond:
+            while not self.idle and self.created >= self.size:
+                blocked = True
+                remaining = self.timeout - (self.clock() - start)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout('No database connection released '
+                                      'within {0}s'.format(self.timeout))
+                self.cond.wait(remaining)
+            self.acquired += 1
+            if blocked:
+                waited = self.clock() - start
+                self.waits += 1
+                self.wait_time += waited
+                self.max_wait = max(self.max_wait, waited)
+            if self.idle:
+                return self.idle.pop()
+            # reserve the slot, the handle is created outside of the lock
+            self.created += 1
+        try:
+            return self.factory()
+        except Exception:
+            with self.cond:
+                self.created -= 1
+                self.cond.notify()
+            raise
+
+    def release(self, db):
+        with self.cond:
+            self.idle.append(db)
+            self.cond.notify()
+
+    @contextlib.contextmanager
+    def connection(self):
+        db = self.acquire()
+        try:
+            yield db
+        finally:
+            self.release(db)
+
+    def stats(self):
+        with self.cond:
+            return dict(size=self.size,
+                        created=self.created,
+                        idle=len(self.idle),
+                        in_use=self.created - len(self.idle),
+                        acquired=self.acquired,
+                        waits=self.waits,
+                        wait_time=self.wait_time,
+                        max_wait=self.max_wait,
+                        timeouts=self.timeouts)
@@ -0,0 +1,102 @@
+"""
+progress.py: Progress reporting of library reloads
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+
+import collections
+import contextlib
+import time
+
+
+# default number of seconds between progress reports
+REPORT_INTERVAL = 5
+
+
+class Progress(object):
+    """Counts of content processed by a reload, and time spent in each of
+    its stages. While the reload is running, ``callback`` is invoked with the
+    progress object at most every ``interval`` seconds.
+
+    Content counts are kept as plain numbers, so memory use does not grow
+    with the size of the library. ``total`` is the expected number of
+    content items, if known, and is used to estimate the remaining time."""
+
+    def __init__(self, total=None, callback=None, interval=REPORT_INTERVAL,
+                 clock=time.time):
+        self.total = total
+        self.callback = callback
+        self.interval = interval
+        self.clock = clock
+        self.started = self.last_report = clock()
+        self.processed = 0
+        self.added = 0
+        self.failed = 0
+        self.skipped = 0
+        self.stages = collections.OrderedDict()
+
+    @property
+    def elapsed(self):
+        return self.clock() - self.started
+
+    @property
+    def rate(self):
+        """Number of processed content items per second."""
+        elapsed = self.elapsed
+        return self.processed / elapsed if elapsed else 0.0
+
+    @property
+    def eta(self):
+        """Estimated number of seconds until the reload finishes, or
+        ``None`` if it cannot be estimated."""
+        rate = self.rate
+        if not self.total or not rate:
+            return None
+        remaining = self.total - self.processed - self.skipped
+        return max(remaining, 0) / rate
+
+    def add_time(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Context manager adding the time spent within it to the stage."""
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.add_time(name, self.clock() - start)
+
+    def timed(self, iterable, stage):
+        """Iterate over ``iterable``, adding the time spent waiting for its
+        items to the stage."""
+        iterator = iter(iterable)
+        while True:
+            start = self.clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(stage, self.clock() - start)
+                return
+            self.add_time(stage, self.clock() - start)
+            yield item
+
+    def update(self, added):
+        """Count a processed content item, and report progress if it is
+        time to."""
+        self.processed += 1
+        if added:
+            self.added += 1
+        else:
+            self.failed += 1
+        if self.clock() - self.last_report >= self.interval:
+            self.report()
+
+    def report(self):
+        self.last_report = self.clock()
+        if self.callback:
+            self.callback(self)
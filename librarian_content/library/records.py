@@ -0,0 +1,220 @@
+"""
+records.py: Compact representation of database rows
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+
+import sys
+
+try:
+    intern = intern  # python 2 builtin
+except NameError:
+    intern = sys.intern
+
+
+MISSING = object()
+# generated record classes, keyed by table name and field names
+REGISTRY = {}
+
+
+class Record(object):
+    """Mapping-like representation of a single row. Subclasses are generated
+    per table by :py:func:`record_class`, storing the column values in
+    ``__slots__``, so no per-instance dict (or copy of the key names) is
+    allocated. Keys that are not known in advance are kept in a lazily
+    created ``_extra`` dict.
+
+    Values can be accessed both as keys and as attributes."""
+    __slots__ = ('_extra',)
+    _table = None
+    _fields = ()
+
+    def __init__(self, *args, **kwargs):
+        for (key, value) in dict(*args, **kwargs).items():
+            self[key] = value
+
+    @classmethod
+    def from_row(cls, row):
+        obj = cls.__new__(cls)
+        for key in row.keys():
+            obj[key] = row[key]
+        return obj
+
+    def __getattr__(self, name):
+        # invoked only for names not found through the regular lookup, which
+        # includes unset slots
+        if name == '_extra':
+            raise AttributeError(name)
+        try:
+            return self._extra[name]
+        except (AttributeError, KeyError):
+            raise AttributeError("Attribute or key '%s' not found" % name)
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            value = getattr(self, key, MISSING)
+            if value is not MISSING:
+                return value
+        else:
+            extra = getattr(self, '_extra', None)
+            if extra is not None and key in extra:
+                return extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._fields:
+            setattr(self, key, value)
+            return
+        try:
+            self._extra[key] = value
+        except AttributeError:
+            self._extra = {key: value}
+
+    def __delitem__(self, key):
+        if key in self._fields:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        else:
+            extra = getattr(self, '_extra', None)
+            if extra is None:
+                raise KeyError(key)
+            del extra[key]
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if not hasattr(other, 'keys'):
+            return NotImplemented
+        return self.to_dict() == dict((key, other[key])
+                                      for key in other.keys())
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '<{0} {1!r}>'.format(type(self).__name__, self.to_dict())
+
+    def __reduce__(self):
+        # generated classes cannot be looked up by name when unpickling
+        return (make_record, (self._table, self._fields, self.to_dict()))
+
+    def keys(self):
+        keys = [key for key in self._fields
+                if getattr(self, key, MISSING) is not MISSING]
+        keys.extend(getattr(self, '_extra', None) or ())
+        return keys
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, *args, **kwargs):
+        for (key, value) in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def _asdict(self):
+        """Return the record as a plain dict, converting the nested records
+        as well, e.g. for ``json.dumps`` and for callers that check for
+        ``dict`` instances, which records are not."""
+        return dict((key, as_plain(value)) for (key, value) in self.items())
+
+
+RESERVED_NAMES = frozenset(dir(Record))
+
+
+def record_class(table, fields):
+    """Return record class for the specified table with a slot for each of
+    the passed in field names. Classes are generated once and reused for all
+    subsequent rows with the same shape."""
+    fields = tuple(fields)
+    try:
+        return REGISTRY[(table, fields)]
+    except KeyError:
+        pass
+
+    slots = tuple(intern(str(name)) for name in fields)
+    reserved = RESERVED_NAMES.intersection(slots)
+    if reserved:
+        raise ValueError("Field names clash with record attributes: "
+                         "{0}".format(', '.join(sorted(reserved))))
+
+    name = '{0}Record'.format((table or '').title().replace('_', ''))
+    cls = type(str(name), (Record,), dict(__slots__=slots,
+                                          _table=table,
+                                          _fields=slots))
+    REGISTRY[(table, fields)] = cls
+    return cls
+
+
+def as_plain(value):
+    """Return the value with records converted into plain dicts, including
+    the ones found in lists and dicts."""
+    if isinstance(value, Record):
+        return value._asdict()
+    if isinstance(value, list):
+        return [as_plain(item) for item in value]
+    if isinstance(value, dict):
+        return dict((key, as_plain(item)) for (key, item) in value.items())
+    return value
+
+
+def copy_record(record):
+    """Return a copy of the record, copying the nested records, lists and
+    dicts as well, so the copy can be modified freely."""
+    copy = type(record).from_row(record)
+    for key in copy.keys():
+        value = copy[key]
+        if isinstance(value, Record):
+            copy[key] = copy_record(value)
+        elif isinstance(value, list):
+            copy[key] = [copy_record(item) if isinstance(item, Record)
+                         else item for item in value]
+        elif isinstance(value, dict):
+            copy[key] = dict(value)
+    return copy
+
+
+def make_record(table, fields, data):
+    return record_class(table, fields)(data)
+
+
+def to_record(row, table=None, extra_fields=()):
+    """Convert a database row into a record of the specified table. Names in
+    ``extra_fields`` are given a slot as well, and are meant for related data
+    that is attached to the record after it was fetched."""
+    fields = tuple(row.keys())
+    fields += tuple(name for name in extra_fields if name not in fields)
+    return record_class(table, fields).from_row(row)
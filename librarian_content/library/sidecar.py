@@ -0,0 +1,108 @@
+"""
+sidecar.py: Cache of processed metadata
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+
+import datetime
+import logging
+import os
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import outernet_metadata
+
+
+SIDECAR_FORMAT = 'librarian-content-sidecar'
+# must be increased whenever processing of metadata files or the format of
+# sidecars changes, so sidecars written by previous versions are not used
+SIDECAR_VERSION = 3
+SIDECAR_NAME = '.metacache'
+# version of the validator the metadata was processed by
+VALIDATOR_VERSION = getattr(outernet_metadata, '__version__', None)
+
+
+class UTC(datetime.tzinfo):
+    """UTC timezone of aware datetimes restored from sidecars."""
+
+    def utcoffset(self, dt):
+        return datetime.timedelta(0)
+
+    def tzname(self, dt):
+        return 'UTC'
+
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+
+class SidecarCache(object):
+    """Stores processed metadata of a content item in a sidecar file, in a
+    directory tree under ``directory`` mirroring the content roots and the
+    content directories within them, so content found at the same path in
+    two roots has a sidecar of its own in each.
+
+    Sidecars are never stored in the content directories themselves, as
+    they would be reported as changes of the content, and their contents
+    could be planted by whoever supplied the content. A sidecar is a pickled
+    header with the format and version, followed by the pickled key and
+    metadata, so datetimes are stored as they are, without encoding them.
+
+    Each sidecar is stored with a key made of the name, modification time
+    and size of the metadata file it was processed from, and the versions of
+    the processing and the validator, and is used only as long as the key
+    matches. Files that cannot be written are silently skipped."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get_path(self, root, relpath):
+        # absolute root paths are mirrored below the directory as relative
+        # ones, which keeps the roots apart without any lookups
+        root = os.path.abspath(root).lstrip(os.sep)
+        return os.path.join(self.directory, root, relpath, SIDECAR_NAME)
+
+    @staticmethod
+    def get_key(meta_path):
+        stat = os.stat(meta_path)
+        return [SIDECAR_VERSION,
+                VALIDATOR_VERSION,
+                os.path.basename(meta_path),
+                stat.st_mtime,
+                stat.st_size]
+
+    def load(self, root, relpath, key):
+        """Return the metadata stored under the matching key, or ``None`` if
+        there is no such sidecar."""
+        try:
+            with open(self.get_path(root, relpath), 'rb') as f:
+                if pickle.load(f) != (SIDECAR_FORMAT, SIDECAR_VERSION):
+                    return None
+                (stored_key, meta) = pickle.load(f)
+            return meta if stored_key == key else None
+        except Exception:
+            return None
+
+    def save(self, root, relpath, key, meta):
+        path = self.get_path(root, relpath)
+        tmp_path = path + '.tmp'
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((SIDECAR_FORMAT, SIDECAR_VERSION), f,
+                            pickle.HIGHEST_PROTOCOL)
+                pickle.dump((key, meta), f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_path, path)
+        except (IOError, OSError, TypeError, ValueError,
+                pickle.PicklingError) as exc:
+            logging.debug(u"Sidecar of '{0}' cannot be written: "
+                          u"{1}".format(relpath, exc))
+            return False
+        return True
@@ -0,0 +1,75 @@
+"""
+stats.py: Performance statistics of the library
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+
+import functools
+import threading
+import time
+
+
+# number of slowest queries kept by the query log
+SLOW_QUERIES = 10
+# queries older than this many seconds are dropped from the query log
+QUERY_WINDOW = 3600
+
+
+class QueryLog(object):
+    """Record of the ``size`` slowest queries run in the last ``window``
+    seconds. Only the slowest queries are kept, so recording a query takes
+    constant time and memory, but a query may be missing once a slower one
+    that pushed it out expires."""
+
+    def __init__(self, size=SLOW_QUERIES, window=QUERY_WINDOW,
+                 clock=time.time):
+        self.size = size
+        self.window = window
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.queries = []
+        self.count = 0
+
+    def _expire(self, now):
+        self.queries = [query for query in self.queries
+                        if now - query['time'] <= self.window]
+
+    def record(self, name, params, duration):
+        now = self.clock()
+        with self.lock:
+            self.count += 1
+            self._expire(now)
+            if (len(self.queries) >= self.size and
+                    duration <= self.queries[-1]['duration']):
+                return
+            self.queries.append(dict(name=name,
+                                     params=params,
+                                     duration=duration,
+                                     time=now))
+            self.queries.sort(key=lambda query: -query['duration'])
+            del self.queries[self.size:]
+
+    def slowest(self):
+        """Return list of the recorded queries, the slowest first."""
+        with self.lock:
+            self._expire(self.clock())
+            return [dict(query) for query in self.queries]
+
+
+def timed_query(func):
+    """Record the time taken by the decorated archive method in the
+    ``query_log`` of the archive."""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        start = time.time()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            params = args + tuple(sorted(kwargs.items()))
+            self.query_log.record(func.__name__.lstrip('_'), params,
+                                  time.time() - start)
+    return wrapper
@@ -0,0 +1,167 @@
+"""
+suggest.py: Prefix index of titles and publishers
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+
+import bisect
+import re
+import threading
+
+
+SUGGEST_FIELDS = ('title', 'publisher')
+# default number of returned suggestions
+SUGGEST_LIMIT = 10
+# texts are matched from the start of each of their first words only, which
+# bounds the number of keys a single text adds to the index
+MAX_WORDS = 8
+# separates the key from the text in index entries, sorting before any
+# character that can appear in a key
+SEPARATOR = u'\x00'
+
+WHITESPACE_RE = re.compile(r'\s+', re.UNICODE)
+
+
+def normalize(text):
+    return WHITESPACE_RE.sub(u' ', text).strip().lower()
+
+
+def get_keys(text):
+    """Return the normalized text starting at each of its first words."""
+    words = normalize(text).split(u' ')
+    return [u' '.join(words[i:]) for i in range(min(len(words), MAX_WORDS))
+            if words[i]]
+
+
+def get_entries(texts):
+    """Return set of index entries of the texts, made of each key followed
+    by the text it was made of."""
+    entries = set()
+    for text in texts:
+        if text:
+            for key in get_keys(text):
+                entries.add(key + SEPARATOR + text)
+    return entries
+
+
+class PrefixIndex(object):
+    """Sorted arrays of the titles and publishers of enabled content, one for
+    all content and one per language, keyed by the normalized text starting
+    at each word, so suggestions for a prefix are found by bisection.
+
+    Texts shared by multiple content items, e.g. publishers, are stored once
+    and reference counted. The index is built on first use by the loader
+    passed to :py:meth:`suggest`. Updates of content are applied only while
+    the index is built, so bulk changes can :py:meth:`reset` it instead, and
+    leave it to be rebuilt lazily."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.built = False
+            self.entries = {}   # language -> sorted list of entries
+            self.counts = {}    # (language, entry) -> number of references
+            self.paths = {}     # path -> (language, entries)
+
+    def _build(self, loader):
+        # entries are sorted once at the end, instead of inserted one by one
+        for (path, language, texts) in loader():
+            entries = get_entries(texts)
+            for entry in entries:
+                self._count(None, entry)
+                if language:
+                    self._count(language, entry)
+            self.paths[path] = (language, entries)
+        for (language, entry) in self.counts:
+            self.entries.setdefault(language, []).append(entry)
+        for entries in self.entries.values():
+            entries.sort()
+        self.built = True
+
+    def _count(self, language, entry):
+        key = (language, entry)
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def _insert(self, language, entry):
+        key = (language, entry)
+        count = self.counts.get(key, 0)
+        if not count:
+            bisect.insort(self.entries.setdefault(language, []), entry)
+        self.counts[key] = count + 1
+
+    def _delete(self, language, entry):
+        key = (language, entry)
+        count = self.counts.pop(key) - 1
+        if count:
+            self.counts[key] = count
+            return
+        entries = self.entries[language]
+        del entries[bisect.bisect_left(entries, entry)]
+        if not entries:
+            del self.entries[language]
+
+    def _remove(self, path):
+        (language, entries) = self.paths.pop(path, (None, ()))
+        for entry in entries:
+            self._delete(None, entry)
+            if language:
+                self._delete(language, entry)
+
+    def _add(self, path, language, texts):
+        self._remove(path)
+        entries = get_entries(texts)
+        for entry in entries:
+            self._insert(None, entry)
+            if language:
+                self._insert(language, entry)
+        self.paths[path] = (language, entries)
+
+    def add(self, path, language, texts):
+        """Add or update the texts of the content at ``path``."""
+        with self.lock:
+            if self.built:
+                self._add(path, language, texts)
+
+    def remove(self, path):
+        with self.lock:
+            if self.built:
+                self._remove(path)
+
+    def suggest(self, prefix, loader, limit=SUGGEST_LIMIT, lang=None):
+        """Return up to ``limit`` distinct texts with a word starting with
+        ``prefix``, ordered by the matched part of the text. If the index is
+        not built, it is built from the ``(path, language, texts)`` tuples
+        returned by ``loader`` first."""
+        prefix = normalize(prefix or u'')
+        if not prefix:
+            return []
+        with self.lock:
+            if not self.built:
+                self._build(loader)
+            entries = self.entries.get(lang or None, [])
+            index = bisect.bisect_left(entries, prefix)
+            found = []
+            seen = set()
+            while index < len(entries) and len(found) < limit:
+                entry = entries[index]
+                if not entry.startswith(prefix):
+                    break
+                text = entry.split(SEPARATOR, 1)[1]
+                if text not in seen:
+                    seen.add(text)
+                    found.append(text)
+                index += 1
+            return found
+
+    def stats(self):
+        with self.lock:
+            return dict(built=self.built,
+                        content=len(self.paths),
+                        entries=len(self.entries.get(None, ())))
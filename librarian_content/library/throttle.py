@@ -0,0 +1,148 @@
+"""
+throttle.py: Rate limiting of content ingest
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+
+import contextlib
+import threading
+import time
+
+
+# seconds between checks whether foreground reads have finished
+YIELD_STEP = 0.05
+# maximum number of seconds ingest of a single item yields to foreground
+# reads, so ingest is slowed down, but never stopped by constant browsing
+MAX_YIELD = 1.0
+
+# throttles shared by all archives, keyed by their rates
+THROTTLES = {}
+THROTTLES_LOCK = threading.Lock()
+
+
+class Foreground(object):
+    """Counter of reads serving user requests that are in progress."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+
+    @contextlib.contextmanager
+    def reading(self):
+        with self.lock:
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def is_busy(self):
+        return self.active > 0
+
+
+FOREGROUND = Foreground()
+
+
+class TokenBucket(object):
+    """Allows ``rate`` tokens per second on average, and bursts of up to
+    ``burst`` tokens (defaulting to one second worth of them)."""
+
+    def __init__(self, rate, burst=None, clock=time.time, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.tokens = self.burst
+        self.last = clock()
+        self.wait_time = 0.0
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def consume(self, tokens=1):
+        """Take the tokens, blocking until they are available. Returns the
+        number of seconds spent waiting."""
+        with self.lock:
+            self._refill()
+            # the tokens are taken in advance, so concurrent consumers queue
+            # up behind each other instead of all waking at the same time
+            self.tokens -= tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+            self.wait_time += wait
+        if wait:
+            self.sleep(wait)
+        return wait
+
+
+class IngestThrottle(object):
+    """Limits the pace at which content is added to or removed from the
+    library to ``rate`` items per second, and the filesystem and FSAL
+    operations performed in the process to ``io_rate`` per second. Either
+    limit may be 0 to disable it. Before each item, ingest also waits while
+    foreground reads are in progress, for up to ``max_yield`` seconds."""
+
+    def __init__(self, rate=0, io_rate=0, max_yield=MAX_YIELD,
+                 foreground=FOREGROUND, clock=time.time, sleep=time.sleep):
+        self.items = rate and TokenBucket(rate, clock=clock, sleep=sleep)
+        self.io = io_rate and TokenBucket(io_rate, clock=clock, sleep=sleep)
+        self.max_yield = max_yield
+        self.foreground = foreground
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.item_count = 0
+        self.io_count = 0
+        self.yields = 0
+        self.yield_time = 0.0
+
+    def item(self):
+        """Wait until the next content item may be processed."""
+        if self.items:
+            self.items.consume()
+        start = self.clock()
+        waited = 0
+        while (self.foreground.is_busy() and waited < self.max_yield):
+            self.sleep(YIELD_STEP)
+            waited = self.clock() - start
+        with self.lock:
+            self.item_count += 1
+            if waited:
+                self.yields += 1
+                self.yield_time += waited
+
+    def io_op(self, count=1):
+        """Wait until ``count`` I/O operations may be performed."""
+        if self.io:
+            self.io.consume(count)
+        with self.lock:
+            self.io_count += count
+
+    def stats(self):
+        with self.lock:
+            return dict(items=self.item_count,
+                        io=self.io_count,
+                        item_wait=self.items.wait_time if self.items else 0.0,
+                        io_wait=self.io.wait_time if self.io else 0.0,
+                        yields=self.yields,
+                        yield_time=self.yield_time)
+
+
+def get_throttle(rate=0, io_rate=0):
+    """Return the throttle shared by all archives ingesting at the same
+    rates, so the limits hold across archive instances and threads."""
+    key = (float(rate or 0), float(io_rate or 0))
+    with THROTTLES_LOCK:
+        try:
+            return THROTTLES[key]
+        except KeyError:
+            throttle = THROTTLES[key] = IngestThrottle(*key)
+            return throttle
@@ -0,0 +1,22 @@
+SQL = """
+create table tags
+(
+    tag_id serial primary key,
+    name varchar not null unique,
+    count integer not null default 0  -- number of tagged content items
+);
+
+create table content_tags
+(
+    path varchar not null,
+    tag_id integer not null references tags(tag_id) on delete cascade,
+    primary key (path, tag_id)
+);
+
+create index content_tags_tag_id_idx on content_tags (tag_id, path);
+create index tags_count_idx on tags (count desc) where count > 0;
+"""
+
+
+def up(db, conf):
+    db.executescript(SQL)
@@ -0,0 +1,16 @@
+SQL = """
+create table content_languages
+(
+    language varchar primary key,
+    count integer not null default 0  -- number of enabled content items
+);
+
+insert into content_languages (language, count)
+select language, count(*) from content
+where disabled = false and language is not null
+group by language;
+"""
+
+
+def up(db, conf):
+    db.executescript(SQL)
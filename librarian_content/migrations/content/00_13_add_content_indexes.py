@@ -0,0 +1,19 @@
+# ``date(updated)`` depends on the session time zone, so it is not allowed in
+# an index expression. Listings are ordered by the UTC date instead, which is
+# what ``updated`` (written as UTC) is meant to represent, and it must match
+# ``CONTENT_ORDER`` of the embedded backend exactly for the index to be used.
+SQL = """
+create index content_listing_idx
+    on content (date(timezone('UTC', updated)) desc, views desc)
+    where disabled = false;
+
+create index content_language_listing_idx
+    on content (language, date(timezone('UTC', updated)) desc, views desc)
+    where disabled = false;
+
+create index content_updated_idx on content (updated);
+"""
+
+
+def up(db, conf):
+    db.executescript(SQL)
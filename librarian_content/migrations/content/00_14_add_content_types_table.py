@@ -0,0 +1,20 @@
+SQL = """
+create table content_types
+(
+    path varchar not null,
+    type integer not null,  -- a single content type id
+    primary key (path, type)
+);
+
+create index content_types_type_idx on content_types (type, path);
+
+insert into content_types (path, type)
+select content.path, types.id
+from content
+join (values (1), (2), (4), (8), (16), (32)) as types (id)
+    on (content.content_type & types.id) = types.id;
+"""
+
+
+def up(db, conf):
+    db.executescript(SQL)
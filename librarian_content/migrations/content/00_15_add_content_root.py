@@ -0,0 +1,10 @@
+SQL = """
+-- content root in which the content was found, set when it is (re)loaded
+alter table content add column root varchar;
+
+create index content_root_idx on content (root);
+"""
+
+
+def up(db, conf):
+    db.executescript(SQL)
@@ -0,0 +1,22 @@
+# The listing indexes are extended with the columns of the ``list`` projection
+# of content, so list pages are answered by index-only scans. The columns are
+# appended to the keys, as ``INCLUDE`` is not supported by older PostgreSQL
+# versions, and the order of the leading keys still matches ``CONTENT_ORDER``.
+SQL = """
+drop index content_listing_idx;
+drop index content_language_listing_idx;
+
+create index content_list_covering_idx
+    on content (date(timezone('UTC', updated)) desc, views desc,
+                path, title, language, content_type, thumbnail, updated)
+    where disabled = false;
+
+create index content_language_list_covering_idx
+    on content (language, date(timezone('UTC', updated)) desc, views desc,
+                path, title, content_type, thumbnail, updated)
+    where disabled = false;
+"""
+
+
+def up(db, conf):
+    db.executescript(SQL)
@@ -0,0 +1,19 @@
+# Popularity score of content, increased by each view and decayed over time by
+# a periodic task. Existing content starts with its all-time view count. The
+# index covers the columns of the ``list`` projection like the listing
+# indexes (see 00_16).
+SQL = """
+alter table content
+    add column popularity double precision not null default 0;
+
+update content set popularity = views;
+
+create index content_popularity_idx
+    on content (popularity desc,
+                path, title, language, content_type, thumbnail, updated, views)
+    where disabled = false;
+"""
+
+
+def up(db, conf):
+    db.executescript(SQL)
@@ -0,0 +1,13 @@
+# Time of the last decay of popularity scores (see 00_17), as a UNIX
+# timestamp, so scores are decayed by the time actually elapsed since, even
+# across restarts. The table holds at most one row.
+SQL = """
+create table popularity_decay
+(
+    decayed double precision not null
+);
+"""
+
+
+def up(db, conf):
+    db.executescript(SQL)
@@ -0,0 +1,160 @@
+"""
+scheduler.py: Adaptive scheduling of content checks
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+
+import logging
+import multiprocessing
+import os
+import random
+import threading
+import time
+
+
+BASE_DELAY = 3  # seconds
+MIN_DELAY = 1  # seconds
+# relative amount of randomness added to idle delays
+JITTER = 0.2
+# minimum ratio of the time between checks and the time a check takes
+DUTY_RATIO = 4
+# 1-minute load average per CPU above which checks are deferred
+MAX_LOAD = 1.5
+# average request latency in seconds above which checks are deferred
+MAX_LATENCY = 1.0
+# latency samples older than this many seconds are not considered
+LATENCY_WINDOW = 60
+# weight of the latest sample in the average request latency
+LATENCY_WEIGHT = 0.2
+# checks are not deferred more than this many times in a row
+MAX_DEFERRALS = 5
+# limit of the exponent of delay backoffs, as streaks are not limited, and
+# delays are capped by ``max_delay`` and ``min_delay`` long before it
+MAX_EXPONENT = 32
+
+
+def get_load():
+    """Return 1-minute load average per CPU, or ``None`` if unknown."""
+    try:
+        return os.getloadavg()[0] / multiprocessing.cpu_count()
+    except (AttributeError, OSError, NotImplementedError):
+        return None
+
+
+class ContentCheckScheduler(object):
+    """Decides the delay until the next content check. While checks keep
+    finding changes, the delay is halved down to ``min_delay``. While they
+    find nothing, it is doubled up to ``max_delay``, with some jitter. Checks
+    are deferred while the device is busy serving requests or otherwise
+    loaded, and are never run more often than the time they take allows.
+
+    Request latency is not measured by the scheduler itself, it is expected
+    to be reported through :py:meth:`record_latency`."""
+
+    def __init__(self, max_delay, base_delay=BASE_DELAY, min_delay=MIN_DELAY,
+                 max_load=MAX_LOAD, max_latency=MAX_LATENCY,
+                 get_load=get_load, clock=time.time, random=random.random):
+        self.max_delay = max_delay
+        self.base_delay = min(base_delay, max_delay)
+        self.min_delay = min(min_delay, self.base_delay)
+        self.max_load = max_load
+        self.max_latency = max_latency
+        self.get_load = get_load
+        self.clock = clock
+        self.random = random
+        self.lock = threading.Lock()
+        self.latency = None
+        self.latency_time = None
+        self.busy_streak = 0
+        self.idle_streak = 0
+        self.deferrals = 0
+        self.metrics = dict(checks=0,
+                            events=0,
+                            deferred=0,
+                            delay=None,
+                            reason=None,
+                            duration=None,
+                            checked=None,
+                            load=None,
+                            latency=None)
+
+    def record_latency(self, seconds):
+        """Add a request latency sample to the moving average."""
+        with self.lock:
+            if self.latency is None:
+                self.latency = seconds
+            else:
+                self.latency += LATENCY_WEIGHT * (seconds - self.latency)
+            self.latency_time = self.clock()
+
+    def get_latency(self):
+        with self.lock:
+            if (self.latency_time is None or
+                    self.clock() - self.latency_time > LATENCY_WINDOW):
+                return None
+            return self.latency
+
+    def _decide(self, delay, reason):
+        delay = min(delay, self.max_delay)
+        with self.lock:
+            self.metrics.update(delay=delay, reason=reason)
+        logging.debug(u"Next content check in %.1fs (%s)", delay, reason)
+        return delay
+
+    def should_defer(self):
+        """Return delay by which the check that is due is deferred, or
+        ``None`` if it should run now."""
+        load = self.get_load()
+        latency = self.get_latency()
+        with self.lock:
+            self.metrics.update(load=load, latency=latency)
+        busy = ((load is not None and load > self.max_load) or
+                (latency is not None and latency > self.max_latency))
+        if not busy or self.deferrals >= MAX_DEFERRALS:
+            self.deferrals = 0
+            return None
+        self.deferrals += 1
+        with self.lock:
+            self.metrics['deferred'] += 1
+        return self._decide(self.base_delay * 2 ** self.deferrals, 'busy')
+
+    def next_delay(self, events, duration):
+        """Return delay until the next check, after a check that handled
+        ``events`` events and took ``duration`` seconds."""
+        with self.lock:
+            self.metrics['checks'] += 1
+            self.metrics['events'] += events
+            self.metrics['duration'] = duration
+            self.metrics['checked'] = self.clock()
+        if events:
+            self.idle_streak = 0
+            self.busy_streak += 1
+            exponent = min(self.busy_streak - 1, MAX_EXPONENT)
+            delay = max(self.min_delay, self.base_delay / 2.0 ** exponent)
+            reason = 'changes'
+        else:
+            self.busy_streak = 0
+            self.idle_streak += 1
+            delay = self.base_delay * 2 ** min(self.idle_streak, MAX_EXPONENT)
+            delay *= 1 + JITTER * (2 * self.random() - 1)
+            reason = 'idle'
+        if duration * DUTY_RATIO > delay:
+            delay = duration * DUTY_RATIO
+            reason = 'slow'
+        return self._decide(delay, reason)
+
+    def stats(self):
+        with self.lock:
+            checked = self.metrics['checked']
+            # changes made on disk since the last check are not in the
+            # library yet
+            lag = None if checked is None else self.clock() - checked
+            return dict(self.metrics,
+                        lag=lag,
+                        busy_streak=self.busy_streak,
+                        idle_streak=self.idle_streak,
+                        max_delay=self.max_delay)
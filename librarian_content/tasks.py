@@ -1,12 +1,17 @@
 import functools
 import logging
 import os
+import time
 
-from .library.archive import Archive
+from .utils import get_archive
 
 
-REPEAT_DELAY = 3  # seconds
-INCREMENT_DELAY = 5  # surprisignly also seconds
+# number of imported content items verified at a time, and seconds between
+# the batches
+VERIFY_BATCH = 100
+VERIFY_DELAY = 5
+# seconds between decays of popularity scores
+DECAY_INTERVAL = 3600
 
 
 def is_content(event, meta_filenames):
@@ -17,40 +22,38 @@ def is_content(event, meta_filenames):
 
 
 def reschedule_content_check(fn):
+    """Run the content check unless the scheduler defers it, and schedule
+    the next one after the delay chosen by the scheduler based on the number
+    of events the check handled and the time it took."""
     @functools.wraps(fn)
     def wrapper(supervisor, current_delay):
+        scheduler = supervisor.exts.content_check
+        delay = scheduler.should_defer()
+        if delay is not None:
+            supervisor.exts.tasks.schedule(check_new_content,
+                                           args=(supervisor, delay),
+                                           delay=delay)
+            return 0
+        events = 0
+        start = time.time()
         try:
-            changes_found = fn(supervisor)
-        except Exception:
-            changes_found = False
-            raise
+            events = fn(supervisor)
         finally:
-            if changes_found:
-                refresh_rate = REPEAT_DELAY
-            else:
-                max_delay = supervisor.config['library.refresh_rate']
-                if current_delay + INCREMENT_DELAY <= max_delay:
-                    refresh_rate = current_delay + INCREMENT_DELAY
-                else:
-                    refresh_rate = max_delay
-
+            delay = scheduler.next_delay(events, time.time() - start)
             supervisor.exts.tasks.schedule(check_new_content,
-                                           args=(supervisor, refresh_rate),
-                                           delay=refresh_rate)
+                                           args=(supervisor, delay),
+                                           delay=delay)
+        return events
     return wrapper
 
 
 @reschedule_content_check
 def check_new_content(supervisor):
     config = supervisor.config
-    archive = Archive.setup(config['library.backend'],
-                            supervisor.exts.fsal,
-                            supervisor.exts.databases.content,
-                            contentdir=config['library.contentdir'],
-                            meta_filenames=config['library.metadata'])
-    changes_found = False
+    archive = get_archive(supervisor)
+    events = 0
     for event in supervisor.exts.fsal.get_changes():
-        changes_found = True
+        events += 1
         path = os.path.dirname(event.src)
         if is_content(event, config['library.metadata']):
             if event.event_type == 'created':
@@ -64,7 +67,35 @@ def check_new_content(supervisor):
         else:
             supervisor.exts.events.publish('FS_EVENT', event)
 
-    if changes_found:
+    if events:
         supervisor.exts.cache.invalidate('content')
 
-    return changes_found
+    return events
+
+
+def verify_content(supervisor):
+    """Verify imported content in batches, until all of it is verified."""
+    archive = get_archive(supervisor)
+    if archive.verify_content(VERIFY_BATCH) == VERIFY_BATCH:
+        supervisor.exts.tasks.schedule(verify_content,
+                                       args=(supervisor,),
+                                       delay=VERIFY_DELAY)
+
+
+def decay_popularity(supervisor):
+    """Decay popularity scores of content in regular intervals, by the time
+    elapsed since their last decay. Its time is recorded in the library, so
+    scores also decay by the time the server was not running."""
+    try:
+        archive = get_archive(supervisor)
+        now = time.time()
+        last_decay = archive.get_last_decay()
+        if last_decay is None:
+            elapsed = DECAY_INTERVAL
+        else:
+            elapsed = max(now - last_decay, 0)
+        archive.decay_popularity(elapsed, now)
+    finally:
+        supervisor.exts.tasks.schedule(decay_popularity,
+                                       args=(supervisor,),
+                                       delay=DECAY_INTERVAL)
@@ -1,7 +1,75 @@
 import os
 
+from librarian_core.utils import is_string
+
+from .library.archive import Archive
+from .scheduler import ContentCheckScheduler
+
 
 def ensure_dir(path):
     """ Make sure directory at path exists """
     if not os.path.exists(path):
         os.makedirs(path)
+
+
+def get_content_roots(config):
+    """ Return list of configured content roots """
+    contentdir = config['library.contentdir']
+    if is_string(contentdir):
+        return [contentdir]
+    return list(contentdir)
+
+
+def get_archive(supervisor, db=None):
+    """ Return archive set up with the configured backend
+
+    :param supervisor:  supervisor instance
+    :param db:          database handle to use instead of the default one
+    """
+    config = supervisor.config
+    options = dict(contentdir=get_content_roots(config),
+                   meta_filenames=config['library.metadata'])
+    for key in ('database', 'snapshot', 'checkpoint', 'write_mode',
+                'sidecars', 'sidecar_dir'):
+        value = config.get('library.{0}'.format(key))
+        if value:
+            options[key] = value
+    for key in ('cache_size', 'cache_ttl', 'read_connections',
+                'checkpoint_interval', 'ingest_rate', 'ingest_io_rate',
+                'popularity_half_life'):
+        value = config.get('library.{0}'.format(key))
+        if value is not None:
+            options[key] = value
+    db = db or supervisor.exts.databases.content
+    backend = Archive.get_backend_class(config['library.backend'])
+    size = options.get('read_connections')
+    read_pool = backend.get_read_pool(db, None if size is None else int(size))
+    if read_pool is not None:
+        options['read_pool'] = read_pool
+    result_cache = config.get('library.result_cache', 'memory')
+    if result_cache == 'extension':
+        options['result_cache'] = supervisor.exts.cache
+    elif not result_cache:
+        options['result_cache'] = None
+    return Archive.setup(config['library.backend'],
+                         supervisor.exts.fsal,
+                         db,
+                         **options)
+
+
+def get_scheduler(config):
+    """ Return scheduler of content checks set up from the configuration """
+    options = dict()
+    for key in ('max_load', 'max_latency'):
+        value = config.get('library.{0}'.format(key))
+        if value is not None:
+            options[key] = float(value)
+    return ContentCheckScheduler(config['library.refresh_rate'], **options)
+
+
+def get_library_stats(supervisor):
+    """ Return health and performance statistics of the library, including
+    those of the checks for new content run by this process """
+    stats = get_archive(supervisor).get_library_stats()
+    stats['content_check'] = supervisor.exts.content_check.stats()
+    return stats
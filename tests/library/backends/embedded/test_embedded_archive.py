@@ -136,6 +136,7 @@ def test__serialize(archive):
 
 
 def test__write(archive):
+    archive.config['write_mode'] = 'replace'
     import collections
     OD = collections.OrderedDict
     metadata = OD({
@@ -167,3 +168,252 @@ def test__write(archive):
     ]
     # this fails for no obvious reasons
     archive.db.Replace.assert_has_calls(replace_calls, any_order=True)
+
+
+def test_iter_content(archive):
+    archive.db.Select.return_value = mock.MagicMock()
+    first = [{'path': 'a'}, {'path': 'b'}]
+    second = [{'path': 'c'}]
+    archive.db.fetchall.side_effect = [first, second]
+    result = list(archive.iter_content(fetch_size=2))
+    assert [meta['path'] for meta in result] == ['a', 'b', 'c']
+    assert archive.db.fetchall.call_count == 2
+    (_, params) = archive.db.fetchall.call_args[0]
+    assert params['last_path'] == 'b'
+
+
+@mock_cursor
+@mock.patch.object(mod.EmbeddedArchive, '_get_or_create_tag')
+def test_add_tags(cursor, archive, get_or_create_tag):
+    get_or_create_tag.return_value = 3
+    archive.db.execute.return_value = 1
+    meta = mock.Mock(path='relpath', tags={'old': 1})
+    assert archive.add_tags(meta, ['old', 'new', '']) == {'old': 1, 'new': 3}
+    get_or_create_tag.assert_called_once_with('new')
+    archive.db.Update.assert_called_once_with('tags',
+                                              count='count + 1',
+                                              where='tag_id = %s')
+
+
+@mock_cursor
+def test_remove_tags(cursor, archive):
+    archive.db.execute.return_value = 1
+    meta = mock.Mock(path='relpath', tags={'old': 1, 'other': 2})
+    assert archive.remove_tags(meta, ['old', 'missing']) == {'other': 2}
+    archive.db.Delete.assert_called_once_with(
+        'content_tags', where='path = %s AND tag_id = %s')
+    archive.db.Update.assert_called_once_with('tags',
+                                              count='count - 1',
+                                              where='tag_id = %s')
+
+
+def test_update_language_count_existing(archive):
+    archive.db.execute.return_value = 1
+    archive._update_language_count('en', 1)
+    archive.db.Update.assert_called_once_with(
+        'content_languages',
+        count='count + %(delta)s',
+        where='language = %(language)s')
+    assert archive.db.execute.call_count == 1
+
+
+def test_update_language_count_new(archive):
+    archive.db.execute.return_value = 0
+    archive._update_language_count('en', 1)
+    assert archive.db.execute.call_count == 2
+
+
+def test_update_language_count_no_language(archive):
+    archive._update_language_count(None, -1)
+    assert not archive.db.execute.called
+
+
+def test_get_content_languages(archive):
+    archive.db.fetchiter.return_value = [{'language': 'fr', 'count': 2},
+                                         {'language': 'en', 'count': 1}]
+    assert archive.get_content_languages() == ['en', 'fr']
+    assert archive.get_language_counts() == {'en': 1, 'fr': 2}
+
+
+def test_write_content_types(archive):
+    archive.config['write_mode'] = 'replace'
+    archive._write_content_types('relpath', 2 | 32)
+    archive.db.Delete.assert_called_once_with('content_types',
+                                              where='path = %s')
+    insert = 'INSERT INTO content_types (path, type) VALUES (%s, %s)'
+    archive.db.execute.assert_has_calls([
+        mock.call(archive.db.Delete.return_value, ('relpath',)),
+        mock.call(insert, ('relpath', 2)),
+        mock.call(insert, ('relpath', 32)),
+    ])
+
+
+def test_write_content_types_default(archive):
+    archive.db.fetchall.return_value = []
+    archive._write_content_types('relpath', None)
+    archive.db.execute.assert_called_with(
+        'INSERT INTO content_types (path, type) VALUES (%s, %s)',
+        ('relpath', 1))
+
+
+def test_write_content_types_diff(archive):
+    archive.db.fetchall.return_value = [{'type': 2}, {'type': 8}]
+    archive._write_content_types('relpath', 2 | 32)
+    archive.db.Delete.assert_called_once_with(
+        'content_types', where='path = %s AND type = %s')
+    assert archive.db.execute.call_args_list == [
+        mock.call(archive.db.Delete.return_value, ('relpath', 8)),
+        mock.call('INSERT INTO content_types (path, type) VALUES (%s, %s)',
+                  ('relpath', 32)),
+    ]
+    # unchanged types are not written at all
+    archive.db.execute.reset_mock()
+    archive.db.fetchall.return_value = [{'type': 2}, {'type': 32}]
+    archive._write_content_types('relpath', 2 | 32)
+    assert not archive.db.execute.called
+
+
+@mock.patch.object(mod.EmbeddedArchive, '_update_language_count')
+@mock.patch.object(mod.EmbeddedArchive, '_get_listed_language')
+@mock.patch.object(mod.EmbeddedArchive, '_write_content_types')
+@mock.patch.object(mod.EmbeddedArchive, '_write')
+def test_add_meta_to_db_language_count(_write, _write_content_types,
+                                       _get_listed_language,
+                                       _update_language_count, archive):
+    archive.db.transaction.return_value = mock.MagicMock()
+    _get_listed_language.return_value = 'en'
+    archive.add_meta_to_db({'path': 'a', 'language': 'en'})
+    assert not _update_language_count.called
+    archive.add_meta_to_db({'path': 'a', 'language': 'fr'})
+    assert _update_language_count.call_args_list == [mock.call('en', -1),
+                                                     mock.call('fr', 1)]
+    _update_language_count.reset_mock()
+    archive.add_meta_to_db({'path': 'a', 'language': 'en', 'disabled': True})
+    assert _update_language_count.call_args_list == [mock.call('en', -1),
+                                                     mock.call(None, 1)]
+
+
+@mock.patch.object(mod.EmbeddedArchive, '_get_single')
+def test_get_single_cached(get_single, archive):
+    record = archive.to_record({'path': 'relpath', 'title': 'title'},
+                               'content')
+    get_single.return_value = record
+    first = archive.get_single('relpath')
+    first['title'] = 'changed'
+    second = archive.get_single('relpath')
+    assert second['title'] == 'title'
+    get_single.assert_called_once_with('relpath')
+    # archives are created per request, the cache is shared through the db
+    other = mod.EmbeddedArchive(archive.fsal, archive.db, **archive.config)
+    assert other.get_single('relpath') == second
+    assert get_single.call_count == 1
+    assert archive.get_cache_stats()['hits'] == 2
+
+
+@mock.patch.object(mod.EmbeddedArchive, '_get_single')
+def test_get_single_invalidated_by_view(get_single, archive):
+    get_single.return_value = None
+    archive.db.execute.return_value = 1
+    assert archive.get_single('relpath') is None
+    assert archive.get_single('relpath') is None
+    assert get_single.call_count == 1
+    archive.add_view('relpath')
+    archive.get_single('relpath')
+    assert get_single.call_count == 2
+
+
+@mock.patch.object(mod.EmbeddedArchive, '_get_count')
+def test_get_count_cached(get_count, archive):
+    get_count.return_value = 2
+    assert archive.get_count(lang='en') == 2
+    assert archive.get_count(lang='en') == 2
+    get_count.assert_called_once_with(None, 'en', None, None)
+    archive.get_count(lang='fr')
+    assert get_count.call_count == 2
+
+
+@mock.patch.object(mod.EmbeddedArchive, '_get_content')
+def test_get_content_invalidated_by_write(get_content, archive):
+    archive.db.execute.return_value = 1
+    get_content.return_value = [archive.to_record({'path': 'a'}, 'content')]
+    assert [m.path for m in archive.get_content(limit=10)] == ['a']
+    archive.get_content(limit=10)
+    assert get_content.call_count == 1
+    # views do not invalidate listings
+    archive.add_view('a')
+    archive.get_content(limit=10)
+    assert get_content.call_count == 1
+    # as done by writes once committed
+    archive._invalidate('a')
+    archive.get_content(limit=10)
+    assert get_content.call_count == 2
+
+
+@mock.patch.object(mod.EmbeddedArchive, '_get_count')
+def test_result_cache_disabled(get_count, archive):
+    archive.config['result_cache'] = None
+    archive.get_count()
+    archive.get_count()
+    assert get_count.call_count == 2
+
+
+def test_reading_from_pool(archive):
+    reader = mock.MagicMock()
+    reader.fetchone.return_value = {'count': 3}
+    pool = mock.Mock()
+    pool.connection.return_value.__enter__ = mock.Mock(return_value=reader)
+    pool.connection.return_value.__exit__ = mock.Mock(return_value=False)
+    archive.config['read_pool'] = pool
+    archive.config['result_cache'] = None
+    archive.db.Select.return_value = mock.MagicMock()
+    assert archive.get_count() == 3
+    reader.execute.assert_called_once_with(mod.SNAPSHOT_SQL)
+    assert not archive.db.fetchone.called
+    assert archive.get_pool_stats() == pool.stats.return_value
+
+
+def test_get_read_pool():
+    db = mock.Mock()
+    db.connection_params = dict(host='localhost', port=5432, dbname='content',
+                                user='user', password='secret')
+    pool = mod.EmbeddedArchive.get_read_pool(db, 3)
+    assert pool.size == 3
+    # shared by all archives using the same database
+    assert mod.EmbeddedArchive.get_read_pool(db, 3) is pool
+    with pool.connection() as reader:
+        assert reader is db.connect.return_value
+    db.connect.assert_called_once_with(host='localhost', port=5432,
+                                       database='content', user='user',
+                                       password='secret', maxsize=1)
+    assert mod.EmbeddedArchive.get_read_pool(db, 0) is None
+    assert mod.EmbeddedArchive.get_read_pool(object()) is None
+
+
+def test_reading_without_pool(archive):
+    archive.db.fetchone.return_value = {'updated': 'date'}
+    assert archive.last_update() == 'date'
+    assert archive.get_pool_stats() is None
+
+
+def test_apply_diff_insert(archive):
+    archive._apply_diff('album', None, {'path': 'p', 'file': 'f', 'x': 1})
+    archive.db.execute.assert_called_once_with(
+        'INSERT INTO album (file, path, x) VALUES '
+        '(%(file)s, %(path)s, %(x)s)',
+        {'path': 'p', 'file': 'f', 'x': 1})
+
+
+def test_apply_diff_update_changed(archive):
+    existing = {'path': 'p', 'file': 'f', 'x': 1, 'y': 2}
+    row = {'path': 'p', 'file': 'f', 'x': 1, 'y': 3}
+    archive._apply_diff('album', existing, row)
+    archive.db.Update.assert_called_once_with(
+        'album', where='path = %(path)s AND file = %(file)s', y='%(y)s')
+    archive.db.execute.assert_called_once_with(
+        archive.db.Update.return_value, row)
+
+
+def test_apply_diff_unchanged(archive):
+    row = {'path': 'p', 'file': 'f', 'x': 1}
+    archive._apply_diff('album', dict(row), row)
+    assert not archive.db.execute.called
@@ -0,0 +1,306 @@
+import datetime
+import threading
+
+import mock
+import pytest
+
+import librarian_content.library.backends.memory.archive as mod
+from librarian_content.library import metadata
+from librarian_content.library.archive import Archive
+
+
+@pytest.fixture
+def archive():
+    mod.STORES.clear()
+    return mod.MemoryArchive(mock.Mock(),
+                             None,
+                             contentdir='contentdir',
+                             meta_filenames=['metafile.ext'])
+
+
+def make_meta(path, title='title', language='en', content=None, **kwargs):
+    now = datetime.datetime(2015, 5, 1, 12, 0, 0)
+    meta = {
+        'path': path,
+        'title': title,
+        'url': 'http://example.com/',
+        'timestamp': now,
+        'updated': now,
+        'language': language,
+        'keywords': '',
+        'replaces': None,
+        'content': content or {'html': {'main': 'index.html'}},
+    }
+    meta.update(kwargs)
+    meta['content_type'] = metadata.determine_content_type(meta)
+    return meta
+
+
+def test_get_backend_class():
+    cls = Archive.get_backend_class('memory.archive.MemoryArchive')
+    assert cls is mod.MemoryArchive
+
+
+def test_add_and_get_single(archive):
+    content = {'image': {'description': 'desc',
+                         'album': [{'file': 'a.jpg', 'title': 'A'},
+                                   {'file': 'b.jpg', 'title': 'B'}]}}
+    assert archive.add_meta_to_db(make_meta('img', content=content))
+    data = archive.get_single('img')
+    assert data.path == 'img'
+    assert data.updated == datetime.datetime(2015, 5, 1, 12, 0, 0)
+    assert data.favorite is False
+    assert data['image']['description'] == 'desc'
+    assert sorted(row['file'] for row in data['image']['album']) == [
+        'a.jpg', 'b.jpg']
+    assert data['tags'] == {}
+    assert archive.get_single('missing') is None
+
+
+def test_get_content_filters(archive):
+    archive.add_meta_to_db(make_meta('one', title='Sweden', language='en'))
+    archive.add_meta_to_db(make_meta('two', title='Norway', language='fr'))
+    archive.add_meta_to_db(make_meta('app', content={'app': {}}))
+    archive.add_meta_to_db(make_meta('vid', content={'video': {}}))
+
+    assert archive.get_count() == 3
+    assert sorted(m.path for m in archive.get_content()) == [
+        'one', 'two', 'vid']
+    assert [m.path for m in archive.get_content(lang='fr')] == ['two']
+    assert [m.path for m in archive.get_content(terms='swe')] == ['one']
+    assert archive.get_count(terms='swe') == 1
+    assert archive.get_count(terms='!!') == 0
+    assert [m.path for m in archive.get_content(content_type='app')] == [
+        'app']
+    assert archive.get_count(content_type='video') == 1
+    assert len(archive.get_content(limit=2)) == 2
+    assert len(archive.get_content(offset=2, limit=2)) == 1
+
+
+def test_iter_content(archive):
+    for idx in range(5):
+        archive.add_meta_to_db(make_meta('path{0}'.format(idx)))
+    paths = [meta.path for meta in archive.iter_content(fetch_size=2)]
+    assert paths == ['path{0}'.format(idx) for idx in range(5)]
+
+
+def test_iter_content_releases_lock(archive):
+    for idx in range(3):
+        archive.add_meta_to_db(make_meta('path{0}'.format(idx)))
+    found = archive.iter_content()
+    next(found)
+    # other threads are not blocked while the consumer is paused
+    counts = []
+
+    def count():
+        counts.append(archive.get_count())
+    thread = threading.Thread(target=count)
+    thread.start()
+    thread.join(5)
+    assert counts == [3]
+    # the generator can be resumed in another thread
+    rest = []
+    thread = threading.Thread(target=lambda: rest.extend(found))
+    thread.start()
+    thread.join(5)
+    assert [meta.path for meta in rest] == ['path1', 'path2']
+
+
+def test_last_update_without_timestamp(archive):
+    archive.add_meta_to_db(make_meta('one'))
+    archive.add_meta_to_db(make_meta('two', updated=None))
+    assert archive.last_update() == datetime.datetime(2015, 5, 1, 12, 0, 0)
+
+
+def test_get_multiple(archive):
+    archive.add_meta_to_db(make_meta('one', title='first'))
+    archive.add_meta_to_db(make_meta('two', title='second'))
+    result = archive.get_multiple(['one', 'two'], fields=('path', 'title'))
+    assert sorted(row.title for row in result) == ['first', 'second']
+
+
+def test_replaces(archive):
+    archive.add_meta_to_db(make_meta('old', title='Old'))
+    archive.add_meta_to_db(make_meta('new', title='New', replaces='old'))
+    assert archive.get_single('old') is None
+    assert archive.get_count() == 1
+    assert archive.get_count(terms='old') == 0
+
+
+def test_remove_meta_from_db(archive):
+    archive.add_meta_to_db(make_meta('one', title='Sweden'))
+    assert archive.remove_meta_from_db('one') == 1
+    assert archive.get_single('one') is None
+    assert archive.get_count(terms='sweden') == 0
+    assert archive.get_content_languages() == []
+
+
+def test_languages(archive):
+    archive.add_meta_to_db(make_meta('one', language='en'))
+    archive.add_meta_to_db(make_meta('two', language='en'))
+    archive.add_meta_to_db(make_meta('three', language='fr'))
+    archive.add_meta_to_db(make_meta('four', language='de', disabled=True))
+    assert archive.get_content_languages() == ['en', 'fr']
+    assert archive.get_language_counts() == {'en': 2, 'fr': 1}
+    # changing the language of existing content moves it between counts
+    archive.add_meta_to_db(make_meta('three', language='en'))
+    assert archive.get_language_counts() == {'en': 3}
+
+
+def test_tags(archive):
+    archive.add_meta_to_db(make_meta('one'))
+    archive.add_meta_to_db(make_meta('two'))
+    one = mock.Mock(path='one', tags={})
+    two = mock.Mock(path='two', tags={})
+    archive.add_tags(one, ['red', 'blue'])
+    archive.add_tags(two, ['red'])
+    cloud = [(tag.name, tag.count) for tag in archive.get_tag_cloud()]
+    assert cloud == [('red', 2), ('blue', 1)]
+    assert archive.get_tag_name(one.tags['blue']) == 'blue'
+    assert archive.get_single('one')['tags'] == one.tags
+    red = one.tags['red']
+    assert sorted(m.path for m in archive.get_content(tag=red)) == [
+        'one', 'two']
+
+    archive.remove_tags(one, ['red'])
+    assert archive.get_count(tag=red) == 1
+    archive.remove_meta_from_db('two')
+    cloud = [(tag.name, tag.count) for tag in archive.get_tag_cloud()]
+    assert cloud == [('blue', 1)]
+
+
+def test_add_view_and_last_update(archive):
+    archive.add_meta_to_db(make_meta('one'))
+    assert archive.add_view('one') == 1
+    assert archive.get_single('one').views == 1
+    assert archive.last_update() == datetime.datetime(2015, 5, 1, 12, 0, 0)
+
+
+def test_clear_and_reload(archive):
+    archive.add_meta_to_db(make_meta('one'))
+    archive.fsal.search.return_value = ([], [], False)
+    archive.clear_and_reload()
+    assert archive.get_count() == 0
+    assert archive.get_content_languages() == []
+
+
+def test_listing_order(archive):
+    older = datetime.datetime(2015, 4, 1, 12, 0, 0)
+    archive.add_meta_to_db(make_meta('old', updated=older))
+    archive.add_meta_to_db(make_meta('new'))
+    archive.add_meta_to_db(make_meta('popular'))
+    archive.add_view('popular')
+    paths = [meta.path for meta in archive.get_content()]
+    assert paths == ['popular', 'new', 'old']
+
+
+def test_archives_share_store(archive):
+    archive.add_meta_to_db(make_meta('one'))
+    other = mod.MemoryArchive(mock.Mock(),
+                              None,
+                              contentdir='contentdir',
+                              meta_filenames=['metafile.ext'])
+    assert other.get_single('one').path == 'one'
+
+
+def test_snapshot(archive, tmpdir):
+    snapshot = str(tmpdir.join('library.snapshot'))
+    archive.add_meta_to_db(make_meta('one', title='Sweden'))
+    archive.add_tags(mock.Mock(path='one', tags={}), ['red'])
+    archive.decay_popularity(0, 1000.5)
+    archive.save_snapshot(snapshot)
+    mod.STORES.clear()
+    restored = mod.MemoryArchive(mock.Mock(),
+                                 None,
+                                 contentdir='contentdir',
+                                 meta_filenames=['metafile.ext'],
+                                 snapshot=snapshot)
+    assert restored.get_single('one').title == 'Sweden'
+    assert restored.get_count(terms='swed') == 1
+    assert [tag.name for tag in restored.get_tag_cloud()] == ['red']
+    assert restored.get_last_decay() == 1000.5
+
+
+def test_snapshot_saved_on_changes(tmpdir):
+    mod.STORES.clear()
+    snapshot = str(tmpdir.join('library.snapshot'))
+    archive = mod.MemoryArchive(mock.Mock(),
+                                None,
+                                contentdir='contentdir',
+                                meta_filenames=['metafile.ext'],
+                                snapshot=snapshot)
+    archive.add_meta_to_db(make_meta('one'))
+    archive.add_meta_to_db(make_meta('two'))
+    archive.remove_meta_from_db('two')
+    store = mod.MemoryStore()
+    assert mod.load_snapshot(store, snapshot)
+    assert list(store.content) == ['one']
+    # bulk changes write the snapshot once they are finished
+    with mock.patch.object(archive, 'save_snapshot') as save_snapshot:
+        with archive.bulk_changes():
+            archive.add_meta_to_db(make_meta('three'))
+            archive.remove_meta_from_db('one')
+            assert not save_snapshot.called
+        save_snapshot.assert_called_once_with()
+
+
+def test_detach_root(archive):
+    archive.add_meta_to_db(make_meta('one', language='en', root='internal'))
+    archive.add_meta_to_db(make_meta('two', language='fr', root='usb'))
+    assert archive.detach_root('usb') == 1
+    assert [m.path for m in archive.get_content()] == ['one']
+    assert archive.get_language_counts() == {'en': 1}
+
+
+def test_get_content_page(archive):
+    archive.add_meta_to_db(make_meta('one', language='en'))
+    archive.add_meta_to_db(make_meta('two', language='fr'))
+    archive.add_meta_to_db(make_meta('vid', language='en',
+                                     content={'video': {}}))
+    page = archive.get_content_page(offset=1, limit=1, facets=True)
+    assert len(page['rows']) == 1
+    assert page['total'] == 3
+    assert page['facets'] == {'language': {'en': 2, 'fr': 1},
+                              'content_type': {'html': 2, 'video': 1}}
+
+
+def test_get_content_fields(archive):
+    archive.add_meta_to_db(make_meta('one', title='Sweden'))
+    (row,) = archive.get_content(fields='list')
+    assert sorted(row.keys()) == sorted(archive.projections['list'])
+    assert row.title == 'Sweden'
+
+
+def test_popularity(archive):
+    for path in ('one', 'two', 'three'):
+        archive.add_meta_to_db(make_meta(path))
+    archive.add_view('two')
+    archive.add_view('two')
+    archive.add_view('three')
+    paths = [m.path for m in archive.get_content(order='popular')]
+    assert paths == ['two', 'three', 'one']
+    assert archive.get_last_decay() is None
+    assert archive.decay_popularity(7 * 24 * 3600, 1000.5) == 2
+    assert archive.get_single('three').popularity == 0.5
+    assert archive.get_last_decay() == 1000.5
+
+
+def test_suggest(archive):
+    archive.add_meta_to_db(make_meta('one', title='Star Wars'))
+    archive.add_meta_to_db(make_meta('two', title='War and Peace',
+                                     language='fr'))
+    assert archive.suggest('war') == ['War and Peace', 'Star Wars']
+    assert archive.suggest('war', lang='fr') == ['War and Peace']
+    archive.remove_meta_from_db('two')
+    assert archive.suggest('war') == ['Star Wars']
+
+
+def test_library_stats(archive):
+    archive.add_meta_to_db(make_meta('one'))
+    archive.add_meta_to_db(make_meta('two', language='fr'))
+    stats = archive.get_library_stats()
+    assert stats['tables']['content'] == 2
+    assert stats['tables']['html'] == 2
+    assert stats['tables']['content_languages'] == 2
+    assert stats['orphans'] == {}
+    assert stats['unverified'] == 0
@@ -0,0 +1,452 @@
+import datetime
+import threading
+
+import mock
+import pytest
+
+import librarian_content.library.backends.sqlite.archive as mod
+from librarian_content.library import metadata
+from librarian_content.library.archive import Archive
+from librarian_content.library.backends.sqlite.database import SQLiteDatabase
+from librarian_content.library.export import ExportError
+
+
+@pytest.fixture
+def archive():
+    return mod.SQLiteArchive(mock.Mock(),
+                             SQLiteDatabase.open(':memory:'),
+                             contentdir='contentdir',
+                             meta_filenames=['metafile.ext'],
+                             database=':memory:')
+
+
+def make_meta(path, title='title', language='en', content=None, **kwargs):
+    now = datetime.datetime(2015, 5, 1, 12, 0, 0)
+    meta = {
+        'path': path,
+        'title': title,
+        'url': 'http://example.com/',
+        'timestamp': now,
+        'updated': now,
+        'language': language,
+        'keywords': '',
+        'replaces': None,
+        'content': content or {'html': {'main': 'index.html'}},
+    }
+    meta.update(kwargs)
+    meta['content_type'] = metadata.determine_content_type(meta)
+    return meta
+
+
+def test_get_backend_class():
+    cls = Archive.get_backend_class('sqlite.archive.SQLiteArchive')
+    assert cls is mod.SQLiteArchive
+
+
+def test_add_and_get_single(archive):
+    content = {'image': {'description': 'desc',
+                         'album': [{'file': 'a.jpg', 'title': 'A'},
+                                   {'file': 'b.jpg', 'title': 'B'}]}}
+    assert archive.add_meta_to_db(make_meta('img', content=content))
+    data = archive.get_single('img')
+    assert data.path == 'img'
+    assert data.updated == datetime.datetime(2015, 5, 1, 12, 0, 0)
+    assert data.favorite is False
+    assert data['image']['description'] == 'desc'
+    assert sorted(row['file'] for row in data['image']['album']) == [
+        'a.jpg', 'b.jpg']
+    assert data['tags'] == {}
+    assert archive.get_single('missing') is None
+
+
+def test_get_content_filters(archive):
+    archive.add_meta_to_db(make_meta('one', title='Sweden', language='en'))
+    archive.add_meta_to_db(make_meta('two', title='Norway', language='fr'))
+    archive.add_meta_to_db(make_meta('app', content={'app': {}}))
+    archive.add_meta_to_db(make_meta('vid', content={'video': {}}))
+
+    assert archive.get_count() == 3
+    assert sorted(m.path for m in archive.get_content()) == [
+        'one', 'two', 'vid']
+    assert [m.path for m in archive.get_content(lang='fr')] == ['two']
+    assert [m.path for m in archive.get_content(terms='swe')] == ['one']
+    assert archive.get_count(terms='swe') == 1
+    assert archive.get_count(terms='!!') == 0
+    assert [m.path for m in archive.get_content(content_type='app')] == [
+        'app']
+    assert archive.get_count(content_type='video') == 1
+    assert len(archive.get_content(limit=2)) == 2
+    assert len(archive.get_content(offset=2, limit=2)) == 1
+
+
+def test_iter_content(archive):
+    for idx in range(5):
+        archive.add_meta_to_db(make_meta('path{0}'.format(idx)))
+    paths = [meta.path for meta in archive.iter_content(fetch_size=2)]
+    assert paths == ['path{0}'.format(idx) for idx in range(5)]
+
+
+def test_get_multiple(archive):
+    archive.add_meta_to_db(make_meta('one', title='first'))
+    archive.add_meta_to_db(make_meta('two', title='second'))
+    result = archive.get_multiple(['one', 'two'], fields=('path', 'title'))
+    assert sorted(row.title for row in result) == ['first', 'second']
+
+
+def test_replaces(archive):
+    archive.add_meta_to_db(make_meta('old', title='Old'))
+    archive.add_meta_to_db(make_meta('new', title='New', replaces='old'))
+    assert archive.get_single('old') is None
+    assert archive.get_count() == 1
+    assert archive.get_count(terms='old') == 0
+
+
+def test_remove_meta_from_db(archive):
+    archive.add_meta_to_db(make_meta('one', title='Sweden'))
+    assert archive.remove_meta_from_db('one') == 1
+    assert archive.get_single('one') is None
+    assert archive.get_count(terms='sweden') == 0
+    assert archive.get_content_languages() == []
+
+
+def test_languages(archive):
+    archive.add_meta_to_db(make_meta('one', language='en'))
+    archive.add_meta_to_db(make_meta('two', language='en'))
+    archive.add_meta_to_db(make_meta('three', language='fr'))
+    archive.add_meta_to_db(make_meta('four', language='de', disabled=True))
+    assert archive.get_content_languages() == ['en', 'fr']
+    assert archive.get_language_counts() == {'en': 2, 'fr': 1}
+    # changing the language of existing content moves it between counts
+    archive.add_meta_to_db(make_meta('three', language='en'))
+    assert archive.get_language_counts() == {'en': 3}
+
+
+def test_tags(archive):
+    archive.add_meta_to_db(make_meta('one'))
+    archive.add_meta_to_db(make_meta('two'))
+    one = mock.Mock(path='one', tags={})
+    two = mock.Mock(path='two', tags={})
+    archive.add_tags(one, ['red', 'blue'])
+    archive.add_tags(two, ['red'])
+    cloud = [(tag.name, tag.count) for tag in archive.get_tag_cloud()]
+    assert cloud == [('red', 2), ('blue', 1)]
+    assert archive.get_tag_name(one.tags['blue']) == 'blue'
+    assert archive.get_single('one')['tags'] == one.tags
+    red = one.tags['red']
+    assert sorted(m.path for m in archive.get_content(tag=red)) == [
+        'one', 'two']
+
+    archive.remove_tags(one, ['red'])
+    assert archive.get_count(tag=red) == 1
+    archive.remove_meta_from_db('two')
+    cloud = [(tag.name, tag.count) for tag in archive.get_tag_cloud()]
+    assert cloud == [('blue', 1)]
+
+
+def test_add_view_and_last_update(archive):
+    archive.add_meta_to_db(make_meta('one'))
+    assert archive.add_view('one') == 1
+    assert archive.get_single('one').views == 1
+    assert archive.last_update() == datetime.datetime(2015, 5, 1, 12, 0, 0)
+
+
+def test_clear_and_reload(archive):
+    archive.add_meta_to_db(make_meta('one'))
+    archive.fsal.search.return_value = ([], [], False)
+    archive.clear_and_reload()
+    assert archive.get_count() == 0
+    assert archive.get_content_languages() == []
+
+
+def test_detach_root(archive):
+    archive.add_meta_to_db(make_meta('one', language='en', root='internal'))
+    archive.add_meta_to_db(make_meta('two', language='fr', root='usb'))
+    archive.add_tags(mock.Mock(path='two', tags={}), ['red'])
+    assert archive.detach_root('usb') == 1
+    assert [m.path for m in archive.get_content()] == ['one']
+    assert archive.get_single('two') is None
+    assert archive.get_language_counts() == {'en': 1}
+    assert archive.get_tag_cloud() == []
+
+
+def test_reads_do_not_wait_for_writes(tmpdir):
+    path = str(tmpdir.join('content.sqlite'))
+    archive = mod.SQLiteArchive(mock.Mock(),
+                                contentdir='contentdir',
+                                meta_filenames=['metafile.ext'],
+                                database=path,
+                                result_cache=None,
+                                cache_size=0)
+    archive.add_meta_to_db(make_meta('one'))
+    with archive.db.transaction():
+        archive.add_meta_to_db(make_meta('two'))
+        # uncommitted changes are not visible to the readers
+        assert archive.get_count() == 1
+    assert archive.get_count() == 2
+    assert archive.get_pool_stats()['created'] == 1
+
+
+def test_clear_and_reload_resumed(archive, tmpdir):
+    archive.add_meta_to_db(make_meta('one'))
+    archive.config['checkpoint'] = str(tmpdir.join('journal'))
+    checkpoint = archive.checkpoint
+    checkpoint.save(checkpoint.start('refill', archive.content_roots))
+    with mock.patch.object(archive, 'scan_content_roots', return_value=[]):
+        archive.clear_and_reload()
+    # content added before the interruption is kept
+    assert archive.get_count() == 1
+    assert not archive.is_resumable('refill')
+
+
+def test_diff_write(archive):
+    def album(*files):
+        return {'image': {'description': 'desc',
+                          'album': [{'file': name, 'title': title}
+                                    for (name, title) in files]}}
+
+    def rowids():
+        rows = archive.db.fetchall('SELECT rowid, file FROM album')
+        return dict((row['file'], row['rowid']) for row in rows)
+
+    archive.add_meta_to_db(make_meta('img', content=album(('a', 'A'),
+                                                          ('b', 'B'))))
+    archive.add_view('img')
+    before = rowids()
+    archive.add_meta_to_db(make_meta('img', title='new',
+                                     content=album(('b', 'B'),
+                                                   ('c', 'C'))))
+    after = rowids()
+    assert sorted(after) == ['b', 'c']
+    # unchanged rows are not rewritten
+    assert after['b'] == before['b']
+    data = archive.get_single('img')
+    assert data.title == 'new'
+    # columns not present in the metadata are kept
+    assert data.views == 1
+
+
+def test_export_and_import(archive, tmpdir):
+    content = {'image': {'album': [{'file': 'a.jpg', 'title': 'A'}]}}
+    archive.add_meta_to_db(make_meta('one', language='en', root='internal'))
+    archive.add_meta_to_db(make_meta('img', language='fr', content=content))
+    archive.add_view('one')
+    archive.add_tags(mock.Mock(path='one', tags={}), ['red', 'blue'])
+    path = str(tmpdir.join('library.export'))
+    counts = archive.export_library(path)
+    assert counts['content'] == 2
+    assert counts['content_tags'] == 2
+
+    other = mod.SQLiteArchive(mock.Mock(),
+                              SQLiteDatabase.open(':memory:'),
+                              contentdir=str(tmpdir),
+                              meta_filenames=['metafile.ext'],
+                              database=':memory:')
+    other.add_meta_to_db(make_meta('stale'))
+    assert other.import_library(path)['content'] == 2
+    assert sorted(m.path for m in other.get_content()) == ['img', 'one']
+    one = other.get_single('one')
+    assert one.views == 1
+    assert one.root is None
+    assert sorted(one['tags']) == ['blue', 'red']
+    img = other.get_single('img')
+    assert [row['file'] for row in img['image']['album']] == ['a.jpg']
+    assert other.get_count(content_type='image') == 1
+    assert other.get_language_counts() == {'en': 1, 'fr': 1}
+    assert sorted(tag.name for tag in other.get_tag_cloud()) == [
+        'blue', 'red']
+
+    # imported content is located lazily, and removed if it is missing
+    tmpdir.join('one').ensure(dir=True)
+    assert other.verify_content(limit=10) == 2
+    assert other.get_single('one').root == str(tmpdir)
+    assert other.get_single('img') is None
+    assert other.verify_content(limit=10) == 0
+
+
+def test_import_incomplete(archive, tmpdir):
+    archive.add_meta_to_db(make_meta('one'))
+    path = str(tmpdir.join('library.export'))
+    archive.export_library(path)
+    data = open(path, 'rb').read()
+    with open(path, 'wb') as f:
+        f.write(data[:len(data) // 2])
+    with pytest.raises(ExportError):
+        archive.import_library(path)
+    # the library is left untouched
+    assert archive.get_count() == 1
+
+
+def test_get_content_page(archive):
+    archive.add_meta_to_db(make_meta('one', title='Sweden', language='en'))
+    archive.add_meta_to_db(make_meta('two', title='Norway', language='fr'))
+    archive.add_meta_to_db(make_meta('vid', language='en',
+                                     content={'video': {}}))
+    archive.add_meta_to_db(make_meta('app', content={'app': {}}))
+
+    page = archive.get_content_page(limit=2)
+    assert len(page['rows']) == 2
+    assert 'total' not in page['rows'][0]
+    assert page['total'] == 3
+    assert page['facets'] is None
+
+    page = archive.get_content_page(lang='en', facets=True)
+    assert sorted(m.path for m in page['rows']) == ['one', 'vid']
+    assert page['total'] == 2
+    assert page['facets'] == {'language': {'en': 2},
+                              'content_type': {'html': 1, 'video': 1}}
+
+    # past the last match
+    page = archive.get_content_page(offset=10, limit=2)
+    assert page['rows'] == []
+    assert page['total'] == 3
+    assert archive.get_content_page(terms='!!')['total'] == 0
+
+
+def test_get_content_fields(archive):
+    archive.add_meta_to_db(make_meta('one', title='Sweden'))
+    archive.add_meta_to_db(make_meta('app', content={'app': {}}))
+    (row,) = archive.get_content(fields='list')
+    assert sorted(row.keys()) == sorted(archive.projections['list'])
+    assert row.title == 'Sweden'
+    (row,) = archive.get_content(fields=['title'])
+    assert sorted(row.keys()) == ['path', 'title']
+    # related data of prefetchable types is still attached
+    (row,) = archive.get_content(content_type='app', fields='list')
+    assert 'app' in row
+
+    page = archive.get_content_page(fields=['title'], facets=True)
+    assert sorted(page['rows'][0].keys()) == ['path', 'title']
+    assert page['total'] == 1
+    assert page['facets']['language'] == {'en': 1}
+
+
+def test_popularity(archive):
+    for path in ('one', 'two', 'three'):
+        archive.add_meta_to_db(make_meta(path))
+    archive.add_view('two')
+    archive.add_view('two')
+    archive.add_view('three')
+    paths = [m.path for m in archive.get_content(order='popular')]
+    assert paths[:2] == ['two', 'three']
+    assert archive.get_single('two').popularity == 2
+    page = archive.get_content_page(order='popular', fields='list', limit=1)
+    assert page['rows'][0].path == 'two'
+
+    half_life = archive.config.get('popularity_half_life', 7) * 24 * 3600
+    assert archive.get_last_decay() is None
+    assert archive.decay_popularity(half_life, 1000.5) == 2
+    assert archive.get_single('two').popularity == 1
+    assert archive.get_single('three').popularity == 0.5
+    # only the time of the last decay is kept
+    archive.decay_popularity(0, 2000.5)
+    assert archive.get_last_decay() == 2000.5
+    # views are not affected
+    assert archive.get_single('two').views == 2
+    with pytest.raises(ValueError):
+        archive.get_content(order='random')
+
+
+def test_old_schema_upgraded(tmpdir):
+    path = str(tmpdir.join('content.sqlite'))
+    db = SQLiteDatabase.open(path)
+    db.executescript('create table content (path varchar primary key, '
+                     'title varchar, timestamp utcdatetime, '
+                     'updated utcdatetime, views integer, '
+                     'disabled boolean, language varchar, '
+                     'publisher varchar, keywords varchar, '
+                     'content_type int, thumbnail varchar);')
+    archive = mod.SQLiteArchive(mock.Mock(), db,
+                                contentdir='contentdir',
+                                meta_filenames=['metafile.ext'],
+                                database=path)
+    columns = [row['name'] for row in
+               archive.db.fetchall('PRAGMA table_info(content)')]
+    assert 'root' in columns
+    assert 'popularity' in columns
+
+
+def test_suggest(archive):
+    archive.add_meta_to_db(make_meta('one', title='Star Wars'))
+    archive.add_meta_to_db(make_meta('two', title='War and Peace',
+                                     language='fr'))
+    assert archive.suggest('war') == ['War and Peace', 'Star Wars']
+    assert archive.suggest('war', lang='fr') == ['War and Peace']
+    # the built index is kept up to date
+    archive.add_meta_to_db(make_meta('three', title='Warlords'))
+    archive.remove_meta_from_db('one')
+    assert archive.suggest('war') == ['War and Peace', 'Warlords']
+    archive.add_meta_to_db(make_meta('three', title='Warlords',
+                                     disabled=True))
+    assert archive.suggest('war') == ['War and Peace']
+
+
+def test_library_stats(archive):
+    archive.add_meta_to_db(make_meta('one'))
+    archive.add_meta_to_db(make_meta('two'))
+    archive.db.execute("INSERT INTO html (path, main) VALUES ('gone', 'x')")
+    archive.get_count()
+    stats = archive.get_library_stats()
+    assert stats['tables']['content'] == 2
+    assert stats['tables']['html'] == 3
+    assert stats['orphans']['html'] == 1
+    assert stats['orphans']['content_types'] == 0
+    assert stats['unverified'] == 2
+    assert 'get_count' in [query['name'] for query in stats['queries']]
+    assert 'hit_ratio' in stats['cache']
+    assert stats['reload'] is None
+
+
+def test_search_index_follows_updates(archive):
+    archive.add_meta_to_db(make_meta('one', title='Sweden'))
+    archive.add_meta_to_db(make_meta('two', title='Sweden'))
+    archive.add_meta_to_db(make_meta('one', title='Norway'))
+    assert [m.path for m in archive.get_content(terms='sweden')] == ['two']
+    assert [m.path for m in archive.get_content(terms='norway')] == ['one']
+    archive.remove_meta_from_db('two')
+    assert archive.get_count(terms='sweden') == 0
+    archive.db.execute(archive.db.Delete('content'))
+    assert archive.get_count(terms='norway') == 0
+
+
+def test_old_search_index_upgraded(tmpdir):
+    path = str(tmpdir.join('content.sqlite'))
+    db = SQLiteDatabase.open(path)
+    db.executescript(mod.SCHEMA)
+    db.executescript('create virtual table content_fts using fts5 '
+                     '(path unindexed, title, publisher, keywords);')
+    db.execute("INSERT INTO content (path, title, timestamp, updated) "
+               "VALUES ('one', 'Sweden', '2015-05-01', '2015-05-01')")
+    archive = mod.SQLiteArchive(mock.Mock(), db,
+                                contentdir='contentdir',
+                                meta_filenames=['metafile.ext'],
+                                database=path)
+    columns = [row['name'] for row in
+               archive.db.fetchall('PRAGMA table_info(content_fts)')]
+    assert 'path' not in columns
+    assert archive.get_count(terms='sweden') == 1
+
+
+def test_caches_shared_between_threads(tmpdir):
+    path = str(tmpdir.join('content.sqlite'))
+
+    def make_archive():
+        return mod.SQLiteArchive(mock.Mock(), None,
+                                 contentdir='contentdir',
+                                 meta_filenames=['metafile.ext'],
+                                 database=path)
+
+    archive = make_archive()
+    archive.add_meta_to_db(make_meta('one', title='first'))
+    assert archive.get_count() == 1
+    assert archive.get_single('one').title == 'first'
+
+    def write():
+        writer = make_archive()
+        writer.add_meta_to_db(make_meta('one', title='changed'))
+        writer.add_meta_to_db(make_meta('two'))
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    thread.join()
+    assert archive.get_count() == 2
+    assert archive.get_single('one').title == 'changed'
@@ -1,3 +1,6 @@
+import os
+import time
+
 import mock
 import pytest
 
@@ -150,11 +153,48 @@ class TestBaseArchive(object):
         assert base_archive._BaseArchive__add_to_archive(relpath)
         get_meta.assert_called_once_with('contentdir',
                                          relpath,
-                                         ['metafile.ext'])
+                                         ['metafile.ext'],
+                                         sidecars=None)
         __add_auto_fields.assert_called_once_with(get_meta.return_value,
-                                                  relpath)
+                                                  relpath, 'contentdir')
         add_meta_to_db.assert_called_once_with(get_meta.return_value)
 
+    @mock.patch.object(mod.BaseArchive, 'add_meta_to_db')
+    @mock.patch.object(mod.metadata, 'get_meta')
+    def test___add_to_archive_shadowed(self, get_meta, add_meta_to_db,
+                                       base_archive, tmpdir):
+        internal = tmpdir.join('internal')
+        usb = tmpdir.join('usb')
+        for root in (internal, usb):
+            root.join('dup', 'metafile.ext').ensure()
+        base_archive.config['contentdir'] = [str(internal), str(usb)]
+        get_meta.return_value = {'content': {}}
+        add_meta_to_db.return_value = True
+        add = base_archive._BaseArchive__add_to_archive
+        # the same path in a later root is not added over the first one
+        assert not add('dup', str(usb))
+        assert not add_meta_to_db.called
+        assert add('dup', str(internal))
+        assert add_meta_to_db.call_args[0][0]['root'] == str(internal)
+
+    def test___add_auto_fields(self, base_archive, tmpdir):
+        root = tmpdir.join('usb')
+        root.join('content', 'metafile.ext').write('12345', ensure=True)
+        root.join('content', 'img', 'cover.jpg').write('123', ensure=True)
+        meta = {'content': {'html': {}},
+                'cover': 'img/cover.jpg',
+                'thumb': 'thumb.jpg'}
+        base_archive._BaseArchive__add_auto_fields(meta, 'content',
+                                                   str(root))
+        assert meta['path'] == 'content'
+        assert meta['size'] == 8
+        assert meta['cover'] == 'img/cover.jpg'
+        assert 'thumb' not in meta
+        # the files are not looked up through FSAL, which only knows its own
+        # base directory
+        assert not base_archive.fsal.get_fso.called
+        assert not base_archive.fsal.exists.called
+
     @mock.patch.object(mod.BaseArchive, 'add_meta_to_db')
     @mock.patch.object(mod.metadata, 'get_meta')
     def test___add_to_archive_meta_error(self, get_meta, add_meta_to_db,
@@ -164,7 +204,8 @@ class TestBaseArchive(object):
         assert not base_archive._BaseArchive__add_to_archive(relpath)
         get_meta.assert_called_once_with('contentdir',
                                          relpath,
-                                         ['metafile.ext'])
+                                         ['metafile.ext'],
+                                         sidecars=None)
         assert not add_meta_to_db.called
 
     @mock.patch.object(mod.BaseArchive, '_BaseArchive__add_to_archive')
@@ -196,14 +237,161 @@ class TestBaseArchive(object):
         __remove_from_archive.assert_has_calls([mock.call('some_id'),
                                                 mock.call('other_id')])
 
+    @mock.patch.object(mod, 'get_throttle')
+    @mock.patch.object(mod.BaseArchive, 'remove_meta_from_db')
+    def test___remove_from_archive_throttled(self, remove_meta_from_db,
+                                             get_throttle, base_archive):
+        assert base_archive.throttle is None
+        # zero rates, as read from the configuration, mean no throttling
+        base_archive.config['ingest_rate'] = '0'
+        base_archive.config['ingest_io_rate'] = 0
+        assert base_archive.throttle is None
+        del base_archive.config['ingest_io_rate']
+        base_archive.config['ingest_rate'] = 10
+        base_archive._BaseArchive__remove_from_archive('some_id')
+        get_throttle.assert_called_with(10, None)
+        throttle = get_throttle.return_value
+        throttle.item.assert_called_once_with()
+        # removal of the files through FSAL
+        throttle.io_op.assert_called_once_with(1)
+
     @mock.patch.object(mod.BaseArchive, '_BaseArchive__add_to_archive')
-    @mock.patch.object(mod.BaseArchive, 'find_content_dirs')
-    def test_reload_content(self, find_content_dirs, __add_to_archive,
+    @mock.patch.object(mod.BaseArchive, 'scan_content_roots')
+    def test_reload_content(self, scan_content_roots, __add_to_archive,
                             base_archive):
-        find_content_dirs.return_value = ['contentdir/contentid',
-                                          'contentdir/otherid']
+        scan_content_roots.return_value = [('contentdir', 'contentid'),
+                                           ('contentdir', 'otherid')]
         __add_to_archive.return_value = 1
         assert base_archive.reload_content() == 2
-        calls = [mock.call('contentdir/contentid'),
-                 mock.call('contentdir/otherid')]
+        scan_content_roots.assert_called_once_with(None)
+        calls = [mock.call('contentid', 'contentdir'),
+                 mock.call('otherid', 'contentdir')]
         __add_to_archive.assert_has_calls(calls)
+
+    @mock.patch.object(mod.BaseArchive, '_BaseArchive__add_to_archive')
+    @mock.patch.object(mod.BaseArchive, 'scan_content_roots')
+    def test_reload_content_progress(self, scan_content_roots,
+                                     __add_to_archive, base_archive):
+        # content is consumed as it is found
+        scan_content_roots.return_value = iter([('contentdir', 'a'),
+                                                ('contentdir', 'b'),
+                                                ('contentdir', 'c')])
+        __add_to_archive.side_effect = [True, False, True]
+        callback = mock.Mock()
+        progress = mod.Progress(callback=callback, interval=0)
+        assert base_archive.reload_content(progress=progress) == 2
+        assert progress.processed == 3
+        assert progress.added == 2
+        assert progress.failed == 1
+        assert list(progress.stages) == ['scan', 'add']
+        assert callback.call_count == 3
+
+    @mock.patch.object(mod.BaseArchive, '_reload_content')
+    def test_attach_root(self, _reload_content, base_archive):
+        assert base_archive.attach_root('usb') == _reload_content.return_value
+        # journaled apart from full reloads
+        _reload_content.assert_called_once_with('attach', ['usb'], None)
+
+    def test_content_roots(self, base_archive):
+        assert base_archive.content_roots == ['contentdir']
+        base_archive.config['contentdir'] = ('internal', 'usb')
+        assert base_archive.content_roots == ['internal', 'usb']
+
+    @mock.patch.object(mod.os.path, 'exists')
+    def test_get_content_root(self, exists, base_archive):
+        assert base_archive.get_content_root('id') == 'contentdir'
+        assert not exists.called
+        base_archive.config['contentdir'] = ['internal', 'usb']
+        exists.side_effect = lambda path: path == 'usb/id'
+        assert base_archive.get_content_root('id') == 'usb'
+        exists.side_effect = None
+        exists.return_value = False
+        assert base_archive.get_content_root('id') == 'internal'
+
+    def test_scan_content_roots(self, base_archive, tmpdir):
+        for (root, relpath) in [('internal', 'one'),
+                                ('internal', 'two/nested'),
+                                ('usb', 'three')]:
+            tmpdir.join(root, relpath, 'metafile.ext').ensure()
+        tmpdir.join('usb', 'other', 'file.txt').ensure()
+        internal = str(tmpdir.join('internal'))
+        usb = str(tmpdir.join('usb'))
+        base_archive.config['contentdir'] = [internal, usb]
+        devices = mod.collections.OrderedDict([(1, [internal]), (2, [usb])])
+        with mock.patch.object(mod, 'group_by_device') as group_by_device:
+            # one worker per device
+            group_by_device.return_value = devices
+            found = sorted(base_archive.scan_content_roots())
+        assert found == [(internal, 'one'),
+                         (internal, os.path.join('two', 'nested')),
+                         (usb, 'three')]
+        found = list(base_archive.scan_content_roots([usb]))
+        assert found == [(usb, 'three')]
+
+    @mock.patch.object(mod, 'SCAN_POLL_INTERVAL', 0.01)
+    @mock.patch.object(mod, 'SCAN_BUFFER', 1)
+    @mock.patch.object(mod, 'group_by_device')
+    def test_scan_content_roots_stopped(self, group_by_device, base_archive):
+        finished = []
+
+        def scan_content_root(root, after=None):
+            try:
+                for i in range(100):
+                    yield str(i)
+            finally:
+                finished.append(root)
+
+        group_by_device.return_value = {1: ['internal'], 2: ['usb']}
+        with mock.patch.object(base_archive, 'scan_content_root',
+                               side_effect=scan_content_root):
+            found = base_archive.scan_content_roots()
+            next(found)
+            found.close()
+            # workers blocked on the full buffer give up scanning
+            deadline = time.time() + 5
+            while len(finished) < 2 and time.time() < deadline:
+                time.sleep(0.01)
+        assert sorted(finished) == ['internal', 'usb']
+
+    def test_scan_content_root_after(self, base_archive, tmpdir):
+        for relpath in ('a', 'b/x', 'b/y', 'c'):
+            tmpdir.join(relpath, 'metafile.ext').ensure()
+        root = str(tmpdir)
+        found = list(base_archive.scan_content_root(root))
+        assert found == ['a', os.path.join('b', 'x'), os.path.join('b', 'y'),
+                         'c']
+        after = os.path.join('b', 'x')
+        found = list(base_archive.scan_content_root(root, after))
+        assert found == [os.path.join('b', 'y'), 'c']
+
+    @mock.patch.object(mod.BaseArchive, '_BaseArchive__add_to_archive')
+    def test_reload_content_resumed(self, __add_to_archive, base_archive,
+                                    tmpdir):
+        root = tmpdir.join('root')
+        for relpath in ('a', 'b', 'c'):
+            root.join(relpath, 'metafile.ext').ensure()
+        root = str(root)
+        base_archive.config.update(contentdir=root,
+                                   checkpoint=str(tmpdir.join('journal')),
+                                   checkpoint_interval=1)
+        __add_to_archive.side_effect = [True, True, RuntimeError()]
+        with pytest.raises(RuntimeError):
+            base_archive.reload_content()
+        assert base_archive.is_resumable('reload')
+        assert not base_archive.is_resumable('refill')
+
+        __add_to_archive.side_effect = None
+        __add_to_archive.return_value = True
+        progress = mod.Progress()
+        assert base_archive.reload_content(progress=progress) == 3
+        __add_to_archive.assert_called_with('c', root)
+        assert __add_to_archive.call_count == 4
+        assert not base_archive.is_resumable('reload')
+        assert progress.skipped == 2
+        assert progress.processed == 1
+
+    def test_group_by_device(self, tmpdir):
+        root = str(tmpdir)
+        missing = str(tmpdir.join('missing'))
+        assert list(mod.group_by_device([root, missing, root]).values()) == [
+            [root, root]]
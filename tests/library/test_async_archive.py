@@ -0,0 +1,68 @@
+import mock
+import pytest
+
+asyncio = pytest.importorskip('asyncio')
+
+import librarian_content.library.async_archive as mod  # NOQA
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def backend():
+    return mock.Mock()
+
+
+@pytest.fixture
+def archive(loop, backend):
+    archive = mod.AsyncArchive(lambda: backend, max_workers=2, loop=loop)
+    yield archive
+    archive.close()
+
+
+def test_call(loop, archive, backend):
+    backend.add_view.return_value = 1
+    assert loop.run_until_complete(archive.add_view('path')) == 1
+    backend.add_view.assert_called_once_with('path')
+
+
+def test_coalesced_calls(loop, archive, backend):
+    backend.get_single.side_effect = lambda path: {'path': path}
+    futures = [archive.get_single('one'),
+               archive.get_single('one'),
+               archive.get_single('two')]
+    results = loop.run_until_complete(asyncio.gather(*futures))
+    assert results == [{'path': 'one'}, {'path': 'one'}, {'path': 'two'}]
+    assert backend.get_single.call_count == 2
+    assert archive.pending == {}
+
+
+def test_unhashable_arguments(loop, archive, backend):
+    backend.get_multiple.return_value = []
+    future = archive.get_multiple(['one', 'two'])
+    assert loop.run_until_complete(future) == []
+
+
+def test_iter_content(loop, archive, backend):
+    backend.iter_content.return_value = iter(range(5))
+    iterator = archive.iter_content(lang='en', batch_size=2)
+    items = []
+    while True:
+        try:
+            items.append(loop.run_until_complete(iterator.__anext__()))
+        except StopAsyncIteration:  # NOQA
+            break
+    assert items == [0, 1, 2, 3, 4]
+    backend.iter_content.assert_called_once_with(lang='en')
+
+
+def test_unknown_attribute(archive):
+    with pytest.raises(AttributeError):
+        archive.missing
+    with pytest.raises(AttributeError):
+        archive._call_private
@@ -0,0 +1,114 @@
+import mock
+
+import librarian_content.library.cache as mod
+
+
+def test_get_missing():
+    cache = mod.LRUCache(2)
+    assert cache.get('key') is mod.MISSING
+    assert cache.get('key', None) is None
+    assert cache.stats()['misses'] == 2
+
+
+def test_evicts_least_recently_used():
+    cache = mod.LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is mod.MISSING
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_ttl():
+    clock = mock.Mock(return_value=100)
+    cache = mod.LRUCache(2, ttl=10, clock=clock)
+    cache.set('a', 1)
+    clock.return_value = 110
+    assert cache.get('a') == 1
+    clock.return_value = 111
+    assert cache.get('a') is mod.MISSING
+
+
+def test_zero_size_disables_cache():
+    cache = mod.LRUCache(0)
+    cache.set('a', 1)
+    assert cache.get('a') is mod.MISSING
+
+
+def test_invalidate():
+    cache = mod.LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.invalidate('a', None)
+    assert cache.get('a') is mod.MISSING
+    assert cache.get('b') == 2
+    cache.clear()
+    assert cache.get('b') is mod.MISSING
+
+
+def test_set_skipped_after_invalidation():
+    cache = mod.LRUCache(2)
+    generation = cache.generation
+    cache.invalidate('a')
+    cache.set('a', 'stale', generation)
+    assert cache.get('a') is mod.MISSING
+    cache.set('a', 'fresh', cache.generation)
+    assert cache.get('a') == 'fresh'
+
+
+def test_stats():
+    cache = mod.LRUCache(2, ttl=5)
+    cache.set('a', 1)
+    cache.get('a')
+    cache.get('a')
+    cache.get('b')
+    stats = cache.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+    assert stats['size'] == 1
+    assert stats['capacity'] == 2
+    assert stats['ttl'] == 5
+    assert round(stats['hit_ratio'], 2) == 0.67
+
+
+def test_result_cache():
+    cache = mod.ResultCache(mod.LRUCache(10))
+    loader = mock.Mock(return_value=[])
+    assert cache.get(('content', 'en'), loader) == []
+    assert cache.get(('content', 'en'), loader) == []
+    loader.assert_called_once_with()
+    cache.get(('content', 'fr'), loader)
+    assert loader.call_count == 2
+
+
+def test_result_cache_bump():
+    cache = mod.ResultCache(mod.LRUCache(10))
+    generation = cache.generation
+    loader = mock.Mock(return_value=1)
+    cache.get(('count',), loader)
+    cache.bump()
+    assert cache.generation != generation
+    cache.get(('count',), loader)
+    assert loader.call_count == 2
+
+
+def test_result_cache_backend_without_generation():
+    backend = mock.Mock(spec=['get', 'set'])
+    backend.get.return_value = None
+    cache = mod.ResultCache(backend)
+    loader = mock.Mock(return_value=3)
+    assert cache.get(('count',), loader) == 3
+    assert backend.set.call_args[0][1] == (3,)
+
+
+def test_result_cache_generation_not_counted():
+    backend = mod.LRUCache(10)
+    cache = mod.ResultCache(backend)
+    loader = mock.Mock(return_value=1)
+    cache.get(('count',), loader)
+    cache.get(('count',), loader)
+    stats = backend.stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
@@ -0,0 +1,70 @@
+import mock
+
+import librarian_content.library.checkpoint as mod
+
+
+def test_load_missing(tmpdir):
+    checkpoint = mod.Checkpoint(str(tmpdir.join('missing')))
+    assert checkpoint.load() is None
+    assert not checkpoint.is_pending('reload', ['root'])
+
+
+def test_save_and_resume(tmpdir):
+    clock = mock.Mock(return_value=100)
+    checkpoint = mod.Checkpoint(str(tmpdir.join('journal')), clock=clock)
+    state = checkpoint.start('reload', ['root'])
+    checkpoint.advance(state, 'root', 'one', True)
+    checkpoint.advance(state, 'root', 'two', False)
+    clock.return_value = 104
+    checkpoint.save(state)
+    assert checkpoint.is_pending('reload', ['root'])
+    assert not checkpoint.is_pending('refill', ['root'])
+    assert not checkpoint.is_pending('reload', ['root', 'usb'])
+
+    # downtime between the interruption and the resume is not counted
+    clock.return_value = 200
+    state = checkpoint.start('reload', ['root'])
+    assert state['resumed'] == 1
+    assert state['positions'] == {'root': 'two'}
+    assert state['processed'] == 2
+    assert state['added'] == 1
+    clock.return_value = 202
+    checkpoint.advance(state, 'root', 'three', True)
+    checkpoint.finish(state)
+    assert mod.get_rate(checkpoint.load()) == 0.5
+    assert not checkpoint.is_pending('reload', ['root'])
+
+
+def test_start_without_resume(tmpdir):
+    checkpoint = mod.Checkpoint(str(tmpdir.join('journal')))
+    state = checkpoint.start('reload', ['root'])
+    checkpoint.advance(state, 'root', 'one', True)
+    checkpoint.save(state)
+    state = checkpoint.start('reload', ['root'], resume=False)
+    assert state['positions'] == {}
+    assert state['processed'] == 0
+
+
+def test_operations_saved_separately(tmpdir):
+    clock = mock.Mock(return_value=100)
+    checkpoint = mod.Checkpoint(str(tmpdir.join('journal')), clock=clock)
+    reload_state = checkpoint.start('reload', ['root', 'usb'])
+    checkpoint.advance(reload_state, 'root', 'one', True)
+    checkpoint.save(reload_state)
+    clock.return_value = 110
+    attach_state = checkpoint.start('attach', ['usb'])
+    checkpoint.advance(attach_state, 'usb', 'two', True)
+    checkpoint.finish(attach_state)
+    # the attached root does not replace the pending reload
+    assert checkpoint.is_pending('reload', ['root', 'usb'])
+    assert checkpoint.load('reload')['positions'] == {'root': 'one'}
+    assert checkpoint.load()['operation'] == 'attach'
+
+
+def test_load_single_state_journal(tmpdir):
+    path = tmpdir.join('journal')
+    path.write('{"operation": "reload", "roots": ["root"], "tick": 1, '
+               '"finished": false}')
+    checkpoint = mod.Checkpoint(str(path))
+    assert checkpoint.is_pending('reload', ['root'])
+    assert checkpoint.load()['operation'] == 'reload'
@@ -0,0 +1,54 @@
+import gzip
+import pickle
+
+import pytest
+
+import librarian_content.library.export as mod
+
+
+def test_export_roundtrip(tmpdir):
+    path = str(tmpdir.join('export'))
+    tables = [('content', ('path', 'title'), iter([('a', 'A'), ('b', 'B')])),
+              ('empty', ('path',), iter([])),
+              ('tags', ('path', 'name'), [('a', 'red')])]
+    counts = mod.write_export(path, tables)
+    assert counts == {'content': 2, 'empty': 0, 'tags': 1}
+    assert not tmpdir.join('export.tmp').exists()
+    assert list(mod.read_export(path)) == [
+        ('content', ('path', 'title'), [('a', 'A'), ('b', 'B')]),
+        ('tags', ('path', 'name'), [('a', 'red')])]
+
+
+def test_export_chunks(tmpdir):
+    path = str(tmpdir.join('export'))
+    rows = [(str(i),) for i in range(mod.CHUNK_SIZE + 1)]
+    mod.write_export(path, [('content', ('path',), rows)])
+    chunks = list(mod.read_export(path))
+    assert [len(chunk[2]) for chunk in chunks] == [mod.CHUNK_SIZE, 1]
+
+
+def test_read_export_incomplete(tmpdir):
+    path = str(tmpdir.join('export'))
+    with gzip.open(path, 'wb') as f:
+        pickle.dump((mod.EXPORT_FORMAT, mod.EXPORT_VERSION, 0), f)
+        pickle.dump(('table', 'content', ('path',)), f)
+        pickle.dump(('rows', [('a',)]), f)
+    reader = mod.read_export(path)
+    assert next(reader) == ('content', ('path',), [('a',)])
+    with pytest.raises(mod.ExportError):
+        next(reader)
+
+
+def test_read_export_version(tmpdir):
+    path = str(tmpdir.join('export'))
+    with gzip.open(path, 'wb') as f:
+        pickle.dump((mod.EXPORT_FORMAT, mod.EXPORT_VERSION + 1, 0), f)
+    with pytest.raises(mod.ExportError):
+        list(mod.read_export(path))
+
+
+def test_read_export_not_export(tmpdir):
+    path = tmpdir.join('export')
+    path.write('plain text')
+    with pytest.raises(mod.ExportError):
+        list(mod.read_export(str(path)))
@@ -187,6 +187,28 @@ def test_get_meta_cannot_process(os, json, process_meta, open_fn):
         pytest.fail('should have raised')
 
 
+@mock.patch.object(mod, 'process_meta')
+def test_get_meta_sidecars(process_meta, tmpdir):
+    tmpdir.join('relpath', '.contentinfo').write('{"title": "a"}',
+                                                 ensure=True)
+    process_meta.side_effect = lambda meta: dict(meta, processed=True)
+    sidecars = mock.Mock()
+    sidecars.load.return_value = None
+    meta = mod.get_meta(str(tmpdir), 'relpath', ['.contentinfo'],
+                        sidecars=sidecars)
+    assert meta == {'title': 'a', 'processed': True}
+    key = sidecars.get_key.return_value
+    sidecars.save.assert_called_once_with(str(tmpdir), 'relpath', key,
+                                          meta)
+
+    # processing is skipped when the sidecar matches
+    sidecars.load.return_value = {'title': 'cached'}
+    meta = mod.get_meta(str(tmpdir), 'relpath', ['.contentinfo'],
+                        sidecars=sidecars)
+    assert meta == {'title': 'cached'}
+    assert process_meta.call_count == 1
+
+
 @mock.patch.object(mod, 'json', autospec=True)
 @mock.patch.object(mod, 'os', autospec=True)
 def test_meta_class_init(os, json):
@@ -196,8 +218,11 @@ def test_meta_class_init(os, json):
     meta = mod.Meta(data)
     assert meta.meta == data
     assert meta.meta is not data
-    json.loads.assert_called_once_with('tag json data')
+    # tags are decoded lazily, on first access
+    assert not json.loads.called
+    assert meta.tags == json.loads.return_value
     assert meta.tags == json.loads.return_value
+    json.loads.assert_called_once_with('tag json data')
 
 
 @mock.patch.object(mod, 'os', autospec=True)
@@ -0,0 +1,53 @@
+import threading
+
+import mock
+import pytest
+
+import librarian_content.library.pool as mod
+
+
+def test_acquire_creates_lazily():
+    factory = mock.Mock(side_effect=['a', 'b'])
+    pool = mod.ConnectionPool(factory, size=2)
+    assert pool.stats()['created'] == 0
+    with pool.connection() as db:
+        assert db == 'a'
+        assert pool.stats()['in_use'] == 1
+    # idle connections are reused
+    with pool.connection() as db:
+        assert db == 'a'
+    assert factory.call_count == 1
+    stats = pool.stats()
+    assert stats['idle'] == 1
+    assert stats['acquired'] == 2
+    assert stats['waits'] == 0
+
+
+def test_acquire_timeout():
+    pool = mod.ConnectionPool(mock.Mock(), size=1, timeout=0.01)
+    pool.acquire()
+    with pytest.raises(mod.PoolTimeout):
+        pool.acquire()
+    stats = pool.stats()
+    assert stats['timeouts'] == 1
+    assert stats['waits'] == 0
+
+
+def test_acquire_waits_for_release():
+    pool = mod.ConnectionPool(mock.Mock(return_value='a'), size=1)
+    db = pool.acquire()
+    timer = threading.Timer(0.01, pool.release, args=(db,))
+    timer.start()
+    assert pool.acquire() == 'a'
+    timer.join()
+    stats = pool.stats()
+    assert stats['waits'] == 1
+    assert stats['max_wait'] > 0
+
+
+def test_failed_factory_frees_slot():
+    factory = mock.Mock(side_effect=[RuntimeError(), 'a'])
+    pool = mod.ConnectionPool(factory, size=1)
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+    assert pool.acquire() == 'a'
@@ -0,0 +1,80 @@
+import mock
+
+import librarian_content.library.progress as mod
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_update_counts():
+    progress = mod.Progress()
+    progress.update(True)
+    progress.update(False)
+    progress.update(1)
+    assert progress.processed == 3
+    assert progress.added == 2
+    assert progress.failed == 1
+
+
+def test_update_reports_periodically():
+    clock = Clock()
+    callback = mock.Mock()
+    progress = mod.Progress(callback=callback, interval=5, clock=clock)
+    progress.update(True)
+    assert not callback.called
+    clock.now = 5
+    progress.update(True)
+    callback.assert_called_once_with(progress)
+    progress.update(True)
+    assert callback.call_count == 1
+
+
+def test_rate_and_eta():
+    clock = Clock()
+    progress = mod.Progress(total=30, clock=clock)
+    assert progress.rate == 0
+    assert progress.eta is None
+    clock.now = 10
+    for _ in range(10):
+        progress.update(True)
+    assert progress.rate == 1.0
+    assert progress.eta == 20
+    progress.skipped = 15
+    assert progress.eta == 5
+    progress.skipped = 30
+    assert progress.eta == 0
+
+
+def test_eta_unknown_total():
+    clock = Clock()
+    progress = mod.Progress(clock=clock)
+    clock.now = 1
+    progress.update(True)
+    assert progress.eta is None
+
+
+def test_stages():
+    clock = Clock()
+    progress = mod.Progress(clock=clock)
+
+    def items():
+        clock.now += 2
+        yield 1
+        clock.now += 2
+        yield 2
+        clock.now += 1
+
+    for _ in progress.timed(items(), 'scan'):
+        with progress.stage('add'):
+            clock.now += 3
+    with progress.stage('counts'):
+        clock.now += 1
+    assert list(progress.stages.items()) == [('scan', 5.0),
+                                             ('add', 6.0),
+                                             ('counts', 1.0)]
@@ -0,0 +1,79 @@
+import json
+import pickle
+
+import pytest
+
+import librarian_content.library.records as mod
+
+
+def test_record_class_is_reused():
+    cls = mod.record_class('content', ('path', 'title'))
+    assert mod.record_class('content', ('path', 'title')) is cls
+    assert mod.record_class('content', ('path',)) is not cls
+    assert cls.__slots__ == ('path', 'title')
+
+
+def test_record_class_reserved_names():
+    with pytest.raises(ValueError):
+        mod.record_class('content', ('path', 'keys'))
+
+
+def test_to_record():
+    row = {'path': 'a', 'title': 'b'}
+    record = mod.to_record(row, 'content', extra_fields=('html',))
+    assert record == row
+    assert record.path == 'a'
+    assert record['title'] == 'b'
+    assert 'html' not in record
+    assert not hasattr(record, '__dict__')
+
+
+def test_record_set_and_delete_keys():
+    record = mod.to_record({'path': 'a'}, 'content', extra_fields=('html',))
+    record['html'] = {'main': 'index.html'}
+    record['replaces_title'] = 'old'
+    assert record.html == {'main': 'index.html'}
+    assert record.replaces_title == 'old'
+    assert sorted(record.keys()) == ['html', 'path', 'replaces_title']
+    del record['html']
+    del record['replaces_title']
+    assert record.keys() == ['path']
+    with pytest.raises(KeyError):
+        del record['html']
+    with pytest.raises(AttributeError):
+        record.missing
+
+
+def test_record_get():
+    record = mod.to_record({'path': 'a'}, 'content')
+    assert record.get('path') == 'a'
+    assert record.get('missing', 1) == 1
+    with pytest.raises(KeyError):
+        record['missing']
+
+
+def test_record_pickle():
+    record = mod.to_record({'path': 'a', 'views': 2}, 'content')
+    record['extra'] = True
+    restored = pickle.loads(pickle.dumps(record))
+    assert type(restored) is type(record)
+    assert restored == {'path': 'a', 'views': 2, 'extra': True}
+
+
+def test_record_asdict():
+    record = mod.to_record({'path': 'a'}, 'content', extra_fields=('html',))
+    record['html'] = mod.to_record({'main': 'index.html'}, 'html')
+    record['generic'] = [mod.to_record({'path': 'a'}, 'generic')]
+    data = record._asdict()
+    assert type(data) is dict
+    assert type(data['html']) is dict
+    assert type(data['generic'][0]) is dict
+    assert json.loads(json.dumps(data)) == {'path': 'a',
+                                            'html': {'main': 'index.html'},
+                                            'generic': [{'path': 'a'}]}
+
+
+def test_record_update():
+    record = mod.to_record({'path': 'a'}, 'content')
+    record.update({'path': 'b'}, title='c')
+    assert record == {'path': 'b', 'title': 'c'}
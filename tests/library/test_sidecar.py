@@ -0,0 +1,80 @@
+import datetime
+import os
+import threading
+
+import librarian_content.library.sidecar as mod
+
+
+def make_key(tmpdir, content='{}'):
+    meta_file = tmpdir.join('content', '.contentinfo')
+    meta_file.write(content, ensure=True)
+    return mod.SidecarCache.get_key(str(meta_file))
+
+
+def test_save_and_load(tmpdir):
+    sidecars = mod.SidecarCache(str(tmpdir.join('cache')))
+    root = str(tmpdir)
+    key = make_key(tmpdir)
+    assert sidecars.load(root, 'content', key) is None
+    assert sidecars.save(root, 'content', key, {'title': 'a'})
+    path = sidecars.get_path(root, 'content')
+    assert path.startswith(str(tmpdir.join('cache')))
+    assert os.path.exists(path)
+    assert not tmpdir.join('content', mod.SIDECAR_NAME).exists()
+    assert sidecars.load(root, 'content', key) == {'title': 'a'}
+
+
+def test_roots_kept_apart(tmpdir):
+    sidecars = mod.SidecarCache(str(tmpdir.join('cache')))
+    assert sidecars.save('/mnt/internal', 'content', ['key'], {'title': 'a'})
+    assert sidecars.save('/mnt/usb', 'content', ['key'], {'title': 'b'})
+    assert sidecars.load('/mnt/internal', 'content', ['key']) == {
+        'title': 'a'}
+    assert sidecars.load('/mnt/usb', 'content', ['key']) == {'title': 'b'}
+
+
+def test_save_and_load_datetimes(tmpdir):
+    sidecars = mod.SidecarCache(str(tmpdir))
+    naive = datetime.datetime(2015, 5, 1, 12, 0, 0, 5)
+    aware = datetime.datetime(2015, 5, 1, 12, 0, 0, tzinfo=mod.UTC())
+    meta = {'timestamp': naive, 'broadcast': [aware]}
+    relpath = os.path.join('a', 'b')
+    assert sidecars.save('root', relpath, ['key'], meta)
+    loaded = sidecars.load('root', relpath, ['key'])
+    assert loaded == meta
+    assert loaded['timestamp'].tzinfo is None
+    assert loaded['broadcast'][0].utcoffset() == datetime.timedelta(0)
+
+
+def test_load_stale(tmpdir):
+    sidecars = mod.SidecarCache(str(tmpdir.join('cache')))
+    root = str(tmpdir)
+    key = make_key(tmpdir)
+    sidecars.save(root, 'content', key, {'title': 'a'})
+    new_key = make_key(tmpdir, '{"title": "b"}')
+    assert new_key != key
+    assert sidecars.load(root, 'content', new_key) is None
+
+
+def test_load_other_version(tmpdir, monkeypatch):
+    sidecars = mod.SidecarCache(str(tmpdir))
+    sidecars.save('root', 'content', ['key'], {'title': 'a'})
+    monkeypatch.setattr(mod, 'SIDECAR_VERSION', mod.SIDECAR_VERSION + 1)
+    assert sidecars.load('root', 'content', ['key']) is None
+
+
+def test_save_fails_silently(tmpdir):
+    tmpdir.join('file').write('')
+    sidecars = mod.SidecarCache(str(tmpdir.join('file')))
+    assert not sidecars.save('root', 'content', ['key'], {})
+    assert not mod.SidecarCache(str(tmpdir)).save(
+        'root', 'content', ['key'], {'value': threading.Lock()})
+
+
+def test_load_corrupt(tmpdir):
+    sidecars = mod.SidecarCache(str(tmpdir))
+    path = sidecars.get_path('root', 'content')
+    os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write('garbage')
+    assert sidecars.load('root', 'content', ['key']) is None
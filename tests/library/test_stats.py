@@ -0,0 +1,35 @@
+import mock
+
+import librarian_content.library.stats as mod
+
+
+def test_query_log_keeps_slowest():
+    log = mod.QueryLog(size=2, clock=lambda: 0)
+    for (name, duration) in [('a', 0.1), ('b', 0.3), ('c', 0.2), ('d', 0.0)]:
+        log.record(name, (), duration)
+    assert [query['name'] for query in log.slowest()] == ['b', 'c']
+    assert log.count == 4
+
+
+def test_query_log_expires():
+    clock = mock.Mock(return_value=0)
+    log = mod.QueryLog(window=10, clock=clock)
+    log.record('a', (), 1.0)
+    clock.return_value = 5
+    log.record('b', (), 0.5)
+    clock.return_value = 11
+    assert [query['name'] for query in log.slowest()] == ['b']
+
+
+def test_timed_query():
+    class Archive(object):
+        query_log = mod.QueryLog()
+
+        @mod.timed_query
+        def _get_count(self, terms, lang=None):
+            return 3
+
+    assert Archive()._get_count('x', lang='en') == 3
+    (query,) = Archive.query_log.slowest()
+    assert query['name'] == 'get_count'
+    assert query['params'] == ('x', ('lang', 'en'))
@@ -0,0 +1,59 @@
+import librarian_content.library.suggest as mod
+
+
+CONTENT = [
+    ('a', 'en', ['Star Wars', 'Outernet']),
+    ('b', 'en', ['War and  Peace', 'Outernet']),
+    ('c', 'fr', ['La Guerre', 'Wikipedia']),
+]
+
+
+def make_index():
+    index = mod.PrefixIndex()
+    index.suggest('x', lambda: CONTENT)
+    return index
+
+
+def test_get_keys():
+    assert mod.get_keys(u'  Star   Wars ') == [u'star wars', u'wars']
+
+
+def test_suggest_word_prefixes():
+    index = make_index()
+    assert index.suggest('war', None) == ['War and  Peace', 'Star Wars']
+    assert index.suggest('WAR  AND', None) == ['War and  Peace']
+    assert index.suggest('', None) == []
+
+
+def test_suggest_shared_texts():
+    index = make_index()
+    assert index.suggest('out', None) == ['Outernet']
+    index.remove('a')
+    assert index.suggest('out', None) == ['Outernet']
+    index.remove('b')
+    assert index.suggest('out', None) == []
+
+
+def test_suggest_lang_and_limit():
+    index = make_index()
+    assert index.suggest('w', None, lang='fr') == ['Wikipedia']
+    assert index.suggest('w', None, limit=1) == ['War and  Peace']
+
+
+def test_add_updates_content():
+    index = make_index()
+    index.add('a', 'fr', ['Star Trek'])
+    assert index.suggest('star', None) == ['Star Trek']
+    assert index.suggest('star', None, lang='en') == []
+    assert index.suggest('star', None, lang='fr') == ['Star Trek']
+
+
+def test_built_lazily():
+    index = mod.PrefixIndex()
+    # changes before the index is built are left to the loader
+    index.add('a', 'en', ['Star Wars'])
+    assert index.stats()['built'] is False
+    assert index.suggest('star', lambda: []) == []
+    index.reset()
+    assert index.suggest('star', lambda: CONTENT) == ['Star Wars']
+    assert index.stats()['content'] == 3
@@ -0,0 +1,104 @@
+import mock
+
+import librarian_content.library.throttle as mod
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket_burst():
+    clock = Clock()
+    bucket = mod.TokenBucket(2, clock=clock, sleep=clock.sleep)
+    assert bucket.consume() == 0
+    assert bucket.consume() == 0
+    assert bucket.consume() == 0.5
+    assert bucket.consume() == 0.5
+    assert clock.now == 1.0
+    assert bucket.wait_time == 1.0
+
+
+def test_token_bucket_refill():
+    clock = Clock()
+    bucket = mod.TokenBucket(1, burst=2, clock=clock, sleep=clock.sleep)
+    bucket.consume(2)
+    clock.now += 10
+    # refilled up to the burst size only
+    assert bucket.consume(2) == 0
+    assert bucket.consume() == 1
+
+
+def test_foreground_reading():
+    foreground = mod.Foreground()
+    with foreground.reading():
+        with foreground.reading():
+            assert foreground.is_busy()
+        assert foreground.is_busy()
+    assert not foreground.is_busy()
+
+
+def test_throttle_unlimited():
+    clock = Clock()
+    throttle = mod.IngestThrottle(foreground=mod.Foreground(), clock=clock,
+                                  sleep=clock.sleep)
+    for _ in range(100):
+        throttle.item()
+        throttle.io_op(3)
+    assert clock.now == 0
+    stats = throttle.stats()
+    assert stats['items'] == 100
+    assert stats['io'] == 300
+    assert stats['yields'] == 0
+
+
+def test_throttle_rates():
+    clock = Clock()
+    throttle = mod.IngestThrottle(rate=5, io_rate=10,
+                                  foreground=mod.Foreground(), clock=clock,
+                                  sleep=clock.sleep)
+    for _ in range(10):
+        throttle.item()
+    assert clock.now == 1.0
+    for _ in range(30):
+        throttle.io_op()
+    assert clock.now == 3.0
+    stats = throttle.stats()
+    assert stats['item_wait'] == 1.0
+    assert stats['io_wait'] == 2.0
+
+
+def test_throttle_yields_to_foreground():
+    clock = Clock()
+    foreground = mock.Mock()
+    foreground.is_busy.side_effect = [True, True, False]
+    throttle = mod.IngestThrottle(foreground=foreground, clock=clock,
+                                  sleep=clock.sleep)
+    throttle.item()
+    assert clock.now == 2 * mod.YIELD_STEP
+    stats = throttle.stats()
+    assert stats['yields'] == 1
+    assert stats['yield_time'] == clock.now
+
+
+def test_throttle_yield_limited():
+    clock = Clock()
+    foreground = mock.Mock()
+    foreground.is_busy.return_value = True
+    throttle = mod.IngestThrottle(max_yield=0.5, foreground=foreground,
+                                  clock=clock, sleep=clock.sleep)
+    throttle.item()
+    assert 0.5 <= clock.now < 0.5 + mod.YIELD_STEP
+
+
+def test_get_throttle_shared():
+    throttle = mod.get_throttle(5, 0)
+    assert mod.get_throttle(5.0, None) is throttle
+    assert mod.get_throttle(6, 0) is not throttle
@@ -0,0 +1,96 @@
+import mock
+
+import librarian_content.scheduler as mod
+
+
+def make_scheduler(load=None, **kwargs):
+    kwargs.setdefault('random', lambda: 0.5)  # no jitter
+    return mod.ContentCheckScheduler(60, get_load=lambda: load, **kwargs)
+
+
+def test_next_delay_shortens_under_changes():
+    scheduler = make_scheduler()
+    delays = [scheduler.next_delay(10, 0) for _ in range(4)]
+    assert delays == [3, 1.5, 1, 1]
+    stats = scheduler.stats()
+    assert stats['reason'] == 'changes'
+    assert stats['events'] == 40
+    assert stats['busy_streak'] == 4
+
+
+def test_next_delay_backs_off_when_idle():
+    scheduler = make_scheduler()
+    delays = [scheduler.next_delay(0, 0) for _ in range(6)]
+    assert delays == [6, 12, 24, 48, 60, 60]
+    assert scheduler.stats()['reason'] == 'idle'
+    # changes reset the backoff
+    assert scheduler.next_delay(1, 0) == 3
+
+
+def test_next_delay_jitter():
+    scheduler = make_scheduler(random=lambda: 1.0)
+    assert scheduler.next_delay(0, 0) == 6 * (1 + mod.JITTER)
+    scheduler = make_scheduler(random=lambda: 0.0)
+    assert scheduler.next_delay(0, 0) == 6 * (1 - mod.JITTER)
+
+
+def test_next_delay_slow_check():
+    scheduler = make_scheduler()
+    assert scheduler.next_delay(5, 2) == 2 * mod.DUTY_RATIO
+    assert scheduler.stats()['reason'] == 'slow'
+    assert scheduler.next_delay(5, 100) == 60
+
+
+def test_should_defer_under_load():
+    scheduler = make_scheduler(load=3.0)
+    assert scheduler.should_defer() == 6
+    assert scheduler.should_defer() == 12
+    stats = scheduler.stats()
+    assert stats['reason'] == 'busy'
+    assert stats['deferred'] == 2
+    assert stats['load'] == 3.0
+
+
+def test_should_defer_limited():
+    scheduler = make_scheduler(load=3.0)
+    for _ in range(mod.MAX_DEFERRALS):
+        assert scheduler.should_defer() is not None
+    assert scheduler.should_defer() is None
+    assert scheduler.should_defer() is not None
+
+
+def test_should_defer_idle_device():
+    scheduler = make_scheduler(load=0.2)
+    assert scheduler.should_defer() is None
+    assert make_scheduler().should_defer() is None
+
+
+def test_should_defer_request_latency():
+    clock = mock.Mock(return_value=0)
+    scheduler = make_scheduler(clock=clock)
+    scheduler.record_latency(2.0)
+    scheduler.record_latency(0.0)
+    assert scheduler.get_latency() == 1.6
+    assert scheduler.should_defer() == 6
+    # old samples are not taken into account
+    clock.return_value = mod.LATENCY_WINDOW + 1
+    assert scheduler.get_latency() is None
+    assert scheduler.should_defer() is None
+
+
+def test_stats_lag():
+    clock = mock.Mock(return_value=10)
+    scheduler = make_scheduler(clock=clock)
+    assert scheduler.stats()['lag'] is None
+    scheduler.next_delay(0, 0)
+    clock.return_value = 15
+    assert scheduler.stats()['lag'] == 5
+
+
+def test_next_delay_long_streaks():
+    # the backoff exponent is limited, so delays do not overflow
+    scheduler = make_scheduler()
+    delays = [scheduler.next_delay(0, 0) for _ in range(2000)]
+    assert delays[-1] == 60
+    delays = [scheduler.next_delay(1, 0) for _ in range(2000)]
+    assert delays[-1] == 1